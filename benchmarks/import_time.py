@@ -0,0 +1,83 @@
+"""Import time benchmark.
+
+Imports each module in a fresh interpreter and checks that
+- the median import time stays under the target,
+- heavy optional dependencies are not loaded,
+- nothing is written to the output directory.
+
+    python benchmarks/import_time.py --target-ms 300
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+MODULES = [
+    "mechanical_design_lib.machine.machine",
+    "mechanical_design_lib.actuator.actuator",
+    "mechanical_design_lib.actuator.stepping_motor",
+    "mechanical_design_lib.utils.flowchart",
+]
+HEAVY_MODULES = ["sympy", "IPython", "graphviz"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r}
+          if name in sys.modules and not type(sys.modules[name]).__name__.startswith("_Lazy")]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure(module: str, repeat: int, env: dict) -> dict:
+    samples = []
+    loaded = set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            env=env, capture_output=True, text=True, check=True)
+        row = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(row["seconds"])
+        loaded.update(row["loaded"])
+    return {"median_ms": statistics.median(samples) * 1000, "loaded": sorted(loaded)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=300.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    source_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+    failed = False
+    with tempfile.TemporaryDirectory() as output_directory:
+        env = {**os.environ,
+               "PYTHONPATH": os.pathsep.join(
+                   filter(None, [str(source_path), os.environ.get("PYTHONPATH")])),
+               "MDL_DIR_OUTPUT": output_directory}
+
+        for module in MODULES:
+            result = measure(module, args.repeat, env)
+            ok = result["median_ms"] <= args.target_ms and not result["loaded"]
+            failed |= not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {module}: {result['median_ms']:.1f} ms"
+                  + (f", loaded {', '.join(result['loaded'])}" if result["loaded"] else ""))
+
+        created = [str(path.relative_to(output_directory))
+                   for path in pathlib.Path(output_directory).rglob("*")]
+        if created:
+            failed = True
+            print(f"FAIL files created on import: {', '.join(created)}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
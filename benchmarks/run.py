@@ -0,0 +1,199 @@
+"""Benchmarks of the hot paths with stored baselines.
+
+    python benchmarks/run.py                          # run and print
+    python benchmarks/run.py --save                   # store as the baseline
+    python benchmarks/run.py --compare --threshold 0.2
+
+--compare exits with status 1 when a benchmark is slower than the baseline
+by more than the threshold (0.2 = 20 %).
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+# ログと出力ファイルは計測の対象外
+os.environ.setdefault("MDL_LOG_LEVEL", "WARNING")
+os.environ.setdefault("MDL_DIR_OUTPUT", tempfile.mkdtemp(prefix="mdl_benchmark_"))
+# インストールせずに実行できるよう src を import パスに加える
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np  # noqa: E402
+
+from synthetic import SyntheticFlowchartGenerator  # noqa: E402
+
+
+BASELINE_PATH = pathlib.Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+ARRAY_SIZE = 1_000_000
+# the legacy compile deep-copies the graph recursively and only handles small graphs
+COMPILE_SIZES = [100]
+
+
+def get_cases(sizes: list[int]) -> dict:
+    """Benchmark name -> setup function returning the callable to time."""
+    import mechanical_design_lib.utils.flowchart as flowchart
+    from mechanical_design_lib.actuator.actuator import LinearActuator, LinearActuatorFactory
+    from mechanical_design_lib.actuator.stepping_motor import (
+        SteppingMotor, SteppingMotorActuatorUnit, StartingPulseRate)
+    from mechanical_design_lib.machine.analysis import CriticalPathAnalyzer
+    from mechanical_design_lib.power_transmission_component import (
+        rotary_power_transmission_component as rptc)
+
+    def stepper_unit():
+        gears = rptc.SingleStageGears([rptc.SpurGear(1, 20, 5), rptc.SpurGear(1, 60, 5)])
+        return SteppingMotorActuatorUnit([gears], rptc.Pulley(30), SteppingMotor(2, 8))
+
+    def formula():
+        starting_pulse_rate = StartingPulseRate()
+        symbols = starting_pulse_rate.Symbols()
+        symbols.fs.value = np.full(ARRAY_SIZE, 1000.0)
+        symbols.jo.value = np.full(ARRAY_SIZE, 1e-5)
+        symbols.jl.value = np.linspace(0, 1e-4, ARRAY_SIZE)
+        return lambda: starting_pulse_rate.calculate(symbols)
+
+    def lowered(size, function):
+        def setup():
+            root, _ = SyntheticFlowchartGenerator().generate(size)
+
+            def run():
+                flowchart.ElementsCompiler.clear_cache()
+                return function(root)
+            return run
+        return setup
+
+    def behavior(size, function):
+        def setup():
+            _, summary = SyntheticFlowchartGenerator().generate(size)
+
+            def run():
+                flowchart.ElementsCompiler.clear_cache()
+                return function(summary)
+            return run
+        return setup
+
+    def compiled(size):
+        def setup():
+            root, _ = SyntheticFlowchartGenerator().generate(size)
+            return lambda: flowchart.ElementsCompiler.compile(root)
+        return setup
+
+    distances = np.linspace(0, 600, ARRAY_SIZE)
+    cases = {
+        "actuator.move_detail": lambda: (
+            lambda: LinearActuator(600, 120, 2943, 2943).move_detail(600)),
+        "actuator.factory_solve": lambda: (
+            lambda: LinearActuatorFactory.create_linear_actuator(600, time=4)),
+        "actuator.calculate_profile[1e6]": lambda: (
+            lambda: LinearActuator(600, 120, 2943, 2943).calculate_profile(distances)),
+        "stepper.get_pulse[1e6]": lambda: (
+            lambda unit=stepper_unit(): unit.get_pulse(distances)),
+        "stepper.get_pps[1e6]": lambda: (
+            lambda unit=stepper_unit(): unit.get_pps(distances)),
+        "formula.calculate[1e6]": formula,
+    }
+    for size in sizes:
+        cases[f"flowchart.element_iterator[{size}]"] = lowered(
+            size, lambda root: sum(1 for _ in flowchart.ElementIterator(root)))
+        cases[f"flowchart.get_last_element[{size}]"] = lowered(
+            size, flowchart.get_last_element)
+        cases[f"flowchart.lower[{size}]"] = lowered(size, flowchart.ElementsCompiler.lower)
+        cases[f"flowchart.dot[{size}]"] = lowered(
+            size, lambda root: flowchart.Flowchart(root).get_source())
+        cases[f"machine.takt_time[{size}]"] = behavior(
+            size, lambda summary: summary.get_takt_time())
+        cases[f"analysis.critical_path[{size}]"] = behavior(size, CriticalPathAnalyzer.analyze)
+    for size in COMPILE_SIZES:
+        cases[f"flowchart.compile[{size}]"] = compiled(size)
+    return cases
+
+
+def measure(function, repeat: int, min_time: float) -> float:
+    # 最速の 1 回あたりの時間。短い処理は min_time に達するまでまとめて実行する
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    loops = max(1, int(min_time / first)) if first > 0 else 1000
+
+    best = first
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def get_environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    if baseline.get("environment") != get_environment():
+        print(f"note: baseline environment {baseline.get('environment')} "
+              f"differs from {get_environment()}")
+
+    regressed = False
+    print(f"{'benchmark':45} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, seconds in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:45} {'-':>12} {seconds:12.6f} {'new':>7}")
+            continue
+        ratio = seconds / base
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  SLOWER"
+            regressed = True
+        print(f"{name:45} {base:12.6f} {seconds:12.6f} {ratio:7.2f}{flag}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="run benchmarks containing this text")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="flowchart sizes in nodes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.2, help="s per repeat")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in get_cases(args.sizes).items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(setup(), args.repeat, args.min_time)
+        if not args.compare:
+            print(f"{name:45} {results[name]:12.6f} s", flush=True)
+
+    if args.save:
+        baseline = {"environment": get_environment(), "results": results}
+        if args.baseline.exists() and args.filter:
+            # 一部のみ実行した場合は既存の結果を更新する
+            stored = json.loads(args.baseline.read_text())
+            baseline["results"] = {**stored["results"], **results}
+        args.baseline.write_text(json.dumps(baseline, indent=1) + "\n")
+        print(f"saved {args.baseline}")
+
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Synthetic behavior flowcharts for benchmarks."""
+import random
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.machine.machine import (
+    BehaviorSummary, BehaviorDetailAction, BehaviorParallel, BehaviorLoop, BehaviorDecision)
+
+
+class SyntheticFlowchartGenerator:
+    # probability of each block type on the main flow
+    BLOCK_WEIGHTS = {"action": 0.7, "decision": 0.1, "parallel": 0.1, "loop": 0.1}
+
+    def __init__(self, seed: int = 0):
+        self._random = random.Random(seed)
+        self._count = 0
+
+    def _action(self) -> BehaviorDetailAction:
+        self._count += 1
+        return BehaviorDetailAction(f"Action {self._count}",
+                                    takt_time=round(self._random.uniform(0.1, 2.0), 2))
+
+    def _chain(self, length: int) -> BehaviorDetailAction:
+        first = last = self._action()
+        for _ in range(length - 1):
+            last = self._action().add_from(last)
+        return first
+
+    def _block(self, previous):
+        kind = self._random.choices(
+            list(self.BLOCK_WEIGHTS), weights=list(self.BLOCK_WEIGHTS.values()))[0]
+        self._count += 1
+
+        if kind == "decision":
+            block = BehaviorDecision(f"Decision {self._count}",
+                                     default_yes=self._random.random() < 0.5).add_from(previous)
+            block.add_yes(self._chain(self._random.randint(1, 3)))
+            block.add_no(self._chain(self._random.randint(1, 3)))
+        elif kind == "parallel":
+            block = BehaviorParallel(f"Parallel {self._count}").add_from(previous)
+            for _ in range(self._random.randint(2, 3)):
+                block.add_parallel_element(self._chain(self._random.randint(1, 3)))
+        elif kind == "loop":
+            block = BehaviorLoop(f"Loop {self._count}",
+                                 loop_count=self._random.randint(2, 5)).add_from(previous)
+            block.set_loop_content(self._chain(self._random.randint(1, 3)))
+        else:
+            self._count -= 1
+            block = self._action().add_from(previous)
+        return block
+
+    def generate(self, num_nodes: int) -> tuple[flowchart.Root, BehaviorSummary]:
+        """Return (root of the behavior flow, summary) with about num_nodes elements."""
+        self._count = 0
+        root = flowchart.Root("Start")
+        last = root
+        while self._count < num_nodes:
+            last = self._block(last)
+        flowchart.Root("End").add_from(last)
+
+        return root, BehaviorSummary(f"Synthetic {num_nodes}", root_element=root,
+                                     is_parse_subroutine=True)
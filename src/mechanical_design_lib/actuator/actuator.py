@@ -1,41 +1,157 @@
-import sympy
+import dataclasses
+
 import numpy as np
 
-from mechanical_design_lib.utils.unit import UnitConverter
+from mechanical_design_lib.actuator.recorder import MoveRecorder
+from mechanical_design_lib.utils.instrumentation import Instrumentation
+from mechanical_design_lib.utils.lazy_import import lazy_import
+from mechanical_design_lib.utils.logger import LoggerFactory
+from mechanical_design_lib.utils.unit import UnitConverter, Unit, Units
+
+sympy = lazy_import("sympy")
+logger = LoggerFactory.get_logger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class MotionProfile:
+    distance: float  # unit depends on actuator
+    velocity: float  # peak velocity, unit depends on actuator
+    acceleration: float  # unit depends on actuator
+    deceleration: float  # unit depends on actuator
+    t_accel: float  # s
+    t_const: float  # s
+    t_decel: float  # s
+
+    @property
+    def total_time(self) -> float:
+        return self.t_accel + self.t_const + self.t_decel
+
+
+@dataclasses.dataclass(frozen=True)
+class ActuatorMove:
+    start_position: float  # unit depends on actuator
+    target_position: float  # unit depends on actuator
+    velocity: float | None = None  # unit depends on actuator
+    acceleration: float | None = None  # unit depends on actuator
+    deceleration: float | None = None  # unit depends on actuator
+
+    @property
+    def distance(self) -> float:
+        return abs(self.target_position - self.start_position)
 
 
 class BaseActuator:
+    # units of plain numbers; Quantity arguments are converted to these
+    DISTANCE_UNIT: Unit | None = None
+    VELOCITY_UNIT: Unit | None = None
+    ACCELERATION_UNIT: Unit | None = None
+
     def __init__(self,
                  stroke: int,  # unit depends on subclass
                  max_velocity: int,  # unit depends on subclass
                  max_acceleration: float,  # unit depends on subclass
                  max_deceleration: float,  # unit depends on subclass
                  ):
-        self._stroke = stroke
-        self._max_velocity = max_velocity
-        self._max_acceleration = max_acceleration
-        self._max_deceleration = max_deceleration
+        self._stroke = self._to_distance(stroke)
+        self._max_velocity = self._to_velocity(max_velocity)
+        self._max_acceleration = self._to_acceleration(max_acceleration)
+        self._max_deceleration = self._to_acceleration(max_deceleration)
 
         self._position: int = 0  # unit depends on subclass
 
+        # incremented whenever a parameter affecting move times changes
+        self._revision = 0
+
+        self._recorder: MoveRecorder | None = None
+
+    @property
+    def recorder(self) -> MoveRecorder | None:
+        return self._recorder
+
+    def attach_recorder(self, recorder: MoveRecorder | None = None) -> MoveRecorder:
+        # 以降の move_absolute / move_relative を記録する
+        self._recorder = MoveRecorder() if recorder is None else recorder
+        return self._recorder
+
+    def detach_recorder(self) -> MoveRecorder | None:
+        recorder, self._recorder = self._recorder, None
+        return recorder
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def _to_distance(self, value):
+        return UnitConverter.to_value(value, self.DISTANCE_UNIT)
+
+    def _to_velocity(self, value):
+        return UnitConverter.to_value(value, self.VELOCITY_UNIT)
+
+    def _to_acceleration(self, value):
+        return UnitConverter.to_value(value, self.ACCELERATION_UNIT)
+
+    def _invalidate(self) -> None:
+        self._revision += 1
+
+    @property
+    def stroke(self):
+        return self._stroke
+
+    @stroke.setter
+    def stroke(self, stroke):
+        self._stroke = self._to_distance(stroke)
+        self._invalidate()
+
+    @property
+    def max_velocity(self):
+        return self._max_velocity
+
+    @max_velocity.setter
+    def max_velocity(self, max_velocity):
+        self._max_velocity = self._to_velocity(max_velocity)
+        self._invalidate()
+
+    @property
+    def max_acceleration(self):
+        return self._max_acceleration
+
+    @max_acceleration.setter
+    def max_acceleration(self, max_acceleration):
+        self._max_acceleration = self._to_acceleration(max_acceleration)
+        self._invalidate()
+
+    @property
+    def max_deceleration(self):
+        return self._max_deceleration
+
+    @max_deceleration.setter
+    def max_deceleration(self, max_deceleration):
+        self._max_deceleration = self._to_acceleration(max_deceleration)
+        self._invalidate()
+
+    @property
+    def position(self):
+        return self._position
+
     def move_absolute(self,
                       target_position: int,  # unit depends on subclass
                       time: float | None = None,  # s
                       velocity: int | None = None,  # unit depends on subclass
                       acceleration: float | None = None,  # unit depends on subclass
                       deceleration: float | None = None,  # unit depends on subclass
+                      start_time: float | None = None,  # s, for the recorder
                       ) -> float:
+        target_position = self._to_distance(target_position)
+
         # validate
         self._validate_move(target_position, time, velocity,
                             acceleration, deceleration)
 
+        start_position = self._position
         self._position = target_position
 
-        if time is not None:
-            return time
-        else:
-            distance = target_position - self._position
-            return self._calculate_move_time(distance, velocity, acceleration, deceleration)
+        return self._finish_move(start_position, target_position, time, velocity,
+                                 acceleration, deceleration, start_time)
 
     def move_relative(self,
                       distance: int,  # unit depends on subclass
@@ -43,29 +159,87 @@ class BaseActuator:
                       velocity: int | None = None,  # unit depends on subclass
                       acceleration: float | None = None,  # unit depends on subclass
                       deceleration: float | None = None,  # unit depends on subclass
+                      start_time: float | None = None,  # s, for the recorder
                       ) -> float:
+        distance = self._to_distance(distance)
+
         # validate
         self._validate_move(self._position + distance, time, velocity,
                             acceleration, deceleration)
 
+        start_position = self._position
         self._position += distance
 
-        if time is not None:
-            return time
-        else:
+        return self._finish_move(start_position, self._position, time, velocity,
+                                 acceleration, deceleration, start_time)
+
+    def _finish_move(self,
+                     start_position: float,  # unit depends on subclass
+                     target_position: float,  # unit depends on subclass
+                     time: float | None,  # s
+                     velocity: float | None,  # unit depends on subclass
+                     acceleration: float | None,  # unit depends on subclass
+                     deceleration: float | None,  # unit depends on subclass
+                     start_time: float | None,  # s
+                     ) -> float:
+        distance = target_position - start_position
+        if self._recorder is None:
+            if time is not None:
+                return time
             return self._calculate_move_time(distance, velocity, acceleration, deceleration)
 
+        profile = None
+        if time is None:
+            profile = self.calculate_profile(distance, velocity, acceleration, deceleration)
+            time = profile.total_time
+        self._recorder.record(start_position, target_position, time, profile, start_time)
+        return time
+
     def _calculate_move_time(self,
                              distance: int,  # unit depends on subclass
                              velocity: int | None = None,  # unit depends on subclass
                              acceleration: float | None = None,  # unit depends on subclass
                              deceleration: float | None = None,  # unit depends on subclass
                              ) -> float:
-        velocity = velocity or self._max_velocity
-        acceleration = acceleration or self._max_acceleration
-        deceleration = deceleration or self._max_deceleration
-
-        return distance / velocity
+        return self.calculate_profile(distance, velocity, acceleration, deceleration).total_time
+
+    def calculate_profile(self,
+                          distance: float,  # unit depends on subclass
+                          velocity: float | None = None,  # unit depends on subclass
+                          acceleration: float | None = None,  # unit depends on subclass
+                          deceleration: float | None = None,  # unit depends on subclass
+                          ) -> MotionProfile:
+        # Arguments may be arrays (or array Quantities); the profile is then evaluated
+        # element-wise and its fields are arrays.
+        velocity = self._max_velocity if velocity is None else self._to_velocity(velocity)
+        acceleration = self._max_acceleration if acceleration is None \
+            else self._to_acceleration(acceleration)
+        deceleration = self._max_deceleration if deceleration is None \
+            else self._to_acceleration(deceleration)
+
+        distance = np.abs(self._to_distance(distance))
+
+        # Trapezoidal profile, or triangular if max velocity is never reached
+        ramp_distance = (velocity * velocity / acceleration + velocity * velocity / deceleration) / 2
+        is_trapezoidal = ramp_distance <= distance
+        peak_velocity = np.where(
+            is_trapezoidal, velocity,
+            np.sqrt(2 * distance * acceleration * deceleration / (acceleration + deceleration)))
+        t_accel = peak_velocity / acceleration
+        t_decel = peak_velocity / deceleration
+        t_const = np.where(is_trapezoidal, (distance - ramp_distance) / velocity, 0.0)
+
+        fields = (distance, peak_velocity, acceleration, deceleration, t_accel, t_const, t_decel)
+        if all(np.ndim(field) == 0 for field in fields):
+            fields = [float(field) for field in fields]
+        return MotionProfile(*fields)
+
+    def get_move_time(self, move: ActuatorMove) -> float:
+        self._validate_move(self._to_distance(move.start_position))
+        self._validate_move(self._to_distance(move.target_position))
+
+        return self.calculate_profile(move.distance, move.velocity,
+                                      move.acceleration, move.deceleration).total_time
 
     def _validate_move(self,
                        target_position: int,  # unit depends on subclass
@@ -86,6 +260,10 @@ class BaseActuator:
                     deceleration: float | None = None,  # unit depends on subclass
                     simulation_only: bool = False,
                     ) -> np.ndarray:
+        target_position = self._to_distance(target_position)
+        velocity = None if velocity is None else self._to_velocity(velocity)
+        acceleration = None if acceleration is None else self._to_acceleration(acceleration)
+        deceleration = None if deceleration is None else self._to_acceleration(deceleration)
 
         if target_position > self._stroke:
             raise ValueError("Target position is out of stroke range.")
@@ -111,8 +289,9 @@ class BaseActuator:
                        velocity * t_const + (velocity * t_decel / 2))
 
         # Solve equations
-        solution = sympy.solve((eq1, eq2, eq3), (t_accel, t_decel, t_const))
-        print(f"Solutions: {solution}")
+        with Instrumentation.timer("actuator.profile_solve"):
+            solution = sympy.solve((eq1, eq2, eq3), (t_accel, t_decel, t_const))
+        logger.debug("Solutions: %s", solution)
 
         t_accel = solution[t_accel]
         t_decel = solution[t_decel]
@@ -134,8 +313,37 @@ class BaseActuator:
 
         return np.array([t_array, v_array])
 
+    def iter_move_detail(self,
+                         target_position: int,  # unit depends on subclass
+                         velocity: int | None = None,  # unit depends on subclass
+                         acceleration: float | None = None,  # unit depends on subclass
+                         deceleration: float | None = None,  # unit depends on subclass
+                         delta_t: float = 0.01,  # s
+                         chunk_size: int = 65536,  # samples per chunk
+                         ):
+        # move_detail を (2, n) の [t, v] 配列に分割して返す。全体の配列は作成しない。
+        # 閉形式のプロファイルを使うため、最高速度に達しない移動は三角形のプロファイルになる
+        distance = self._to_distance(target_position)
+        self._validate_move(distance)
+
+        profile = self.calculate_profile(distance, velocity, acceleration, deceleration)
+        t_ramp_end = profile.t_accel + profile.t_const
+        num_samples = int(np.ceil(profile.total_time / delta_t))
+
+        for start in range(0, num_samples, chunk_size):
+            t_array = np.arange(start, min(start + chunk_size, num_samples)) * delta_t
+            v_array = np.where(
+                t_array < profile.t_accel, profile.acceleration * t_array,
+                np.where(t_array < t_ramp_end, profile.velocity,
+                         profile.velocity - profile.deceleration * (t_array - t_ramp_end)))
+            yield np.stack([t_array, v_array])
+
 
 class LinearActuator(BaseActuator):
+    DISTANCE_UNIT = Units.MM
+    VELOCITY_UNIT = Units.MM_S
+    ACCELERATION_UNIT = Units.MM_S2
+
     def __init__(self,
                  stroke: int,  # mm
                  max_velocity: int,  # mm/s
@@ -146,6 +354,10 @@ class LinearActuator(BaseActuator):
 
 
 class RotaryActuator(BaseActuator):
+    DISTANCE_UNIT = Units.DEGREE
+    VELOCITY_UNIT = Units.DEGREE_S
+    ACCELERATION_UNIT = Units.DEGREE_S2
+
     def __init__(self,
                  stroke: float,  # degree
                  max_velocity: float,  # degree/s
@@ -213,10 +425,11 @@ class LinearActuatorFactory:
             eq3 = sympy.Eq(stroke, (max_velocity * t_accel / 2) + max_velocity *
                            (time - t_accel - t_decel) + (max_velocity * t_decel / 2))
 
-            solution = sympy.solve(
-                (eq1, eq2, eq3), (t_accel, t_decel, max_velocity), dict=True)
+            with Instrumentation.timer("actuator.profile_solve"):
+                solution = sympy.solve(
+                    (eq1, eq2, eq3), (t_accel, t_decel, max_velocity), dict=True)
 
-            print(f"Solutions: {solution}")
+            logger.debug("Solutions: %s", solution)
             if type(solution) is list:
                 max_velocity = solution[0][max_velocity]
             else:
@@ -230,15 +443,138 @@ class LinearActuatorFactory:
 
 
 class ScrewActuator(LinearActuator):
+    """Ball screw axis.
+
+    With ``screw_diameter`` given, the critical speed of the shaft and the DN
+    limit of the nut cap the velocity of every profile in addition to
+    ``max_velocity``. The critical speed is the simplified form
+    ``factor * d / L^2 * 1e7`` [rpm] with ``factor`` by the mounting of the
+    shaft, derated by ``CRITICAL_SPEED_SAFETY``.
+    """
+
+    # factor of the critical speed by the mounting of the shaft
+    MOUNTING_FACTORS = {
+        "fixed-free": 3.4,
+        "supported-supported": 9.7,
+        "fixed-supported": 15.1,
+        "fixed-fixed": 21.9,
+    }
+    CRITICAL_SPEED_SAFETY = 0.8
+    DN_LIMIT = 70000  # screw diameter [mm] * rpm, standard ball screws
+
     def __init__(self,
                  stroke: int,  # mm
                  max_velocity: int,  # mm/s
                  max_acceleration: float,  # mm/s^2
                  max_deceleration: float,  # mm/s^2
                  pitch: float,  # mm/rev
+                 screw_diameter: float | None = None,  # mm, no speed limit of the screw if None
+                 support_length: float | None = None,  # mm, distance between supports, stroke if None
+                 mounting: str = "fixed-supported",
+                 dn_limit: float | None = None,  # DN_LIMIT if None
                  ):
         super().__init__(stroke, max_velocity, max_acceleration, max_deceleration)
+        if mounting not in self.MOUNTING_FACTORS:
+            raise ValueError(f"Mounting must be one of {list(self.MOUNTING_FACTORS)}.")
         self._pitch = pitch
+        self._screw_diameter = screw_diameter
+        self._support_length = support_length
+        self._mounting = mounting
+        self._dn_limit = dn_limit
+
+    @property
+    def pitch(self) -> float:
+        return self._pitch
+
+    @pitch.setter
+    def pitch(self, pitch: float):
+        self._pitch = pitch
+        self._invalidate()
+
+    @property
+    def screw_diameter(self) -> float | None:
+        return self._screw_diameter
+
+    @screw_diameter.setter
+    def screw_diameter(self, screw_diameter: float | None):
+        self._screw_diameter = screw_diameter
+        self._invalidate()
+
+    @property
+    def support_length(self) -> float | None:
+        return self._support_length
+
+    @support_length.setter
+    def support_length(self, support_length: float | None):
+        self._support_length = support_length
+        self._invalidate()
+
+    @property
+    def mounting(self) -> str:
+        return self._mounting
+
+    @property
+    def dn_limit(self) -> float | None:
+        return self._dn_limit
+
+    @property
+    def max_rpm(self) -> float:
+        """Allowed screw speed by the critical speed and the DN limit, inf without a diameter."""
+        if self._screw_diameter is None:
+            return np.inf
+        return float(self.get_max_rpm(self._screw_diameter,
+                                      self._support_length or self._stroke,
+                                      self._mounting, self._dn_limit))
+
+    @property
+    def velocity_limit(self) -> float:  # mm/s
+        return min(self._max_velocity, self.max_rpm / 60 * self._pitch)
+
+    @classmethod
+    def get_critical_speed(cls,
+                           screw_diameter,  # mm
+                           support_length,  # mm
+                           mounting: str = "fixed-supported",
+                           ):  # rpm
+        # arguments may be arrays
+        factor = cls.MOUNTING_FACTORS[mounting]
+        return cls.CRITICAL_SPEED_SAFETY * factor * np.asarray(screw_diameter) \
+            / np.asarray(support_length, dtype=float) ** 2 * 1e7
+
+    @classmethod
+    def get_max_rpm(cls,
+                    screw_diameter,  # mm
+                    support_length,  # mm
+                    mounting: str = "fixed-supported",
+                    dn_limit: float | None = None,
+                    ):  # rpm
+        dn_limit = cls.DN_LIMIT if dn_limit is None else dn_limit
+        return np.minimum(cls.get_critical_speed(screw_diameter, support_length, mounting),
+                          dn_limit / np.asarray(screw_diameter, dtype=float))
+
+    def calculate_profile(self,
+                          distance: float,  # mm
+                          velocity: float | None = None,  # mm/s
+                          acceleration: float | None = None,  # mm/s^2
+                          deceleration: float | None = None,  # mm/s^2
+                          ) -> MotionProfile:
+        # 指定速度もねじの許容回転数で頭打ちにする
+        velocity = self._max_velocity if velocity is None else self._to_velocity(velocity)
+        return super().calculate_profile(distance, np.minimum(velocity, self.velocity_limit),
+                                         acceleration, deceleration)
+
+    def move_detail(self,
+                    target_position: int,  # mm
+                    velocity: int | None = None,  # mm/s
+                    acceleration: float | None = None,  # mm/s^2
+                    deceleration: float | None = None,  # mm/s^2
+                    simulation_only: bool = False,
+                    ) -> np.ndarray:
+        # calculate_profile と同じく、指定速度もねじの許容回転数で頭打ちにする
+        velocity = self._max_velocity if velocity is None else self._to_velocity(velocity)
+        velocity = float(np.minimum(velocity, self.velocity_limit))
+        return super().move_detail(target_position, velocity, acceleration, deceleration,
+                                   simulation_only)
 
     def move(self,
              target_position: int,  # mm
@@ -247,10 +583,71 @@ class ScrewActuator(LinearActuator):
              deceleration: float | None = None,  # mm/s^2
              simulation_only: bool = False,
              ) -> np.ndarray:
-        return super().move(target_position, velocity, acceleration, deceleration, simulation_only)
-
-    def get_revolution(self, distance: int) -> float:
-        return distance / self._pitch
+        # move_detail と同じ [t, v] 配列を閉形式のプロファイルから作る
+        target_position = self._to_distance(target_position)
+        chunks = list(self.iter_move_detail(target_position, velocity, acceleration, deceleration))
+        if simulation_only:
+            self._position = target_position
+        return np.concatenate(chunks, axis=1) if chunks else np.zeros((2, 0))
+
+    def get_revolution(self, distance) -> float | np.ndarray:
+        # distance may be an array
+        return self._to_distance(distance) / self._pitch
+
+    def get_rpm(self, velocity) -> float | np.ndarray:
+        # velocity may be an array, e.g. the velocity row of a trajectory
+        return self._to_velocity(velocity) / self._pitch * 60
+
+    def iter_rpm_detail(self,
+                        target_position: int,  # mm
+                        velocity: int | None = None,  # mm/s
+                        acceleration: float | None = None,  # mm/s^2
+                        deceleration: float | None = None,  # mm/s^2
+                        delta_t: float = 0.01,  # s
+                        chunk_size: int = 65536,  # samples per chunk
+                        ):
+        # iter_move_detail の速度をねじの回転数 [rpm] にした (2, n) の [t, rpm] 配列
+        for chunk in self.iter_move_detail(target_position, velocity, acceleration,
+                                           deceleration, delta_t, chunk_size):
+            chunk[1] = self.get_rpm(chunk[1])
+            yield chunk
+
+    @classmethod
+    def sweep(cls,
+              strokes,  # mm, array
+              pitches,  # mm/rev, array
+              max_velocity: float,  # mm/s
+              max_acceleration: float,  # mm/s^2
+              max_deceleration: float,  # mm/s^2
+              screw_diameter: float | None = None,  # mm
+              support_margin: float = 0.0,  # mm, support length is stroke + margin
+              mounting: str = "fixed-supported",
+              dn_limit: float | None = None,
+              ) -> dict[str, np.ndarray]:
+        """Stroke time over the grid of strokes x pitches, one flat array per column.
+
+        The columns can be wrapped in a ResultTable.
+        """
+        stroke, pitch = (array.ravel().astype(float) for array in
+                         np.meshgrid(np.asarray(strokes), np.asarray(pitches), indexing="ij"))
+        if screw_diameter is None:
+            max_rpm = np.full_like(stroke, np.inf)
+        else:
+            max_rpm = cls.get_max_rpm(screw_diameter, stroke + support_margin, mounting, dn_limit)
+
+        # 径を指定しない代表の軸で、全組み合わせのプロファイルを一度に計算する
+        actuator = cls(np.inf, max_velocity, max_acceleration, max_deceleration, 1)
+        velocity = np.minimum(actuator.max_velocity, max_rpm / 60 * pitch)
+        profile = actuator.calculate_profile(stroke, velocity)
+        return {
+            "stroke": stroke,
+            "pitch": pitch,
+            "max_rpm": max_rpm,
+            "velocity_limit": velocity,
+            "peak_velocity": profile.velocity,
+            "peak_rpm": profile.velocity / pitch * 60,
+            "stroke_time": profile.t_accel + profile.t_const + profile.t_decel,
+        }
 
 
 if __name__ == "__main__":
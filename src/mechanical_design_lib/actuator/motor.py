@@ -1,4 +1,3 @@
-import sympy
 import numpy as np
 
 from mechanical_design_lib.utils.unit import UnitConverter
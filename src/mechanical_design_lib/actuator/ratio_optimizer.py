@@ -0,0 +1,206 @@
+import dataclasses
+import math
+
+import numpy as np
+
+from mechanical_design_lib.actuator.actuator import ActuatorMove, BaseActuator
+from mechanical_design_lib.actuator.stepping_motor import SteppingMotor
+from mechanical_design_lib.power_transmission_component import rotary_power_transmission_component as rptc
+from mechanical_design_lib.utils.unit import Dimension, Units
+
+
+@dataclasses.dataclass(frozen=True)
+class TorqueCurve:
+    speed: np.ndarray  # rpm, increasing
+    torque: np.ndarray  # N*m, pull-out torque at each speed
+
+    def get_torque(self, rpm) -> np.ndarray:
+        # 曲線の範囲外の回転数ではトルクは出ないものとする
+        return np.interp(rpm, self.speed, self.torque, left=self.torque[0], right=0.0)
+
+
+@dataclasses.dataclass
+class GearOption:
+    gears: rptc.SingleStageGears | rptc.MultiStageGears
+    ratio: float
+    move_time: float  # s, total over the required moves
+    ratio_error: float  # relative to the optimal ratio
+
+
+@dataclasses.dataclass
+class RatioOptimization:
+    ratios: np.ndarray  # evaluated reduction ratios
+    move_time: np.ndarray  # s per ratio, total over the required moves
+    peak_speed: np.ndarray  # rpm at the motor per ratio, best of the sampled speeds
+    best_ratio: float
+    best_move_time: float  # s
+    single_stage: list[GearOption]
+    multi_stage: list[GearOption]
+
+
+class TransmissionRatioOptimizer:
+    """Move time of a stepper axis as a function of the reduction ratio.
+
+    A higher ratio reduces the reflected load inertia and multiplies the motor
+    torque, but the pulse rate limit and the falling torque curve cap the
+    output speed. For each ratio the move time is minimized over a set of
+    peak motor speeds: the acceleration is the torque available at the peak
+    speed (divided by the safety factor) over the inertia at the motor shaft.
+    Ratios and speeds are evaluated as one array.
+    """
+
+    def __init__(self,
+                 actuator: BaseActuator,  # mechanism limits, velocity and acceleration caps
+                 output_component: rptc.OutputComponentBase,
+                 stepping_motor: SteppingMotor,
+                 torque_curve: TorqueCurve,
+                 rotor_inertia: float,  # kg*m^2
+                 load: float = 0.0,  # kg for linear actuators, kg*m^2 for rotary actuators
+                 transmission_inertia: float = 0.0,  # kg*m^2 at the motor shaft
+                 friction_torque: float = 0.0,  # N*m at the motor shaft
+                 max_pps: float | None = None,  # driver pulse rate limit, Hz
+                 safety_factor: float = 2.0,  # on the pull-out torque
+                 ):
+        self._actuator = actuator
+        self._output_component = output_component
+        self._stepping_motor = stepping_motor
+        self._torque_curve = torque_curve
+        self._rotor_inertia = rotor_inertia
+        self._load = load
+        self._transmission_inertia = transmission_inertia
+        self._friction_torque = friction_torque
+        self._max_pps = max_pps
+        self._safety_factor = safety_factor
+
+        # rad at the motor per output unit (mm or degree) at ratio 1
+        self._radian_per_unit = math.radians(output_component.get_angle(1.0))
+        unit = actuator.DISTANCE_UNIT
+        si_unit = Units.M if unit.dimension == Dimension.LENGTH else Units.RADIAN
+        self._unit_per_si = 1 / unit.get_factor(si_unit)  # e.g. mm per m
+
+    def _get_max_rpm(self) -> float:
+        max_rpm = float(self._torque_curve.speed[-1])
+        if self._max_pps is not None:
+            max_rpm = min(max_rpm, self._stepping_motor.get_rpm(self._max_pps))
+        return max_rpm
+
+    def evaluate(self,
+                 moves: list[ActuatorMove],
+                 ratios,
+                 speed_samples: int = 64,
+                 ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (total move time [s], peak motor speed [rpm]) per ratio."""
+        ratios = np.asarray(ratios, dtype=float)
+        radian_per_unit = ratios * self._radian_per_unit  # (ratios,)
+        inertia = self._rotor_inertia + self._transmission_inertia \
+            + self._load / (radian_per_unit * self._unit_per_si) ** 2
+
+        # (ratios, speeds): 機構の速度上限で頭打ちにした後の回転数でトルクを求める
+        rpm = np.linspace(0, self._get_max_rpm(), speed_samples + 1)[1:]
+        peak_velocity = np.minimum(np.multiply.outer(1 / radian_per_unit, rpm * 2 * np.pi / 60),
+                                   self._actuator.max_velocity)
+        rpm = peak_velocity * radian_per_unit[:, np.newaxis] * 60 / (2 * np.pi)
+        torque = self._torque_curve.get_torque(rpm) / self._safety_factor - self._friction_torque
+        acceleration_limit = np.maximum(torque, 0.0) / (inertia * radian_per_unit)[:, np.newaxis]
+        peak_acceleration = np.minimum(acceleration_limit, self._actuator.max_acceleration)
+        peak_deceleration = np.minimum(acceleration_limit, self._actuator.max_deceleration)
+
+        total = np.zeros_like(peak_velocity)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for move in moves:
+                # 移動ごとの指定があれば上限として扱う
+                distance = move.distance
+                velocity = np.minimum(peak_velocity, move.velocity or np.inf)
+                acceleration = np.minimum(peak_acceleration, move.acceleration or np.inf)
+                deceleration = np.minimum(peak_deceleration, move.deceleration or np.inf)
+                # 台形、最高速度に達しなければ三角形のプロファイル
+                ramp_distance = velocity ** 2 / 2 * (1 / acceleration + 1 / deceleration)
+                peak = np.sqrt(2 * distance * acceleration * deceleration
+                               / (acceleration + deceleration))
+                total += np.where(ramp_distance <= distance,
+                                  distance / velocity + velocity / 2
+                                  * (1 / acceleration + 1 / deceleration),
+                                  peak / acceleration + peak / deceleration)
+        total = np.where(np.isnan(total) | (acceleration_limit <= 0), np.inf, total)
+
+        best = np.argmin(total, axis=1)
+        rows = np.arange(len(ratios))
+        return total[rows, best], rpm[rows, best]
+
+    def optimize(self,
+                 moves: list[ActuatorMove],
+                 min_ratio: float = 0.5,
+                 max_ratio: float = 50.0,
+                 num_ratios: int = 2048,
+                 speed_samples: int = 64,
+                 min_teeth: int = 12,
+                 max_teeth: int = 120,
+                 module: float = 1.0,  # mm, of the proposed gears
+                 width: float = 5.0,  # mm, of the proposed gears
+                 num_options: int = 5,
+                 ) -> RatioOptimization:
+        ratios = np.geomspace(min_ratio, max_ratio, num_ratios)
+        move_time, peak_speed = self.evaluate(moves, ratios, speed_samples)
+        best = int(np.argmin(move_time))
+        best_ratio = float(ratios[best])
+
+        # 実現可能な歯数の組について移動時間を計算し直し、短い順に候補とする
+        single_ratios, single_teeth = self._get_single_stage_ratios(min_teeth, max_teeth)
+        index = np.searchsorted(single_ratios, best_ratio)
+        near = np.unique(np.clip(np.arange(index - num_options, index + num_options),
+                                 0, len(single_ratios) - 1))
+        single_stage = self._rank_options(
+            moves, best_ratio, single_ratios[near], [[single_teeth[i]] for i in near.tolist()],
+            speed_samples, module, width, num_options)
+
+        # 2 段: 1 段目の各比に対して、積が最適比に最も近い 2 段目を選ぶ
+        second = np.searchsorted(single_ratios, best_ratio / single_ratios)
+        pairs = np.concatenate([
+            np.stack([np.arange(len(single_ratios)), np.clip(second + offset, 0,
+                                                             len(single_ratios) - 1)], axis=1)
+            for offset in (-1, 0)])
+        pairs = pairs[pairs[:, 0] <= pairs[:, 1]]  # 段の順序違いは同じ比
+        products = single_ratios[pairs[:, 0]] * single_ratios[pairs[:, 1]]
+        closest = np.argsort(np.abs(products / best_ratio - 1), kind="stable")[:8 * num_options]
+        multi_stage = self._rank_options(
+            moves, best_ratio, products[closest],
+            [[single_teeth[first], single_teeth[last]]
+             for first, last in pairs[closest].tolist()],
+            speed_samples, module, width, num_options)
+
+        return RatioOptimization(ratios, move_time, peak_speed, best_ratio,
+                                 float(move_time[best]), single_stage, multi_stage)
+
+    @staticmethod
+    def _get_single_stage_ratios(min_teeth: int, max_teeth: int):
+        # unique ratios z2 / z1, keeping the pair with the fewest teeth for each ratio
+        teeth = np.arange(min_teeth, max_teeth + 1)
+        driver, driven = (array.ravel() for array in np.meshgrid(teeth, teeth, indexing="ij"))
+        ratios = driven / driver
+        order = np.lexsort((driver + driven, ratios))
+        ratios, first = np.unique(ratios[order], return_index=True)
+        pairs = np.stack([driver[order][first], driven[order][first]], axis=1)
+        return ratios, [tuple(pair) for pair in pairs.tolist()]
+
+    def _rank_options(self, moves, best_ratio: float, ratios: np.ndarray, stages: list,
+                      speed_samples: int, module: float, width: float,
+                      num_options: int) -> list[GearOption]:
+        move_time, _ = self.evaluate(moves, ratios, speed_samples)
+        error = np.abs(ratios / best_ratio - 1)
+
+        options = []
+        seen = set()
+        for i in np.lexsort((error, move_time)).tolist():
+            if len(options) == num_options:
+                break
+            if (key := round(float(ratios[i]), 12)) in seen:
+                continue
+            seen.add(key)
+
+            gear_stages = [rptc.SingleStageGears([rptc.SpurGear(module, driver, width),
+                                                  rptc.SpurGear(module, driven, width)])
+                           for driver, driven in stages[i]]
+            gears = gear_stages[0] if len(gear_stages) == 1 else rptc.MultiStageGears(gear_stages)
+            options.append(GearOption(gears, float(ratios[i]), float(move_time[i]),
+                                      float(error[i])))
+        return options
@@ -0,0 +1,182 @@
+import numpy as np
+
+
+class MoveRecorder:
+    """Timeline of the moves of one actuator in a NumPy structured array.
+
+    Without ``max_moves`` the array grows by doubling; with it, the recorder is
+    a ring buffer that keeps the most recent moves. Moves are recorded by
+    ``BaseActuator.move_absolute``/``move_relative`` once the recorder is
+    attached with ``BaseActuator.attach_recorder``.
+
+    The recorder keeps a simulated clock: a move starts at the end of the
+    previous one unless a start time is given, and ``advance`` adds a dwell.
+    """
+
+    DTYPE = np.dtype([
+        ("start", "f8"),  # s
+        ("end", "f8"),  # s
+        ("from_position", "f8"),  # unit depends on actuator
+        ("to_position", "f8"),  # unit depends on actuator
+        ("velocity", "f8"),  # peak velocity, NaN if the move time was given
+        ("acceleration", "f8"),
+        ("deceleration", "f8"),
+        ("t_accel", "f8"),  # s
+        ("t_const", "f8"),  # s
+        ("t_decel", "f8"),  # s
+    ])
+
+    def __init__(self,
+                 capacity: int = 1024,  # initial number of moves
+                 max_moves: int | None = None,  # ring buffer size, unbounded if None
+                 ):
+        if max_moves is not None:
+            if max_moves < 1:
+                raise ValueError("max_moves must be positive.")
+            capacity = max_moves
+        self._buffer = np.zeros(max(capacity, 1), dtype=self.DTYPE)
+        self._max_moves = max_moves
+        self._count = 0  # moves recorded in total, also beyond the ring size
+        self._clock = 0.0  # s
+        # searchsorted by time is possible while moves are recorded in order
+        self._is_sorted = True
+
+    @property
+    def max_moves(self) -> int | None:
+        return self._max_moves
+
+    @property
+    def clock(self) -> float:
+        return self._clock
+
+    @property
+    def total_moves(self) -> int:
+        return self._count
+
+    def advance(self, time: float):  # s
+        self._clock += time
+
+    def clear(self):
+        self._count = 0
+        self._clock = 0.0
+        self._is_sorted = True
+
+    def __len__(self) -> int:
+        return self._count if self._max_moves is None else min(self._count, self._max_moves)
+
+    def record(self,
+               from_position: float,
+               to_position: float,
+               duration: float,  # s
+               profile=None,  # MotionProfile, None if the move time was given
+               start_time: float | None = None,  # s, the clock if None
+               ) -> int:
+        start_time = self._clock if start_time is None else start_time
+        if profile is None:
+            parameters = (np.nan,) * 6
+        else:
+            parameters = (profile.velocity, profile.acceleration, profile.deceleration,
+                          profile.t_accel, profile.t_const, profile.t_decel)
+
+        return self.record_many(np.array([(start_time, start_time + duration, from_position,
+                                           to_position, *parameters)], dtype=self.DTYPE))
+
+    def record_many(self, moves: np.ndarray) -> int:
+        """Append a structured array of DTYPE, e.g. moves generated in bulk.
+
+        Returns the index of the last move counted over the whole run.
+        """
+        moves = np.asarray(moves, dtype=self.DTYPE)
+        if not len(moves):
+            return self._count - 1
+
+        starts = moves["start"]
+        self._is_sorted = self._is_sorted and bool(np.all(np.diff(starts) >= 0)) and (
+            len(self) == 0 or starts[0] >= self._buffer["start"][self._get_index(self._count - 1)])
+        self._clock = max(self._clock, float(moves["end"].max()))
+
+        if self._max_moves is not None and len(moves) > self._max_moves:
+            # 古い移動はリングに入らないため、数だけ数える
+            self._count += len(moves) - self._max_moves
+            moves = moves[-self._max_moves:]
+        slots = self._get_slots(len(moves))  # may replace the buffer
+        self._buffer[slots] = moves
+        self._count += len(moves)
+        return self._count - 1
+
+    def _get_slots(self, count: int) -> np.ndarray:
+        if self._max_moves is not None:
+            return np.arange(self._count, self._count + count) % self._max_moves
+
+        if self._count + count > len(self._buffer):
+            # 容量を倍にして確保し直す。追加あたりのコピーは償却 O(1)
+            capacity = max(2 * len(self._buffer), self._count + count)
+            buffer = np.zeros(capacity, dtype=self.DTYPE)
+            buffer[:self._count] = self._buffer[:self._count]
+            self._buffer = buffer
+        return np.arange(self._count, self._count + count)
+
+    def _get_index(self, move: int) -> int:
+        return move if self._max_moves is None else move % self._max_moves
+
+    @property
+    def moves(self) -> np.ndarray:
+        """Recorded moves in recording order; a view unless the ring has wrapped."""
+        if self._max_moves is None or self._count <= self._max_moves:
+            return self._buffer[:len(self)]
+        split = self._count % self._max_moves
+        return np.concatenate([self._buffer[split:], self._buffer[:split]])
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.DTYPE.names)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        # Exporter.export_table で列として書き出せるようにする
+        return self.moves[column]
+
+    def get_range(self,
+                  start_time: float | None = None,  # s
+                  end_time: float | None = None,  # s
+                  ) -> np.ndarray:
+        """Moves overlapping [start_time, end_time]."""
+        moves = self.moves
+        if end_time is not None and self._is_sorted:
+            moves = moves[:np.searchsorted(moves["start"], end_time, side="right")]
+        elif end_time is not None:
+            moves = moves[moves["start"] <= end_time]
+        if start_time is not None:
+            moves = moves[moves["end"] >= start_time]
+        return moves
+
+    def get_positions(self, times) -> np.ndarray:
+        """Position at each of ``times`` (array), NaN before the first recorded move."""
+        if not self._is_sorted:
+            raise ValueError("Positions need moves recorded in order of start time.")
+        times = np.asarray(times, dtype=float)
+        moves = self.moves
+        if not len(moves):
+            return np.full(times.shape, np.nan)
+        index = np.searchsorted(moves["start"], times, side="right") - 1
+        valid = index >= 0
+        move = moves[np.maximum(index, 0)]
+
+        # 台形 (三角形) プロファイルの移動量。移動時間が指定された移動は線形補間する
+        elapsed = np.clip(times - move["start"], 0.0, move["end"] - move["start"])
+        total = np.abs(move["to_position"] - move["from_position"])
+        t_accel, t_const = move["t_accel"], move["t_const"]
+        t_ramp_end = t_accel + t_const
+        accel_distance = 0.5 * move["acceleration"] * np.minimum(elapsed, t_accel) ** 2
+        const_distance = move["velocity"] * np.clip(elapsed - t_accel, 0.0, t_const)
+        decel_time = np.clip(elapsed - t_ramp_end, 0.0, move["t_decel"])
+        decel_distance = move["velocity"] * decel_time - 0.5 * move["deceleration"] * decel_time ** 2
+        distance = accel_distance + const_distance + decel_distance
+
+        duration = move["end"] - move["start"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            linear = np.where(duration > 0, total * elapsed / duration, total)
+        distance = np.where(np.isnan(move["velocity"]), linear, np.minimum(distance, total))
+        distance = np.where(elapsed >= duration, total, distance)
+
+        direction = np.sign(move["to_position"] - move["from_position"])
+        return np.where(valid, move["from_position"] + direction * distance, np.nan)
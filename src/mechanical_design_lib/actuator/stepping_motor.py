@@ -1,14 +1,15 @@
 import dataclasses
-import sympy
-from IPython.display import display, Latex
+import math
 
-from mechanical_design_lib.utils.unit import UnitConverter, UnitSymbol
+from mechanical_design_lib.utils.lazy_import import lazy_import
+from mechanical_design_lib.utils.unit import UnitConverter, UnitSymbol, UnitType, Units
 from mechanical_design_lib.utils.unit import Angle, Distance
 
-from mechanical_design_lib.utils.util import display_latex_symbol_and_unit
 from mechanical_design_lib.base.base import FormulaBase
 from mechanical_design_lib.power_transmission_component import rotary_power_transmission_component as rptc
 
+sympy = lazy_import("sympy")
+
 
 class SteppingMotor:
 
@@ -32,12 +33,15 @@ class SteppingMotor:
         return self._step_angle
 
     def get_pps(self, rpm: float) -> float:
+        rpm = UnitConverter.to_value(rpm, Units.RPM)
         return (rpm / 60) * (360 / self.step_angle)
 
     def get_rpm(self, pps: float) -> float:
+        pps = UnitConverter.to_value(pps, Units.HZ)
         return (pps / (360 / self.step_angle)) * 60
 
     def get_pulse(self, revolute_angle: float) -> float:
+        revolute_angle = UnitConverter.to_value(revolute_angle, Units.DEGREE)
         return revolute_angle / self.step_angle
 
     def get_angle(self, pulse: float) -> float:
@@ -61,15 +65,31 @@ class SteppingMotorActuatorUnit:
     def reduction_ratio(self) -> float:
         return self._reduction_ratio
 
+    @property
+    def stepping_motor(self) -> SteppingMotor:
+        return self._stepping_motor
+
+    @property
+    def motor_radian_per_unit(self) -> float:
+        # rad at the motor shaft per mm (or degree) at the output.
+        # The chain is linear, so this also converts velocity and acceleration.
+        return math.radians(self._output_component.get_angle(1.0) * self.reduction_ratio)
+
     def _culculate_reduction_ratio(self) -> float:
         reduction_ratio = 1
         for component in self._transmission_component_unit_list:
             reduction_ratio *= component.reduction_ratio
         return reduction_ratio
 
+    def _get_units(self):
+        if self._output_component.distance_unit == UnitType.ANGLE:
+            return Units.DEGREE, Units.DEGREE_S
+        return Units.MM, Units.MM_S
+
     def get_pulse(self,
                   distance: Distance | Angle  # mm or degree
                   ) -> float:
+        distance = UnitConverter.to_value(distance, self._get_units()[0])
         return self._stepping_motor.get_pulse(
             self._output_component.get_angle(distance) * self.reduction_ratio
         )
@@ -77,6 +97,7 @@ class SteppingMotorActuatorUnit:
     def get_pps(self,
                 speed: float  # mm/s or degree/s
                 ) -> float:
+        speed = UnitConverter.to_value(speed, self._get_units()[1])
         return self._stepping_motor.get_pps(
             self._output_component.get_rpm(speed) * self.reduction_ratio
         )
@@ -96,23 +117,19 @@ class StartingPulseRate(FormulaBase):
         jo: UnitSymbol = UnitSymbol('J_o', 'kg*m^2')
         jl: UnitSymbol = UnitSymbol('J_l', 'kg*m^2')
 
-        def display(self):
-            display(Latex("----- Symbols -----"))
-            display_latex_symbol_and_unit(
-                "Starting pulse rate of the stepping motor", self.fs.symbol, self.fs.unit)
-            display_latex_symbol_and_unit(
-                "Inertia of the rotor", self.jo.symbol, self.jo.unit)
-            display_latex_symbol_and_unit(
-                "Inertia of the load", self.jl.symbol, self.jl.unit)
+        LABELS = {
+            "fs": "Starting pulse rate of the stepping motor",
+            "jo": "Inertia of the rotor",
+            "jl": "Inertia of the load",
+        }
 
     @dataclasses.dataclass
     class Formulas(FormulaBase.Formulas):
         f: UnitSymbol = UnitSymbol('f', 'Hz')
 
-        def display(self):
-            display(Latex("----- Formula -----"))
-            display_latex_symbol_and_unit(
-                "Starting pulse rate of the stepping motor", self.f.symbol, self.f.unit)
+        LABELS = {
+            "f": "Starting pulse rate of the stepping motor",
+        }
 
     def __init__(self):
         super().__init__()
@@ -125,11 +142,7 @@ class StartingPulseRate(FormulaBase):
         self._formulas.f = UnitSymbol(f, 'Hz')
 
     def calculate(self, symbols: Symbols):
-        return self._formulas.f.symbol.subs({
-            self._symbols.fs.symbol: symbols.fs.value,
-            self._symbols.jo.symbol: symbols.jo.value,
-            self._symbols.jl.symbol: symbols.jl.value,
-        })
+        return self._evaluate("f", symbols)
 
 
 if __name__ == '__main__':
@@ -1,26 +1,88 @@
 import dataclasses
+import html
+import typing
+
+from mechanical_design_lib.utils.instrumentation import Instrumentation
+from mechanical_design_lib.utils.lazy_import import lazy_import
+from mechanical_design_lib.utils.unit import UnitSymbol
+from mechanical_design_lib.utils.util import get_latex_block, get_latex_line
+
+sympy = lazy_import("sympy")
+
+
+class _LatexBlock:
+    # shown by display; a subclass sets the labels of its fields
+    TITLE = ""
+    # field name -> label, fields without a label are shown with their name
+    LABELS: typing.ClassVar[dict[str, str]] = {}
+
+    def get_latex_lines(self) -> list[str]:
+        lines = []
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, UnitSymbol):
+                lines.append(get_latex_line(self.LABELS.get(field.name, field.name),
+                                            value.symbol, value.unit))
+        return lines
+
+    def get_html(self) -> str:
+        return get_latex_block(self.TITLE, self.get_latex_lines())
+
+    def display(self):
+        from IPython.display import display, HTML
+        display(HTML(self.get_html()))
 
 
 class FormulaBase:
     @dataclasses.dataclass
-    class Symbols:
-        def display(self):
-            raise NotImplementedError
+    class Symbols(_LatexBlock):
+        TITLE = "----- Symbols -----"
+
+        def __post_init__(self):
+            # Defaults of the dataclass fields are shared by all instances,
+            # each instance gets its own UnitSymbol so that values do not leak.
+            for field in dataclasses.fields(self):
+                value = getattr(self, field.name)
+                if isinstance(value, UnitSymbol):
+                    setattr(self, field.name, value.copy())
 
     @dataclasses.dataclass
-    class Formulas:
-        def display(self):
-            raise NotImplementedError
+    class Formulas(_LatexBlock):
+        TITLE = "----- Formula -----"
+
+    # class -> Formulas built once by _init_formula and shared by its instances
+    __FORMULAS = {}
+    # (class, formula name) -> numpy function of the symbols
+    __FUNCTIONS = {}
 
     def __init__(self):
         self._symbols = self.Symbols()
-        self._formulas = self.Formulas()
 
-        self._init_formula()
+        formulas = FormulaBase.__FORMULAS.get(type(self))
+        if formulas is None:
+            self._formulas = self.Formulas()
+            self._init_formula()
+            formulas = FormulaBase.__FORMULAS[type(self)] = self._formulas
+        self._formulas = formulas
 
     def display(self):
-        self.display_symbols()
-        self.display_formulas()
+        # symbols and formulas in one output
+        from IPython.display import display, HTML
+        display(HTML(self.get_html()))
+
+    def get_html(self) -> str:
+        return self._symbols.get_html() + self._formulas.get_html()
+
+    @staticmethod
+    def get_report_html(formula_objects: list["FormulaBase"]) -> str:
+        return "\n".join(f"<h4>{html.escape(type(formula_object).__name__)}</h4>"
+                         + formula_object.get_html() for formula_object in formula_objects)
+
+    @staticmethod
+    def display_report(formula_objects: list["FormulaBase"]):
+        """Show many formula objects in one output, e.g. all formulas of a sizing."""
+        from IPython.display import display, HTML
+        display(HTML(FormulaBase.get_report_html(formula_objects)))
 
     def _init_formula(self):
         raise NotImplementedError
@@ -41,3 +103,18 @@ class FormulaBase:
 
     def calculate(self, symbols: Symbols):
         raise NotImplementedError
+
+    def _evaluate(self, formula_name: str, symbols: Symbols):
+        # 式は一度だけ numpy 関数に変換し、配列の値をまとめて計算する
+        key = (type(self), formula_name)
+        function = FormulaBase.__FUNCTIONS.get(key)
+        if function is None:
+            arguments = [getattr(self._symbols, field.name).symbol
+                         for field in dataclasses.fields(self._symbols)]
+            with Instrumentation.timer("formula.lambdify"):
+                function = FormulaBase.__FUNCTIONS[key] = sympy.lambdify(
+                    arguments, getattr(self._formulas, formula_name).symbol, modules="numpy")
+
+        with Instrumentation.timer("formula.evaluate"):
+            return function(*(getattr(symbols, field.name).value
+                              for field in dataclasses.fields(symbols)))
@@ -0,0 +1,69 @@
+"""Command line entry point for headless sizing and takt studies.
+
+    mdl-study spec.json --workers 8 --output results/
+"""
+import argparse
+import os
+import pathlib
+import sys
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="mdl-study",
+        description="Run the sizing and takt evaluation of a study spec (JSON or TOML).")
+    parser.add_argument("spec", type=pathlib.Path, help="study spec file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="parallel worker processes (default: CPU count)")
+    parser.add_argument("--output", type=pathlib.Path, default=None,
+                        help="result directory (default: <data directory>/<study name>)")
+    parser.add_argument("--variant", action="append", default=None,
+                        help="evaluate only this variant, may be repeated")
+    parser.add_argument("--format", choices=["csv", "columnar"], default="csv")
+    parser.add_argument("--compression", choices=["gzip", "bz2", "xz"], default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--instrument", action="store_true",
+                        help="print call counts and times per subsystem of this process "
+                             "at the end; use with --workers 1 to include the evaluation")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+
+    # ロガーはモジュールの import 時に作成されるため、先に環境変数を設定する。
+    # ワーカープロセスにも引き継がれる
+    os.environ["MDL_LOG_LEVEL"] = args.log_level
+    if args.instrument:
+        os.environ["MDL_INSTRUMENT"] = "1"
+
+    from mechanical_design_lib.machine.study import Study
+    from mechanical_design_lib.utils.instrumentation import Instrumentation
+    from mechanical_design_lib.utils.util import DirectoryFactory
+
+    if args.instrument:
+        Instrumentation.enable()
+
+    try:
+        study = Study.load(args.spec)
+        result = study.run(args.variant, args.workers)
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        print(f"mdl-study: error: {type(e).__name__}: {e}", file=sys.stderr)
+        return 2
+
+    output = args.output or pathlib.Path(
+        DirectoryFactory.get_directory(DirectoryFactory.DirectoryName.DATA)) / study.name
+    paths = result.save(output, args.format, args.compression)
+
+    takt = result.takt.sort_by("cycle_time")
+    for i in range(len(takt)):
+        row = takt.get_row(i)
+        print(f"{row['variant']:24} cycle time {row['cycle_time']:10.3f} s  "
+              f"bottleneck {row['bottleneck']}")
+    for path in paths.values():
+        print(f"wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
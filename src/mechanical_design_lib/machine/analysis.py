@@ -0,0 +1,583 @@
+import dataclasses
+import math
+
+import numpy as np
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.utils.flowchart import NodeKind
+from mechanical_design_lib.utils.instrumentation import Instrumentation
+from mechanical_design_lib.actuator.actuator import BaseActuator, RotaryActuator
+from mechanical_design_lib.machine.machine import Machine, BehaviorSummary, BehaviorReference
+
+
+# node kinds carrying a duration of their own
+TIMED_NODE_KINDS = (NodeKind.ACTION, NodeKind.SUBROUTINE)
+
+
+@dataclasses.dataclass
+class BehaviorSnapshot:
+    """Picklable timing model of a lowered behavior graph.
+
+    Durations are evaluated once when the snapshot is taken, so the
+    snapshot no longer references flowchart elements or actuators.
+    """
+    labels: list[str]
+    kinds: np.ndarray  # uint8, NodeKind per node
+    edge_offsets: np.ndarray  # int64, CSR offsets, length num_nodes + 1
+    edge_targets: np.ndarray  # int64
+    active_edges: np.ndarray  # bool, False for non-default decision branches
+    durations: np.ndarray  # float64, s per execution
+    multiplicities: np.ndarray  # int64, executions per cycle (enclosing loop counts)
+    topological_order: np.ndarray  # int64
+    partners: np.ndarray  # int64, matching start/end node of loop and parallel regions, -1 otherwise
+    enclosing_loops: np.ndarray  # int64, loop start node enclosing each node, -1 at top level
+    loop_counts: np.ndarray  # int64, iteration count of loop start nodes, 1 otherwise
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.durations * self.multiplicities
+
+    @classmethod
+    def from_graph(cls, graph: flowchart.IndexedGraph) -> "BehaviorSnapshot":
+        num_nodes = graph.num_nodes
+
+        labels = [graph.get_label(node) for node in range(num_nodes)]
+        durations = np.zeros(num_nodes)
+        for node in range(num_nodes):
+            if graph.get_kind(node) in TIMED_NODE_KINDS:
+                source = graph.get_source(node)
+                labels[node] = source._label
+                if hasattr(source, "get_takt_time"):
+                    durations[node] = source.get_takt_time() or 0.0
+
+        multiplicities = np.ones(num_nodes, dtype=np.int64)
+        for node in range(num_nodes):
+            multiplicities[node] = cls._get_multiplicity(graph, node)
+
+        edge_targets = np.frombuffer(graph.edge_targets, dtype=np.int64).copy()
+        active_edges = np.ones(len(edge_targets), dtype=bool)
+        for node in range(num_nodes):
+            if graph.get_kind(node) != NodeKind.DECISION:
+                continue
+            default_label = "Yes" if getattr(graph.get_source(node), "_default_yes", True) else "No"
+            for i in range(graph.edge_offsets[node], graph.edge_offsets[node + 1]):
+                if graph.edge_labels[i] in ("Yes", "No"):
+                    active_edges[i] = graph.edge_labels[i] == default_label
+
+        return cls(
+            labels=labels,
+            kinds=np.array([graph.get_kind(node) for node in range(num_nodes)], dtype=np.uint8),
+            edge_offsets=np.frombuffer(graph.edge_offsets, dtype=np.int64).copy(),
+            edge_targets=edge_targets,
+            active_edges=active_edges,
+            durations=durations,
+            multiplicities=multiplicities,
+            topological_order=np.frombuffer(graph.get_topological_order(), dtype=np.int64).copy(),
+            partners=np.array([graph.get_partner(node) for node in range(num_nodes)],
+                              dtype=np.int64),
+            enclosing_loops=np.array([graph.get_enclosing_loop(node) for node in range(num_nodes)],
+                                     dtype=np.int64),
+            loop_counts=np.array([graph.get_loop_count(node) for node in range(num_nodes)],
+                                 dtype=np.int64),
+        )
+
+    @staticmethod
+    def _get_multiplicity(graph: flowchart.IndexedGraph, node: int) -> int:
+        multiplicity = 1
+        loop_start = graph.get_enclosing_loop(node)
+        while loop_start >= 0:
+            multiplicity *= graph.get_loop_count(loop_start)
+            loop_start = graph.get_enclosing_loop(loop_start)
+        return multiplicity
+
+    @classmethod
+    def from_behavior(cls, behavior: BehaviorSummary) -> "BehaviorSnapshot":
+        if behavior.subroutine_root_element is None:
+            # behavior given only by its takt time
+            return cls(
+                labels=[behavior.label],
+                kinds=np.array([NodeKind.SUBROUTINE], dtype=np.uint8),
+                edge_offsets=np.zeros(2, dtype=np.int64),
+                edge_targets=np.zeros(0, dtype=np.int64),
+                active_edges=np.zeros(0, dtype=bool),
+                durations=np.array([behavior.get_takt_time(parse_subroutine=False)]),
+                multiplicities=np.ones(1, dtype=np.int64),
+                topological_order=np.zeros(1, dtype=np.int64),
+                partners=np.full(1, -1, dtype=np.int64),
+                enclosing_loops=np.full(1, -1, dtype=np.int64),
+                loop_counts=np.ones(1, dtype=np.int64),
+            )
+        return cls.from_graph(flowchart.ElementsCompiler.lower(behavior.subroutine_root_element))
+
+
+@dataclasses.dataclass(frozen=True)
+class BottleneckEntry:
+    node: int
+    label: str
+    duration: float  # s per execution
+    multiplicity: int  # executions per cycle
+    slack: float  # s of cycle time the element can grow without extending the cycle
+    critical: bool
+    saving_per_second: float  # s of cycle time saved per s of speed-up
+    unit: str | None = None
+    behavior: str | None = None
+
+    @property
+    def total_time(self) -> float:
+        return self.duration * self.multiplicity
+
+
+@dataclasses.dataclass
+class BottleneckReport:
+    cycle_time: float
+    entries: list[BottleneckEntry]  # ranked, largest saving first
+    unit: str | None = None
+    behavior: str | None = None
+
+    def get_critical_entries(self) -> list[BottleneckEntry]:
+        return [entry for entry in self.entries if entry.critical]
+
+
+class CriticalPathAnalyzer:
+    # relative tolerance used to decide that an element has zero slack
+    SLACK_TOLERANCE = 1e-9
+
+    @classmethod
+    def analyze(cls, behavior: BehaviorSummary) -> BottleneckReport:
+        return cls.analyze_snapshot(BehaviorSnapshot.from_behavior(behavior))
+
+    @classmethod
+    def analyze_machine(cls, machine: Machine) -> list[BottleneckReport]:
+        reports = []
+        for unit_name, unit in machine.units.items():
+            for behavior_name, behavior in unit.behaviors.items():
+                report = cls.analyze(behavior)
+                report.unit = unit_name
+                report.behavior = behavior_name
+                reports.append(report)
+        return reports
+
+    @classmethod
+    @Instrumentation.timed("analysis.critical_path")
+    def analyze_snapshot(cls, snapshot: BehaviorSnapshot) -> BottleneckReport:
+        timing = cls._compute_timing(snapshot)
+
+        timed_kinds = np.isin(snapshot.kinds, TIMED_NODE_KINDS)
+        entries = [cls._get_entry(snapshot, timing, node)
+                   for node in np.flatnonzero(timed_kinds & timing.active).tolist()]
+        entries.sort(key=lambda entry: (-entry.saving_per_second, -entry.total_time, entry.slack))
+
+        return BottleneckReport(timing.cycle_time, entries)
+
+    @staticmethod
+    def _get_entry(snapshot: BehaviorSnapshot, timing: "_Timing", node: int,
+                   unit: str | None = None, behavior: str | None = None) -> BottleneckEntry:
+        return BottleneckEntry(
+            node=node,
+            label=snapshot.labels[node],
+            duration=float(snapshot.durations[node]),
+            multiplicity=int(snapshot.multiplicities[node]),
+            slack=float(timing.slack[node]),
+            critical=bool(timing.critical[node]),
+            saving_per_second=float(timing.saving_per_second[node]),
+            unit=unit,
+            behavior=behavior,
+        )
+
+    @classmethod
+    def _compute_timing(cls, snapshot: BehaviorSnapshot) -> "_Timing":
+        # 1 回の前進パスと 1 回の後退パスで、スラックとクリティカルパスを求める。
+        # ループ内の要素は繰り返し回数で重み付けするため、ループを展開する必要はない。
+        num_nodes = snapshot.num_nodes
+        weights = snapshot.weights.tolist()
+        offsets = snapshot.edge_offsets.tolist()
+        targets = snapshot.edge_targets.tolist()
+        active_edges = snapshot.active_edges.tolist()
+        order = snapshot.topological_order.tolist()
+
+        has_predecessor = [False] * num_nodes
+        for target in targets:
+            has_predecessor[target] = True
+
+        # ties of path lengths are compared with the tolerance in both passes; the sum of
+        # the weights bounds the cycle time before it is known
+        tolerance = cls.SLACK_TOLERANCE * max(sum(abs(weight) for weight in weights), 1.0)
+
+        # forward pass: earliest times and number of longest paths reaching each node
+        active = [not has_predecessor[node] for node in range(num_nodes)]
+        earliest_start = [0.0] * num_nodes
+        earliest_finish = [0.0] * num_nodes
+        forward_paths = [1.0] * num_nodes
+        for node in order:
+            if not active[node]:
+                continue
+            finish = earliest_start[node] + weights[node]
+            earliest_finish[node] = finish
+            for i in range(offsets[node], offsets[node + 1]):
+                if not active_edges[i]:
+                    continue
+                target = targets[i]
+                if not active[target] or finish - earliest_start[target] > tolerance:
+                    active[target] = True
+                    earliest_start[target] = finish
+                    forward_paths[target] = forward_paths[node]
+                elif abs(finish - earliest_start[target]) <= tolerance:
+                    earliest_start[target] = max(earliest_start[target], finish)
+                    forward_paths[target] += forward_paths[node]
+
+        cycle_time = max((earliest_finish[node] for node in range(num_nodes) if active[node]),
+                         default=0.0)
+
+        # backward pass: latest times and number of longest paths leaving each critical node
+        latest_finish = [cycle_time] * num_nodes
+        critical = [False] * num_nodes
+        backward_paths = [0.0] * num_nodes
+        for node in reversed(order):
+            if not active[node]:
+                continue
+
+            successors = [targets[i] for i in range(offsets[node], offsets[node + 1])
+                          if active_edges[i] and active[targets[i]]]
+            latest_finish[node] = min(
+                (latest_finish[target] - weights[target] for target in successors),
+                default=cycle_time)
+            if latest_finish[node] - earliest_finish[node] > tolerance:
+                continue
+
+            critical[node] = True
+            backward_paths[node] = sum(
+                backward_paths[target] for target in successors
+                if critical[target]
+                and abs(earliest_start[target] - earliest_finish[node]) <= tolerance
+            ) if successors else 1.0
+
+        active = np.array(active, dtype=bool)
+        critical = np.array(critical, dtype=bool)
+        slack = np.where(active, np.array(latest_finish) - np.array(earliest_finish), np.inf)
+
+        # an element shortens the cycle only if every longest path goes through it
+        total_paths = sum(backward_paths[node] for node in range(num_nodes)
+                          if critical[node] and not has_predecessor[node])
+        path_share = np.array(forward_paths) * np.array(backward_paths)
+        on_every_path = critical & np.isclose(path_share, total_paths)
+        saving_per_second = np.where(on_every_path, snapshot.multiplicities, 0).astype(float)
+
+        return _Timing(cycle_time, active, slack, critical, saving_per_second,
+                       np.array(earliest_start))
+
+
+@dataclasses.dataclass
+class _Timing:
+    cycle_time: float
+    active: np.ndarray
+    slack: np.ndarray
+    critical: np.ndarray
+    saving_per_second: np.ndarray
+    earliest_start: np.ndarray
+
+
+@dataclasses.dataclass
+class ResourceUsage:
+    busy_time: float = 0.0  # s per cycle
+    move_count: int = 0  # moves per cycle
+    travel_distance: float = 0.0  # mm or degree per cycle
+    energy: float = math.nan  # J per cycle, kinetic energy given to the load
+
+
+class ResourceAggregator:
+    @staticmethod
+    def aggregate(behavior: BehaviorSummary,
+                  loads: dict[BaseActuator, float] | None = None,
+                  ) -> dict[BaseActuator, ResourceUsage]:
+        # moving mass [kg] for linear actuators or load inertia [kg*m^2] for rotary actuators
+        loads = loads or {}
+        if behavior.subroutine_root_element is None:
+            return {}
+
+        # ループは展開せず、実行回数を掛けて 1 サイクル分を集計する
+        graph = flowchart.ElementsCompiler.lower(behavior.subroutine_root_element)
+        snapshot = BehaviorSnapshot.from_graph(graph)
+        timing = CriticalPathAnalyzer._compute_timing(snapshot)
+
+        usages = {}
+        for node in np.flatnonzero(timing.active).tolist():
+            actuator = getattr(graph.get_source(node), "actuator", None)
+            if actuator is None or snapshot.kinds[node] not in TIMED_NODE_KINDS:
+                continue
+
+            move = graph.get_source(node).move
+            multiplicity = int(snapshot.multiplicities[node])
+            usage = usages.setdefault(actuator, ResourceUsage())
+            usage.busy_time += float(snapshot.durations[node]) * multiplicity
+            usage.move_count += multiplicity
+            usage.travel_distance += move.distance * multiplicity
+
+            if actuator in loads:
+                velocity = actuator.calculate_profile(
+                    move.distance, move.velocity, move.acceleration, move.deceleration).velocity
+                if isinstance(actuator, RotaryActuator):
+                    velocity = math.radians(velocity)  # rad/s
+                else:
+                    velocity = velocity / 1000  # m/s
+                energy = 0.5 * loads[actuator] * velocity ** 2 * multiplicity
+                usage.energy = energy if math.isnan(usage.energy) else usage.energy + energy
+
+        return usages
+
+
+class DependencyCycleError(ValueError):
+    def __init__(self, labels: list[str]):
+        self.labels = labels
+        super().__init__(
+            "Dependencies between units form a cycle (deadlock): " + ", ".join(labels))
+
+
+@dataclasses.dataclass
+class MachineSnapshot:
+    """Behaviors of all units merged into one graph with dependency edges.
+
+    Every behavior gets a start and an end connector node so that
+    dependencies can refer to a behavior as a whole.
+    """
+    snapshot: BehaviorSnapshot
+    behaviors: list[tuple[str, str]]  # (unit, behavior) per owner index
+    owners: np.ndarray  # int64, owner index per node
+    end_nodes: np.ndarray  # int64, end connector node per owner index
+
+    @classmethod
+    def from_machine(cls, machine: Machine) -> "MachineSnapshot":
+        referenced = {}
+        for dependency in machine.dependencies:
+            for reference in dependency:
+                if reference.element is not None:
+                    referenced.setdefault((reference.unit, reference.behavior), set()).add(
+                        reference.element)
+
+        behaviors = []
+        parts = []
+        element_nodes = {}  # (unit, behavior, element) -> (entry, exit, enclosing loop)
+        starts = {}
+        ends = {}
+        base = 0
+        for unit_name, unit in machine.units.items():
+            for behavior_name, behavior in unit.behaviors.items():
+                key = (unit_name, behavior_name)
+                if behavior.subroutine_root_element is None:
+                    graph = None
+                    part = BehaviorSnapshot.from_behavior(behavior)
+                else:
+                    graph = flowchart.ElementsCompiler.lower(behavior.subroutine_root_element)
+                    part = BehaviorSnapshot.from_graph(graph)
+
+                elements = referenced.get(key, ())
+                if elements and graph is not None:
+                    for node in range(graph.num_nodes):
+                        source = graph.get_source(node)
+                        if source in elements:
+                            # 領域要素は開始ノードが先に、終了ノードが後に追加される
+                            entry, _, loop = element_nodes.get(
+                                (*key, source),
+                                (base + node, base + node, graph.get_enclosing_loop(node)))
+                            element_nodes[(*key, source)] = (entry, base + node, loop)
+
+                behaviors.append(key)
+                parts.append((base, part))
+                starts[key] = base + part.num_nodes
+                ends[key] = base + part.num_nodes + 1
+                base += part.num_nodes + 2
+
+        def get_node(reference: BehaviorReference, is_before: bool) -> int:
+            key = (reference.unit, reference.behavior)
+            if reference.element is None:
+                return ends[key] if is_before else starts[key]
+            if (*key, reference.element) not in element_nodes:
+                raise ValueError(
+                    f"Element {reference.element.label!r} is not part of "
+                    f"behavior {reference.behavior!r} of unit {reference.unit!r}.")
+            entry, exit, loop = element_nodes[(*key, reference.element)]
+            if loop >= 0:
+                # ループ内の要素は繰り返し回数で重み付けしているため、個々の反復時刻を持たない
+                raise ValueError(
+                    f"Element {reference.element.label!r} is inside a loop; "
+                    f"refer to the enclosing loop instead.")
+            return exit if is_before else entry
+
+        dependency_edges = [(get_node(before, True), get_node(after, False))
+                            for before, after in machine.dependencies]
+        return cls._merge(behaviors, parts, dependency_edges, base)
+
+    @classmethod
+    def _merge(cls, behaviors, parts, dependency_edges, num_nodes) -> "MachineSnapshot":
+        labels = []
+        kinds = np.full(num_nodes, NodeKind.CONNECTOR, dtype=np.uint8)
+        durations = np.zeros(num_nodes)
+        multiplicities = np.ones(num_nodes, dtype=np.int64)
+        partners = np.full(num_nodes, -1, dtype=np.int64)
+        enclosing_loops = np.full(num_nodes, -1, dtype=np.int64)
+        loop_counts = np.ones(num_nodes, dtype=np.int64)
+        owners = np.zeros(num_nodes, dtype=np.int64)
+        sources, targets, active_edges = [], [], []
+
+        for owner, ((unit_name, behavior_name), (base, part)) in enumerate(zip(behaviors, parts)):
+            n = part.num_nodes
+            nodes = slice(base, base + n)
+            start, end = base + n, base + n + 1
+
+            labels.extend(part.labels)
+            labels.extend((f"{unit_name}/{behavior_name} Start", f"{unit_name}/{behavior_name} End"))
+            kinds[nodes] = part.kinds
+            durations[nodes] = part.durations
+            multiplicities[nodes] = part.multiplicities
+            partners[nodes] = np.where(part.partners >= 0, part.partners + base, -1)
+            enclosing_loops[nodes] = np.where(
+                part.enclosing_loops >= 0, part.enclosing_loops + base, -1)
+            loop_counts[nodes] = part.loop_counts
+            owners[base:end + 1] = owner
+
+            out_degree = np.diff(part.edge_offsets)
+            in_degree = np.bincount(part.edge_targets, minlength=n)
+            part_sources = np.repeat(np.arange(n), out_degree)
+
+            entries = np.flatnonzero(in_degree == 0) + base
+            exits = np.flatnonzero(out_degree == 0) + base
+            sources.extend((part_sources + base, np.full(len(entries), start), exits))
+            targets.extend((part.edge_targets + base, entries, np.full(len(exits), end)))
+            active_edges.extend((part.active_edges, np.ones(len(entries) + len(exits), dtype=bool)))
+
+        if dependency_edges:
+            dependency_edges = np.array(dependency_edges, dtype=np.int64)
+            sources.append(dependency_edges[:, 0])
+            targets.append(dependency_edges[:, 1])
+            active_edges.append(np.ones(len(dependency_edges), dtype=bool))
+
+        sources = np.concatenate(sources or [np.zeros(0)]).astype(np.int64)
+        targets = np.concatenate(targets or [np.zeros(0)]).astype(np.int64)
+        active_edges = np.concatenate(active_edges or [np.zeros(0)]).astype(bool)
+        order = np.argsort(sources, kind="stable")
+        edge_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=edge_offsets[1:])
+        targets = targets[order]
+
+        topological_order, cyclic_nodes = _sort_topologically(edge_offsets, targets)
+        if cyclic_nodes:
+            raise DependencyCycleError(
+                [f"{'/'.join(behaviors[owners[node]])}: {labels[node]}" for node in cyclic_nodes])
+
+        snapshot = BehaviorSnapshot(
+            labels=labels,
+            kinds=kinds,
+            edge_offsets=edge_offsets,
+            edge_targets=targets,
+            active_edges=active_edges[order],
+            durations=durations,
+            multiplicities=multiplicities,
+            topological_order=topological_order,
+            partners=partners,
+            enclosing_loops=enclosing_loops,
+            loop_counts=loop_counts,
+        )
+        end_nodes = np.array([base + part.num_nodes + 1 for base, part in parts], dtype=np.int64)
+        return cls(snapshot, behaviors, owners, end_nodes)
+
+
+def _sort_topologically(edge_offsets: np.ndarray, edge_targets: np.ndarray):
+    # Kahn 法。取り除けなかったノードは、下流側からも取り除いて閉路上のノードだけを残す
+    num_nodes = len(edge_offsets) - 1
+    offsets = edge_offsets.tolist()
+    targets = edge_targets.tolist()
+    in_degree = np.bincount(edge_targets, minlength=num_nodes).tolist()
+
+    order = [node for node in range(num_nodes) if in_degree[node] == 0]
+    for node in order:
+        for i in range(offsets[node], offsets[node + 1]):
+            target = targets[i]
+            in_degree[target] -= 1
+            if in_degree[target] == 0:
+                order.append(target)
+    if len(order) == num_nodes:
+        return np.array(order, dtype=np.int64), []
+
+    remaining = set(range(num_nodes)).difference(order)
+    predecessors = {node: [] for node in remaining}
+    out_degree = dict.fromkeys(remaining, 0)
+    for node in remaining:
+        for i in range(offsets[node], offsets[node + 1]):
+            if targets[i] in remaining:
+                predecessors[targets[i]].append(node)
+                out_degree[node] += 1
+    queue = [node for node in remaining if out_degree[node] == 0]
+    for node in queue:
+        remaining.discard(node)
+        for source in predecessors[node]:
+            out_degree[source] -= 1
+            if out_degree[source] == 0:
+                queue.append(source)
+    return None, sorted(remaining)
+
+
+@dataclasses.dataclass
+class MachineTimingReport:
+    cycle_time: float
+    entries: list[BottleneckEntry]  # ranked, largest saving first
+    critical_path: list[BottleneckEntry]  # timed elements along one critical path, in order
+    finish_times: dict[tuple[str, str], float]  # (unit, behavior) -> s
+
+    def get_critical_entries(self) -> list[BottleneckEntry]:
+        return [entry for entry in self.entries if entry.critical]
+
+
+class MachineCriticalPathAnalyzer:
+    @classmethod
+    def analyze(cls, machine: Machine) -> MachineTimingReport:
+        return cls.analyze_snapshot(MachineSnapshot.from_machine(machine))
+
+    @classmethod
+    @Instrumentation.timed("analysis.machine_critical_path")
+    def analyze_snapshot(cls, machine_snapshot: MachineSnapshot) -> MachineTimingReport:
+        # ユニットをまたぐグラフ全体に対して、1 回の前進・後退パスで評価する
+        snapshot = machine_snapshot.snapshot
+        timing = CriticalPathAnalyzer._compute_timing(snapshot)
+
+        def get_entry(node: int) -> BottleneckEntry:
+            unit, behavior = machine_snapshot.behaviors[machine_snapshot.owners[node]]
+            return CriticalPathAnalyzer._get_entry(snapshot, timing, node, unit, behavior)
+
+        timed = np.isin(snapshot.kinds, TIMED_NODE_KINDS)
+        entries = [get_entry(node) for node in np.flatnonzero(timed & timing.active).tolist()]
+        entries.sort(key=lambda entry: (-entry.saving_per_second, -entry.total_time, entry.slack))
+
+        critical_path = [get_entry(node) for node in cls._trace_critical_path(snapshot, timing)
+                         if timed[node]]
+        finish_times = {
+            key: float(timing.earliest_start[end])
+            for key, end in zip(machine_snapshot.behaviors, machine_snapshot.end_nodes.tolist())
+        }
+        return MachineTimingReport(timing.cycle_time, entries, critical_path, finish_times)
+
+    @staticmethod
+    def _trace_critical_path(snapshot: BehaviorSnapshot, timing: "_Timing") -> list[int]:
+        offsets = snapshot.edge_offsets.tolist()
+        targets = snapshot.edge_targets.tolist()
+        active_edges = snapshot.active_edges.tolist()
+        critical = timing.critical.tolist()
+        earliest_start = timing.earliest_start.tolist()
+        weights = snapshot.weights.tolist()
+        tolerance = CriticalPathAnalyzer.SLACK_TOLERANCE * max(timing.cycle_time, 1.0)
+
+        has_predecessor = np.zeros(snapshot.num_nodes, dtype=bool)
+        has_predecessor[snapshot.edge_targets] = True
+        node = next((node for node in snapshot.topological_order.tolist()
+                     if critical[node] and not has_predecessor[node]), None)
+
+        path = []
+        while node is not None:
+            path.append(node)
+            finish = earliest_start[node] + weights[node]
+            node = next((targets[i] for i in range(offsets[node], offsets[node + 1])
+                         if active_edges[i] and critical[targets[i]]
+                         and abs(earliest_start[targets[i]] - finish) <= tolerance), None)
+        return path
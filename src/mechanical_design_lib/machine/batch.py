@@ -0,0 +1,143 @@
+import concurrent.futures
+import csv
+import os
+import pathlib
+import typing
+
+import numpy as np
+
+from mechanical_design_lib.machine.machine import Machine
+from mechanical_design_lib.machine.analysis import MachineSnapshot, MachineCriticalPathAnalyzer
+from mechanical_design_lib.utils.exporter import Exporter
+
+
+class ResultTable:
+    """Column oriented results, one row per evaluated variant."""
+
+    def __init__(self, columns: dict[str, np.ndarray]):
+        self._columns = columns
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self._columns.values()), ()))
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._columns[column]
+
+    def get_row(self, index: int) -> dict:
+        return {name: values[index] for name, values in self._columns.items()}
+
+    def sort_by(self, column: str, descending: bool = False) -> "ResultTable":
+        order = np.argsort(self._columns[column], kind="stable")
+        if descending:
+            order = order[::-1]
+        return ResultTable({name: values[order] for name, values in self._columns.items()})
+
+    def save(self, path) -> pathlib.Path:
+        path = pathlib.Path(path)
+        if path.suffix == ".csv":
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self._columns)
+                writer.writerows(zip(*(values.tolist() for values in self._columns.values())))
+        else:
+            # object columns are stored as strings so that the file loads without pickle
+            np.savez_compressed(path, **{
+                name: values.astype(str) if values.dtype == object else values
+                for name, values in self._columns.items()})
+            if path.suffix != ".npz":
+                path = path.with_name(path.name + ".npz")
+        return path
+
+    def export(self, path, compression: str | None = None) -> pathlib.Path:
+        # 大きな表向け。CSV または列ごとのバイナリ形式に分割して書き込む
+        return Exporter.export_table(self, path, compression)
+
+
+def _evaluate(machine_snapshot: MachineSnapshot) -> tuple:
+    # ワーカープロセスで実行される。要素やアクチュエータは参照せず、numpy 配列のみを扱う
+    report = MachineCriticalPathAnalyzer.analyze_snapshot(machine_snapshot)
+    bottleneck = report.entries[0] if report.entries else None
+    return (
+        report.cycle_time,
+        {f"{unit}/{behavior}": finish for (unit, behavior), finish in report.finish_times.items()},
+        "" if bottleneck is None else f"{bottleneck.unit}/{bottleneck.behavior}/{bottleneck.label}",
+        0.0 if bottleneck is None else bottleneck.saving_per_second,
+        " -> ".join(f"{entry.unit}/{entry.label}" for entry in report.critical_path),
+    )
+
+
+def _evaluate_variant(variant: MachineSnapshot | typing.Callable[[], Machine]) -> tuple:
+    # ワーカープロセスで実行される。ビルダーの場合は機械とスナップショットの作成もここで行う
+    if not isinstance(variant, MachineSnapshot):
+        variant = MachineSnapshot.from_machine(variant())
+    return _evaluate(variant)
+
+
+class BatchEvaluator:
+    # variants evaluated in the calling process when there are fewer than this
+    MIN_PARALLEL_VARIANTS = 8
+
+    @classmethod
+    def evaluate(cls,
+                 variants: dict[str, Machine | typing.Callable[[], Machine]],  # name -> variant
+                 max_workers: int | None = None,
+                 chunksize: int | None = None,
+                 ) -> ResultTable:
+        """Evaluate named variants, in parallel when there are enough of them.
+
+        A variant given as a picklable callable returning the Machine (e.g. a
+        module-level function or functools.partial) is built and snapshotted in
+        the worker, so the actuator move times and the lowering run in parallel
+        too. Machine objects are snapshotted in the calling process because
+        their element graphs are too deep to pickle; only their analysis is
+        parallel.
+        """
+        names = list(variants)
+        inputs = [variant if callable(variant) else MachineSnapshot.from_machine(variant)
+                  for variant in (variants[name] for name in names)]
+        return cls._to_table(names, cls._map(_evaluate_variant, inputs, max_workers, chunksize))
+
+    @classmethod
+    def evaluate_snapshots(cls,
+                           names: list[str],
+                           snapshots: list[MachineSnapshot],
+                           max_workers: int | None = None,
+                           chunksize: int | None = None,
+                           ) -> ResultTable:
+        return cls._to_table(names, cls._map(_evaluate, snapshots, max_workers, chunksize))
+
+    @classmethod
+    def _map(cls, function, inputs: list, max_workers: int | None,
+             chunksize: int | None) -> list[tuple]:
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers == 1 or len(inputs) < cls.MIN_PARALLEL_VARIANTS:
+            return [function(value) for value in inputs]
+
+        # 1 タスクあたりのプロセス間通信を減らすため、まとめて送る
+        chunksize = chunksize or max(1, len(inputs) // (4 * max_workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(function, inputs, chunksize=chunksize))
+
+    @staticmethod
+    def _to_table(names: list[str], results: list[tuple]) -> ResultTable:
+        finish_columns = {}
+        for finish_times in (result[1] for result in results):
+            finish_columns.update(dict.fromkeys(finish_times))
+
+        columns = {
+            "variant": np.array(names, dtype=object),
+            "cycle_time": np.array([result[0] for result in results], dtype=float),
+            "bottleneck": np.array([result[2] for result in results], dtype=object),
+            "bottleneck_saving_per_second": np.array([result[3] for result in results],
+                                                     dtype=float),
+            "critical_path": np.array([result[4] for result in results], dtype=object),
+        }
+        # 各振る舞いの終了時刻。その振る舞いを持たないバリエーションは NaN
+        for key in finish_columns:
+            columns[f"finish_time:{key}"] = np.array(
+                [result[1].get(key, np.nan) for result in results], dtype=float)
+        return ResultTable(columns)
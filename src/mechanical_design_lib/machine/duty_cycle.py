@@ -0,0 +1,310 @@
+import dataclasses
+
+import numpy as np
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.actuator.actuator import BaseActuator
+from mechanical_design_lib.actuator.stepping_motor import SteppingMotorActuatorUnit
+from mechanical_design_lib.machine.analysis import BehaviorSnapshot
+from mechanical_design_lib.machine.machine import BehaviorSummary
+from mechanical_design_lib.machine.schedule import BehaviorScheduler, Schedule
+from mechanical_design_lib.utils.unit import Dimension, Units
+
+
+@dataclasses.dataclass(frozen=True)
+class MotorCandidate:
+    name: str
+    rotor_inertia: float  # kg*m^2
+    holding_torque: float  # N*m
+    rated_torque: float | None = None  # N*m, allowed RMS torque
+
+
+class MotorCatalog:
+    """Candidate motors as arrays, so that a whole catalog is evaluated at once."""
+
+    # allowed RMS torque relative to the holding torque when the catalog gives none
+    RMS_TORQUE_RATIO = 0.5
+
+    def __init__(self,
+                 names: list[str],
+                 rotor_inertia,  # kg*m^2 per candidate
+                 holding_torque,  # N*m per candidate
+                 rated_torque=None,  # N*m per candidate, NaN or None for the default
+                 ):
+        self._names = list(names)
+        self._rotor_inertia = np.asarray(rotor_inertia, dtype=float)
+        self._holding_torque = np.asarray(holding_torque, dtype=float)
+
+        default = self._holding_torque * self.RMS_TORQUE_RATIO
+        if rated_torque is None:
+            self._rated_torque = default
+        else:
+            rated_torque = np.asarray(rated_torque, dtype=float)
+            self._rated_torque = np.where(np.isnan(rated_torque), default, rated_torque)
+
+        if not len(self._names) == len(self._rotor_inertia) == len(self._holding_torque):
+            raise ValueError("Catalog columns must have the same length.")
+
+    @classmethod
+    def from_candidates(cls, candidates: list[MotorCandidate]) -> "MotorCatalog":
+        return cls([candidate.name for candidate in candidates],
+                   [candidate.rotor_inertia for candidate in candidates],
+                   [candidate.holding_torque for candidate in candidates],
+                   [np.nan if candidate.rated_torque is None else candidate.rated_torque
+                    for candidate in candidates])
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def names(self) -> list[str]:
+        return self._names
+
+    @property
+    def rotor_inertia(self) -> np.ndarray:
+        return self._rotor_inertia
+
+    @property
+    def holding_torque(self) -> np.ndarray:
+        return self._holding_torque
+
+    @property
+    def rated_torque(self) -> np.ndarray:
+        return self._rated_torque
+
+
+@dataclasses.dataclass(frozen=True)
+class AxisLoad:
+    drive: SteppingMotorActuatorUnit
+    # moving mass [kg] for linear actuators or load inertia [kg*m^2] for rotary actuators
+    load: float = 0.0
+    transmission_inertia: float = 0.0  # kg*m^2 at the motor shaft (gears, pulleys, coupling)
+    friction_torque: float = 0.0  # N*m at the motor shaft, against the motion while moving
+    static_torque: float = 0.0  # N*m at the motor shaft over the whole cycle, e.g. gravity
+
+
+@dataclasses.dataclass
+class DutyCycleReport:
+    cycle_time: float  # s
+    moving_time: float  # s per cycle
+    move_count: int  # per cycle
+    reflected_inertia: float  # kg*m^2, load and transmission at the motor shaft
+    rms_torque: np.ndarray  # N*m per candidate
+    peak_torque: np.ndarray  # N*m per candidate
+    inertia_ratio: np.ndarray  # reflected / rotor inertia per candidate
+    torque_margin: np.ndarray  # rated / RMS torque per candidate
+    acceptable: np.ndarray  # bool per candidate
+
+    @property
+    def duty(self) -> float:
+        return self.moving_time / self.cycle_time if self.cycle_time > 0 else 0.0
+
+
+@dataclasses.dataclass
+class TorqueProfile:
+    time: np.ndarray  # (samples,) s
+    torque: np.ndarray  # (candidates, samples) N*m
+
+
+@dataclasses.dataclass
+class _AxisMoves:
+    # one entry per move element of the schedule template
+    nodes: np.ndarray  # snapshot node
+    counts: np.ndarray  # executions per cycle
+    directions: np.ndarray  # +1 or -1
+    acceleration: np.ndarray  # rad/s^2 at the motor shaft
+    deceleration: np.ndarray  # rad/s^2 at the motor shaft
+    t_accel: np.ndarray  # s
+    t_const: np.ndarray  # s
+    t_decel: np.ndarray  # s
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.t_accel + self.t_const + self.t_decel
+
+
+class DutyCycleEvaluator:
+    """RMS and peak motor torque of stepper axes over one behavior cycle.
+
+    Moves and dwell times come from the earliest-start schedule of the
+    behavior. The torque of an axis is ``J * alpha + friction`` while it moves
+    plus the static torque over the whole cycle, where ``J`` is the rotor
+    inertia plus the load reflected through the transmission chain. The
+    profile is piecewise constant, so the RMS torque is integrated exactly
+    per move phase; all candidate motors are evaluated as one array.
+    """
+
+    # load to rotor inertia ratio above which a stepper tends to lose steps
+    MAX_INERTIA_RATIO = 10.0
+
+    @classmethod
+    def evaluate(cls,
+                 behavior: BehaviorSummary,
+                 axes: dict[BaseActuator, AxisLoad],
+                 catalog: MotorCatalog,
+                 ) -> dict[BaseActuator, DutyCycleReport]:
+        schedule, moves = cls._collect_moves(behavior, axes)
+        return {actuator: cls._evaluate_axis(schedule.cycle_time, moves[actuator],
+                                             cls._get_reflected_inertia(actuator, axis),
+                                             axis, catalog)
+                for actuator, axis in axes.items()}
+
+    @classmethod
+    def get_torque_profile(cls,
+                           behavior: BehaviorSummary,
+                           actuator: BaseActuator,
+                           axis: AxisLoad,
+                           catalog: MotorCatalog,
+                           sample_time: float = 1e-3,  # s
+                           ) -> TorqueProfile:
+        schedule, moves = cls._collect_moves(behavior, {actuator: axis})
+        moves = moves[actuator]
+        time = np.arange(0.0, schedule.cycle_time, sample_time)
+
+        # 各移動の加減速の切り替わりを階段関数の変化量として集計し、累積和で全サンプルを求める
+        move_index = np.full(len(schedule.labels), -1)
+        move_index[moves.nodes] = np.arange(len(moves.nodes))
+        event_times = []
+        alpha_steps = []
+        friction_steps = []
+        for chunk in schedule.iter_chunks():
+            index = move_index[chunk.node]
+            mask = index >= 0
+            index = index[mask]
+            start = chunk.start[mask]
+            direction = moves.directions[index]
+            accel_end = start + moves.t_accel[index]
+            decel_start = accel_end + moves.t_const[index]
+            end = decel_start + moves.t_decel[index]
+            acceleration = direction * moves.acceleration[index]
+            deceleration = direction * moves.deceleration[index]
+            friction = direction * axis.friction_torque
+
+            event_times += [start, accel_end, decel_start, end]
+            alpha_steps += [acceleration, -acceleration, -deceleration, deceleration]
+            friction_steps += [friction, np.zeros_like(start), np.zeros_like(start), -friction]
+
+        alpha = np.zeros_like(time)
+        friction = np.zeros_like(time)
+        if event_times:
+            samples = np.searchsorted(time, np.concatenate(event_times))
+            alpha = np.cumsum(np.bincount(samples, np.concatenate(alpha_steps),
+                                          minlength=len(time) + 1)[:len(time)])
+            friction = np.cumsum(np.bincount(samples, np.concatenate(friction_steps),
+                                             minlength=len(time) + 1)[:len(time)])
+
+        inertia = catalog.rotor_inertia + cls._get_reflected_inertia(actuator, axis)
+        torque = np.multiply.outer(inertia, alpha) + (friction + axis.static_torque)
+        return TorqueProfile(time, torque)
+
+    @staticmethod
+    def _get_si_radian_per_unit(actuator: BaseActuator, axis: AxisLoad) -> float:
+        # rad at the motor per m (linear) or per rad (rotary) at the output
+        unit = actuator.DISTANCE_UNIT
+        si_unit = Units.M if unit.dimension == Dimension.LENGTH else Units.RADIAN
+        return axis.drive.motor_radian_per_unit / unit.get_factor(si_unit)
+
+    @classmethod
+    def _get_reflected_inertia(cls, actuator: BaseActuator, axis: AxisLoad) -> float:
+        return axis.load / cls._get_si_radian_per_unit(actuator, axis) ** 2 \
+            + axis.transmission_inertia
+
+    @staticmethod
+    def _collect_moves(behavior: BehaviorSummary,
+                       axes: dict[BaseActuator, AxisLoad],
+                       ) -> tuple[Schedule, dict[BaseActuator, _AxisMoves]]:
+        if behavior.subroutine_root_element is None:
+            raise ValueError("Behavior has no flow to evaluate.")
+
+        graph = flowchart.ElementsCompiler.lower(behavior.subroutine_root_element)
+        schedule = BehaviorScheduler.schedule_snapshot(BehaviorSnapshot.from_graph(graph))
+        template = schedule.template
+
+        # ループ内の移動は展開せず、1 サイクルでの実行回数を持つ
+        rows = {actuator: [] for actuator in axes}
+        for i, node in enumerate(template.node.tolist()):
+            source = graph.get_source(node)
+            actuator = getattr(source, "actuator", None)
+            if actuator not in rows:
+                continue
+            move = source.move
+            profile = actuator.calculate_profile(move.distance, move.velocity,
+                                                 move.acceleration, move.deceleration)
+            radian = axes[actuator].drive.motor_radian_per_unit
+            rows[actuator].append((
+                node,
+                schedule.get_iterations(int(template.iteration[i])),
+                -1.0 if move.target_position < move.start_position else 1.0,
+                profile.acceleration * radian,
+                profile.deceleration * radian,
+                profile.t_accel,
+                profile.t_const,
+                profile.t_decel,
+            ))
+
+        # 移動のない軸は動的トルクが 0 と誤って報告されるため、エラーにする
+        missing = [actuator for actuator, actuator_rows in rows.items() if not actuator_rows]
+        if missing:
+            raise ValueError(
+                f"Behavior {behavior.label!r} has no moves of the actuator(s) "
+                f"{', '.join(type(actuator).__name__ for actuator in missing)} given in axes; "
+                "the actuators must be the ones used by the actions of the behavior.")
+
+        moves = {}
+        for actuator, actuator_rows in rows.items():
+            columns = np.array(actuator_rows, dtype=float).reshape(-1, 8).T
+            moves[actuator] = _AxisMoves(columns[0].astype(np.int64), *columns[1:])
+        return schedule, moves
+
+    @classmethod
+    def _evaluate_axis(cls,
+                       cycle_time: float,
+                       moves: _AxisMoves,
+                       reflected_inertia: float,
+                       axis: AxisLoad,
+                       catalog: MotorCatalog,
+                       ) -> DutyCycleReport:
+        inertia = catalog.rotor_inertia + reflected_inertia  # (candidates,)
+        friction = axis.friction_torque
+        static = axis.static_torque
+        counts = moves.counts
+        directions = moves.directions
+
+        # 移動中のトルク s * (J * alpha + f) + L の 2 乗を加速・等速・減速区間ごとに積分する
+        alpha_squared = np.sum(counts * (moves.acceleration ** 2 * moves.t_accel
+                                         + moves.deceleration ** 2 * moves.t_decel))
+        alpha_integral = counts * (moves.acceleration * moves.t_accel
+                                   - moves.deceleration * moves.t_decel)
+        durations = moves.durations
+        moving_time = float(np.sum(counts * durations))
+
+        integral = (inertia ** 2 * alpha_squared
+                    + 2 * inertia * friction * np.sum(alpha_integral)
+                    + friction ** 2 * moving_time
+                    + 2 * static * (inertia * np.sum(directions * alpha_integral)
+                                    + friction * np.sum(counts * directions * durations))
+                    + static ** 2 * max(cycle_time, moving_time))
+        rms_torque = np.sqrt(np.maximum(integral, 0.0) / cycle_time) if cycle_time > 0 \
+            else np.abs(np.full_like(inertia, static))
+
+        # ピークは各移動の加速・等速・減速区間と停止中のうち最大のもの
+        peaks = [np.full_like(inertia, abs(static))]
+        if len(counts):
+            peaks += [
+                np.abs(directions * (np.multiply.outer(inertia, moves.acceleration) + friction)
+                       + static).max(axis=1),
+                np.abs(directions * (friction - np.multiply.outer(inertia, moves.deceleration))
+                       + static).max(axis=1),
+                np.full_like(inertia, np.max(np.abs(directions * friction + static))),
+            ]
+        peak_torque = np.max(peaks, axis=0)
+
+        inertia_ratio = reflected_inertia / catalog.rotor_inertia
+        with np.errstate(divide="ignore"):
+            torque_margin = catalog.rated_torque / rms_torque
+        acceptable = ((rms_torque <= catalog.rated_torque)
+                      & (peak_torque <= catalog.holding_torque)
+                      & (inertia_ratio <= cls.MAX_INERTIA_RATIO))
+
+        return DutyCycleReport(cycle_time, moving_time, int(np.sum(counts)), reflected_inertia,
+                               rms_torque, peak_torque, inertia_ratio, torque_margin, acceptable)
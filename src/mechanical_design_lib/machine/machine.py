@@ -1,5 +1,8 @@
+import dataclasses
+import os
+
 import mechanical_design_lib.utils.flowchart as flowchart
-from mechanical_design_lib.actuator.actuator import BaseActuator
+from mechanical_design_lib.actuator.actuator import BaseActuator, ActuatorMove
 
 from mechanical_design_lib.utils.util import DirectoryFactory
 from mechanical_design_lib.utils.logger import LoggerFactory
@@ -8,6 +11,8 @@ logger = LoggerFactory.get_logger(__name__)
 
 
 class BehaviorSummary(flowchart.Subroutine):
+    __slots__ = ('_description', '_takt_time')
+
     def __init__(self, description: str,
                  root_element: flowchart.FlowchartElement = None,
                  is_parse_subroutine: bool = False,
@@ -44,30 +49,62 @@ class BehaviorSummary(flowchart.Subroutine):
 
 
 class BehaviorDetailAction(flowchart.Action):
-    # def __init__(self, action: str, actuator: BaseActuator = None):
-    #     super().__init__(action)
-    #     self._actuator = actuator
+    __slots__ = ('_takt_time', '_actuator', '_move', '_cached_revision', '_cached_takt_time')
 
     def __init__(self,
                  action: str,
                  takt_time: float = None,
+                 actuator: BaseActuator = None,
+                 move: ActuatorMove = None,
                  ):
         super().__init__(action)
         self._takt_time = takt_time
 
+        if (actuator is None) != (move is None):
+            raise ValueError("Actuator and move must be set together.")
+        if actuator is not None and takt_time is not None:
+            raise ValueError("Takt time must not be set together with actuator and move; "
+                             "it is calculated from the move.")
+        self._actuator = actuator
+        self._move = move
+
+        # memoized move time, valid while the actuator revision is unchanged
+        self._cached_revision = None
+        self._cached_takt_time = None
+
+    @property
+    def actuator(self) -> BaseActuator | None:
+        return self._actuator
+
+    @property
+    def move(self) -> ActuatorMove | None:
+        return self._move
+
     @property
     def label(self):
-        return f"{self._label}\n (takt time: {self._takt_time})"
+        return f"{self._label}\n (takt time: {self._resolve_takt_time()})"
+
+    def _resolve_takt_time(self) -> float:
+        if self._actuator is None:
+            return self._takt_time
+
+        if self._cached_revision != self._actuator.revision:
+            self._cached_takt_time = self._actuator.get_move_time(self._move)
+            self._cached_revision = self._actuator.revision
+        return self._cached_takt_time
 
     def get_takt_time(self) -> float:
-        if self._takt_time is None:
-            logger.warn(f"Warning: Takt time is not set for {self.label}")
+        takt_time = self._resolve_takt_time()
+        if takt_time is None:
+            logger.warning("Warning: Takt time is not set for %s", self._label)
 
-        logger.info(f"Action: {self._label}, takt time: {self._takt_time}")
-        return self._takt_time
+        logger.info("Action: %s, takt time: %s", self._label, takt_time)
+        return takt_time
 
 
 class BehaviorParallel(flowchart.Parallel):
+    __slots__ = ()
+
     def __init__(self, description: str):
         super().__init__(description)
 
@@ -87,11 +124,13 @@ class BehaviorParallel(flowchart.Parallel):
 
             takt_time = max(takt_time, element_takt_time)
 
-        logger.info(f"Parallel: {self.label}, max takt time: {takt_time}")
+        logger.info("Parallel: %s, max takt time: %s", self._label, takt_time)
         return takt_time
 
 
 class BehaviorLoop(flowchart.Loop):
+    __slots__ = ()
+
     def __init__(self, description: str, loop_count: int):
         super().__init__(description, loop_count)
 
@@ -108,17 +147,23 @@ class BehaviorLoop(flowchart.Loop):
                 takt_time += tt
 
         takt = takt_time * self._loop_count
-        logger.info(f"Loop: {self.label}, takt time: {
-            takt_time} x {self._loop_count} = {takt}")
+        logger.info("Loop: %s, takt time: %s x %s = %s",
+                    self._label, takt_time, self._loop_count, takt)
         return takt
 
 
 class BehaviorDecision(flowchart.Decision):
+    __slots__ = ('_default_yes',)
+
     def __init__(self, description: str, default_yes: bool = True):
         super().__init__(description)
 
         self._default_yes = default_yes
 
+    def get_fingerprint_fields(self):
+        # the default branch decides the active edges of the lowered graph
+        return (self._default_yes,)
+
     def get_takt_time(self) -> float:
         takt_time = 0
 
@@ -138,8 +183,8 @@ class BehaviorDecision(flowchart.Decision):
                         continue
                     takt_time += tt
 
-        logger.info(f"Decision: {self.label}, Value: {
-            "Yes" if self._default_yes else "No"}, takt time: {takt_time}")
+        logger.info("Decision: %s, Value: %s, takt time: %s",
+                    self._label, "Yes" if self._default_yes else "No", takt_time)
         return takt_time
 
 
@@ -148,6 +193,14 @@ class MachineUnit:
         self._name = name
         self._behaviors = {}
 
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def behaviors(self) -> dict[str, BehaviorSummary]:
+        return self._behaviors
+
     def add_behavior(self, behavior_name: str, behavior: BehaviorSummary):
         if behavior_name in self._behaviors:
             raise ValueError(f"Behavior {behavior_name} already exists.")
@@ -161,9 +214,19 @@ class MachineUnit:
         return self._behaviors[behavior_name]
 
 
+@dataclasses.dataclass(frozen=True)
+class BehaviorReference:
+    unit: str
+    behavior: str
+    # element of the behavior flow, None for the whole behavior
+    element: flowchart.FlowchartElement | None = None
+
+
 class Machine:
     def __init__(self):
         self.units = {}
+        # (before, after): after cannot start until before has finished
+        self.dependencies = []
 
     def add_unit(self, unit: MachineUnit):
         if unit._name in self.units:
@@ -172,6 +235,44 @@ class Machine:
         self.units[unit._name] = unit
         return self
 
+    def get_unit(self, unit_name: str) -> MachineUnit:
+        if unit_name not in self.units:
+            raise ValueError(f"Unit {unit_name} does not exist.")
+        return self.units[unit_name]
+
+    def add_dependency(self, before: BehaviorReference, after: BehaviorReference):
+        # ユニット間の受け渡し (例: A の「部品を置く」が終わってから B の「クランプ」)
+        for reference in (before, after):
+            self.get_unit(reference.unit).get_behavior(reference.behavior)
+        if before == after:
+            raise ValueError("Dependency must connect two different elements.")
+
+        self.dependencies.append((before, after))
+        return self
+
+    def draw_behaviors(self,
+                       directory=None,
+                       format: str = 'png',
+                       max_workers: int | None = None,
+                       ) -> dict[str, str]:
+        directory = directory or DirectoryFactory.get_directory(
+            DirectoryFactory.DirectoryName.FIGURE)
+
+        flowcharts = {}
+        for unit_name, unit in self.units.items():
+            for behavior_name, behavior in unit.behaviors.items():
+                # タクトタイムのみの振る舞いにはフローチャートがない
+                if behavior.subroutine_root_element is None:
+                    continue
+                # ユニットごとのディレクトリに分け、名前の組み合わせによる衝突を避ける
+                unit_directory = os.path.join(directory, unit_name)
+                os.makedirs(unit_directory, exist_ok=True)
+                filename = os.path.join(unit_directory, behavior_name)
+                flowcharts[filename] = flowchart.Flowchart(
+                    behavior.subroutine_root_element)
+
+        return flowchart.Flowchart.draw_many(flowcharts, format=format, max_workers=max_workers)
+
 
 if __name__ == "__main__":
     # フローチャートの作成
@@ -264,4 +365,4 @@ if __name__ == "__main__":
             view=False,
             )
 
-    logger.info(f"takt time: {behavior_summary.get_takt_time()}")
+    logger.info("takt time: %s", behavior_summary.get_takt_time())
@@ -0,0 +1,342 @@
+import csv
+import dataclasses
+import pathlib
+
+import numpy as np
+
+from mechanical_design_lib.utils.flowchart import NodeKind
+from mechanical_design_lib.machine.machine import BehaviorSummary
+from mechanical_design_lib.machine.analysis import BehaviorSnapshot, TIMED_NODE_KINDS
+
+
+@dataclasses.dataclass
+class ScheduleRows:
+    node: np.ndarray  # int64, indexes Schedule.labels
+    lane: np.ndarray  # int32
+    start: np.ndarray  # float64, s
+    end: np.ndarray  # float64, s
+    iteration: np.ndarray  # int64, flattened iteration index over all enclosing loops
+
+    def __len__(self) -> int:
+        return len(self.node)
+
+    @classmethod
+    def concatenate(cls, chunks: list["ScheduleRows"]) -> "ScheduleRows":
+        if not chunks:
+            empty = np.zeros(0)
+            return cls(empty.astype(np.int64), empty.astype(np.int32), empty, empty,
+                       empty.astype(np.int64))
+        return cls(*(np.concatenate([getattr(chunk, field.name) for chunk in chunks])
+                     for field in dataclasses.fields(cls)))
+
+
+class Schedule:
+    """Earliest-start schedule of a behavior.
+
+    Only the first iteration of every loop is stored. Loop iterations are
+    materialized on request, optionally restricted to a time window, so the
+    memory used by the schedule itself does not depend on the loop counts.
+    A schedule read by ``load`` holds the saved rows already materialized.
+    """
+
+    def __init__(self,
+                 cycle_time: float,  # s
+                 labels: list[str],  # per node of the snapshot
+                 template: ScheduleRows,  # first iteration, ``iteration`` holds the innermost loop
+                 loop_counts: dict[int, int],  # loop start node -> iterations
+                 loop_periods: dict[int, float],  # loop start node -> s per iteration
+                 loop_parents: dict[int, int],  # loop start node -> enclosing loop start, -1
+                 ):
+        self._cycle_time = cycle_time
+        self._labels = labels
+        self._template = template
+        self._loop_counts = loop_counts
+        self._loop_periods = loop_periods
+        self._loop_parents = loop_parents
+
+        self._rows = None
+        self._is_loaded = False  # rows read by load, no loop structure
+
+    @property
+    def cycle_time(self) -> float:
+        return self._cycle_time
+
+    @property
+    def labels(self) -> list[str]:
+        return self._labels
+
+    @property
+    def template(self) -> ScheduleRows:
+        return self._template
+
+    def _get_loop_chain(self, loop_start: int) -> list[int]:
+        # outermost loop first
+        chain = []
+        while loop_start >= 0:
+            chain.append(loop_start)
+            loop_start = self._loop_parents[loop_start]
+        return chain[::-1]
+
+    def get_iterations(self, loop_start: int) -> int:
+        iterations = 1
+        for loop in self._get_loop_chain(loop_start):
+            iterations *= self._loop_counts[loop]
+        return iterations
+
+    def __len__(self) -> int:
+        if self._is_loaded:
+            return len(self._rows)
+        loops, counts = np.unique(self._template.iteration, return_counts=True)
+        return sum(count * self.get_iterations(loop)
+                   for loop, count in zip(loops.tolist(), counts.tolist()))
+
+    def iter_chunks(self,
+                    start_time: float | None = None,  # s
+                    end_time: float | None = None,  # s
+                    max_rows: int = 65536,
+                    ):
+        start_time = -np.inf if start_time is None else start_time
+        end_time = np.inf if end_time is None else end_time
+
+        if self._is_loaded:
+            rows = self._rows
+            selected = np.flatnonzero((rows.start <= end_time) & (rows.end >= start_time))
+            for begin in range(0, len(selected), max_rows):
+                index = selected[begin:begin + max_rows]
+                yield ScheduleRows(rows.node[index], rows.lane[index], rows.start[index],
+                                   rows.end[index], rows.iteration[index])
+            return
+
+        template = self._template
+        for loop_start in np.unique(template.iteration).tolist():
+            rows = np.flatnonzero(template.iteration == loop_start)
+            group = ScheduleRows(template.node[rows], template.lane[rows],
+                                 template.start[rows], template.end[rows],
+                                 template.iteration[rows])
+            yield from self._iter_group(group, self._get_loop_chain(loop_start),
+                                        start_time, end_time, max_rows)
+
+    def _iter_group(self, group: ScheduleRows, chain: list[int],
+                    start_time: float, end_time: float, max_rows: int):
+        first_start = float(group.start.min())
+        last_end = float(group.end.max())
+
+        # extent of the group across all iterations of the loops inside each level
+        extents = [last_end]
+        for loop in chain[::-1]:
+            extents.append(extents[-1] + (self._loop_counts[loop] - 1) * self._loop_periods[loop])
+        extents = extents[::-1][1:]
+
+        strides = [1]
+        for loop in chain[:0:-1]:
+            strides.append(strides[-1] * self._loop_counts[loop])
+        strides = strides[::-1]
+
+        def iterate_level(level: int, offset: float, iteration: int):
+            if level == len(chain):
+                yield offset, iteration, np.zeros(1), np.zeros(1, dtype=np.int64)
+                return
+
+            loop = chain[level]
+            count = self._loop_counts[loop]
+            period = self._loop_periods[loop]
+            extent = extents[level]
+            if period > 0:
+                first = int(min(max(np.ceil((start_time - extent - offset) / period), 0), count))
+                last = int(max(min(np.floor((end_time - first_start - offset) / period), count - 1), -1))
+            elif offset + first_start < end_time and offset + extent > start_time:
+                first, last = 0, count - 1
+            else:
+                return
+
+            if level == len(chain) - 1:
+                # innermost level: iterations are generated as vectors
+                step = max(1, max_rows // len(group))
+                for begin in range(first, last + 1, step):
+                    k = np.arange(begin, min(begin + step, last + 1))
+                    yield offset, iteration, k * period, k * strides[level]
+            else:
+                for k in range(first, last + 1):
+                    yield from iterate_level(level + 1, offset + k * period,
+                                             iteration + k * strides[level])
+
+        for offset, iteration, local_offsets, local_iterations in iterate_level(0, 0.0, 0):
+            offsets = offset + local_offsets
+            iterations = len(offsets)
+            start = np.add.outer(group.start, offsets).ravel()
+            end = np.add.outer(group.end, offsets).ravel()
+            mask = (start <= end_time) & (end >= start_time)
+            chunk = ScheduleRows(
+                np.repeat(group.node, iterations)[mask],
+                np.repeat(group.lane, iterations)[mask],
+                start[mask],
+                end[mask],
+                np.tile(iteration + local_iterations, len(group))[mask],
+            )
+            if len(chunk):
+                yield chunk
+
+    def materialize(self,
+                    start_time: float | None = None,  # s
+                    end_time: float | None = None,  # s
+                    ) -> ScheduleRows:
+        return ScheduleRows.concatenate(list(self.iter_chunks(start_time, end_time)))
+
+    @property
+    def rows(self) -> ScheduleRows:
+        if self._rows is None:
+            self._rows = self.materialize()
+        return self._rows
+
+    @property
+    def node(self) -> np.ndarray:
+        return self.rows.node
+
+    @property
+    def lane(self) -> np.ndarray:
+        return self.rows.lane
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.rows.start
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.rows.end
+
+    @property
+    def iteration(self) -> np.ndarray:
+        return self.rows.iteration
+
+    def save(self, path) -> pathlib.Path:
+        path = pathlib.Path(path)
+        if path.suffix == ".csv":
+            self._save_csv(path)
+        else:
+            rows = self.materialize()
+            np.savez_compressed(path, cycle_time=self._cycle_time, labels=np.array(self._labels),
+                                node=rows.node, lane=rows.lane, start=rows.start, end=rows.end,
+                                iteration=rows.iteration)
+            if path.suffix != ".npz":
+                path = path.with_name(path.name + ".npz")
+        return path
+
+    def _save_csv(self, path: pathlib.Path):
+        labels = np.array(self._labels, dtype=object)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["node", "label", "lane", "start", "end", "iteration"])
+            for chunk in self.iter_chunks():
+                writer.writerows(zip(chunk.node.tolist(), labels[chunk.node],
+                                     chunk.lane.tolist(), chunk.start.tolist(),
+                                     chunk.end.tolist(), chunk.iteration.tolist()))
+
+    @classmethod
+    def load(cls, path) -> "Schedule":
+        with np.load(path) as data:
+            rows = ScheduleRows(data["node"], data["lane"], data["start"], data["end"],
+                                data["iteration"])
+            schedule = cls(float(data["cycle_time"]), data["labels"].tolist(), rows, {}, {}, {})
+        schedule._rows = rows
+        schedule._is_loaded = True
+        return schedule
+
+
+@dataclasses.dataclass
+class _Template:
+    """Schedule of the first iteration of every loop."""
+    cycle_time: float
+    node: np.ndarray
+    lane: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    loop_periods: dict[int, float]  # loop start node -> duration of one iteration
+
+
+class BehaviorScheduler:
+    @classmethod
+    def schedule(cls, behavior: BehaviorSummary) -> Schedule:
+        return cls.schedule_snapshot(BehaviorSnapshot.from_behavior(behavior))
+
+    @classmethod
+    def schedule_snapshot(cls, snapshot: BehaviorSnapshot) -> Schedule:
+        template = cls._build_template(snapshot)
+        loop_starts = template.loop_periods.keys()
+        return Schedule(
+            template.cycle_time,
+            snapshot.labels,
+            ScheduleRows(template.node, template.lane, template.start, template.end,
+                         snapshot.enclosing_loops[template.node]),
+            {loop: int(snapshot.loop_counts[loop]) for loop in loop_starts},
+            template.loop_periods,
+            {loop: int(snapshot.enclosing_loops[loop]) for loop in loop_starts},
+        )
+
+    @staticmethod
+    def _build_template(snapshot: BehaviorSnapshot) -> _Template:
+        # 前進パスで各ループの 1 回目の開始時刻を求める。
+        # ループ終端では本体 1 回分の長さに繰り返し回数を掛けて時刻を進める。
+        num_nodes = snapshot.num_nodes
+        kinds = snapshot.kinds.tolist()
+        durations = snapshot.durations.tolist()
+        offsets = snapshot.edge_offsets.tolist()
+        targets = snapshot.edge_targets.tolist()
+        active_edges = snapshot.active_edges.tolist()
+        partners = snapshot.partners.tolist()
+        loop_counts = snapshot.loop_counts.tolist()
+
+        has_predecessor = [False] * num_nodes
+        for target in targets:
+            has_predecessor[target] = True
+
+        active = [not has_predecessor[node] for node in range(num_nodes)]
+        start = [0.0] * num_nodes
+        finish = [0.0] * num_nodes
+        lane = [0 if active[node] else -1 for node in range(num_nodes)]
+        loop_periods = {}
+        next_lane = 1
+
+        for node in snapshot.topological_order.tolist():
+            if not active[node]:
+                continue
+
+            kind = kinds[node]
+            if kind == NodeKind.LOOP_END:
+                loop_start = partners[node]
+                period = start[node] - finish[loop_start]
+                loop_periods[loop_start] = period
+                finish[node] = finish[loop_start] + period * loop_counts[loop_start]
+            else:
+                finish[node] = start[node] + durations[node]
+            if kind == NodeKind.PARALLEL_END:
+                lane[node] = lane[partners[node]]
+
+            is_first_branch = True
+            for i in range(offsets[node], offsets[node + 1]):
+                if not active_edges[i]:
+                    continue
+                target = targets[i]
+                if not active[target] or finish[node] > start[target]:
+                    active[target] = True
+                    start[target] = finish[node]
+                if lane[target] < 0:
+                    if kind == NodeKind.PARALLEL_START and not is_first_branch:
+                        lane[target] = next_lane
+                        next_lane += 1
+                    else:
+                        lane[target] = lane[node]
+                    is_first_branch = False
+
+        rows = [node for node in range(num_nodes)
+                if active[node] and kinds[node] in TIMED_NODE_KINDS]
+        cycle_time = max((finish[node] for node in range(num_nodes) if active[node]),
+                         default=0.0)
+
+        return _Template(
+            cycle_time=cycle_time,
+            node=np.array(rows, dtype=np.int64),
+            lane=np.array([lane[node] for node in rows], dtype=np.int32),
+            start=np.array([start[node] for node in rows]),
+            end=np.array([finish[node] for node in rows]),
+            loop_periods=loop_periods,
+        )
@@ -0,0 +1,503 @@
+import collections
+import json
+import math
+import pathlib
+import struct
+
+import numpy as np
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.actuator.actuator import (
+    ActuatorMove, LinearActuator, RotaryActuator, ScrewActuator)
+from mechanical_design_lib.machine.machine import (
+    Machine, MachineUnit, BehaviorSummary, BehaviorDetailAction,
+    BehaviorParallel, BehaviorLoop, BehaviorDecision, BehaviorReference)
+
+
+FORMAT_NAME = "mechanical_design_lib.machine"
+FORMAT_VERSION = 1
+
+BINARY_MAGIC = b"MDLM"
+BINARY_SUFFIX = ".mdlm"
+JSON_SUFFIX = ".json"
+
+# Type codes are stored in the files; append new types, never reorder.
+ELEMENT_TYPES = [
+    flowchart.Action,
+    flowchart.Decision,
+    flowchart.Subroutine,
+    flowchart.Loop,
+    flowchart.Parallel,
+    flowchart.Input,
+    flowchart.Root,
+    flowchart.LoopStart,
+    flowchart.LoopEnd,
+    flowchart.Connector,
+    BehaviorSummary,
+    BehaviorDetailAction,
+    BehaviorParallel,
+    BehaviorLoop,
+    BehaviorDecision,
+]
+ACTUATOR_TYPES = [
+    LinearActuator,
+    RotaryActuator,
+    ScrewActuator,
+]
+
+
+class ChildRole:
+    LOOP_CONTENT = 0
+    PARALLEL_ELEMENT = 1
+    YES_ROOT = 2
+    NO_ROOT = 3
+    YES_NEXT = 4
+    NO_NEXT = 5
+
+
+# column name -> numpy dtype of the binary variant
+NODE_COLUMNS = {
+    "type": "u1",
+    "label": "u4",
+    "takt_time": "f8",
+    "loop_count": "i8",
+    "default_yes": "u1",
+    "is_parse_subroutine": "u1",
+    "subgraph": "i4",
+    "actuator": "i4",
+    "move_start_position": "f8",
+    "move_target_position": "f8",
+    "move_velocity": "f8",
+    "move_acceleration": "f8",
+    "move_deceleration": "f8",
+}
+EDGE_COLUMNS = {
+    "edge_source": "u4",
+    "edge_target": "u4",
+    "edge_label": "u4",
+}
+CHILD_COLUMNS = {
+    "child_parent": "u4",
+    "child_role": "u1",
+    "child_element": "u4",
+}
+GRAPH_COLUMNS = {**NODE_COLUMNS, **EDGE_COLUMNS, **CHILD_COLUMNS}
+
+
+def _to_float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _to_optional(value: float | None) -> float | None:
+    if value is None or math.isnan(value):
+        return None
+    return float(value)
+
+
+class _ModelEncoder:
+    def __init__(self):
+        self._strings = {}
+        self._actuators = {}
+        self._actuator_rows = []
+        self._graphs = []
+        self._graph_indices = {}
+        self._element_indices = {}  # element -> (graph index, element index)
+
+    def add_string(self, text: str) -> int:
+        if text not in self._strings:
+            self._strings[text] = len(self._strings)
+        return self._strings[text]
+
+    def add_actuator(self, actuator) -> int:
+        if actuator is None:
+            return -1
+        if actuator not in self._actuators:
+            self._actuators[actuator] = len(self._actuator_rows)
+            self._actuator_rows.append({
+                "type": ACTUATOR_TYPES.index(type(actuator)),
+                "stroke": float(actuator.stroke),
+                "max_velocity": float(actuator.max_velocity),
+                "max_acceleration": float(actuator.max_acceleration),
+                "max_deceleration": float(actuator.max_deceleration),
+                "pitch": float(getattr(actuator, "pitch", math.nan)),
+                "screw_diameter": getattr(actuator, "screw_diameter", None),
+                "support_length": getattr(actuator, "support_length", None),
+                "mounting": getattr(actuator, "mounting", None),
+                "dn_limit": getattr(actuator, "dn_limit", None),
+            })
+        return self._actuators[actuator]
+
+    def add_graph(self, root_element) -> int:
+        if root_element is None:
+            return -1
+        if root_element in self._graph_indices:
+            return self._graph_indices[root_element]
+
+        graph_index = len(self._graphs)
+        self._graph_indices[root_element] = graph_index
+        self._graphs.append(None)
+
+        elements, indices = self._collect_elements(root_element)
+        for element, index in indices.items():
+            self._element_indices.setdefault(element, (graph_index, index))
+        columns = {name: [] for name in GRAPH_COLUMNS}
+        for element in elements:
+            self._encode_element(element, indices, columns)
+
+        self._graphs[graph_index] = columns
+        return graph_index
+
+    @staticmethod
+    def _collect_elements(root_element):
+        # サブルーチンの中身は別のグラフとして保存する
+        elements = []
+        indices = {}
+        queue = collections.deque([root_element])
+        while queue:
+            element = queue.popleft()
+            if element in indices:
+                continue
+            indices[element] = len(elements)
+            elements.append(element)
+
+            queue.extend(element.get_next_elements())
+            queue.extend(element.get_backlinks())
+            if not isinstance(element, flowchart.Subroutine):
+                queue.extend(element.get_structural_children())
+
+        return elements, indices
+
+    def _encode_element(self, element, indices, columns):
+        if type(element) not in ELEMENT_TYPES:
+            raise ValueError(
+                f"Element type {type(element).__name__} cannot be serialized.")
+
+        index = indices[element]
+        move = getattr(element, "move", None)
+
+        columns["type"].append(ELEMENT_TYPES.index(type(element)))
+        columns["label"].append(self.add_string(element._label))
+        columns["takt_time"].append(_to_float(getattr(element, "_takt_time", None)))
+        columns["loop_count"].append(getattr(element, "_loop_count", 0))
+        columns["default_yes"].append(int(getattr(element, "_default_yes", True)))
+        columns["is_parse_subroutine"].append(
+            int(getattr(element, "_is_parse_subroutine", False)))
+        columns["subgraph"].append(
+            self.add_graph(element.subroutine_root_element)
+            if isinstance(element, flowchart.Subroutine) else -1)
+        columns["actuator"].append(self.add_actuator(getattr(element, "actuator", None)))
+        columns["move_start_position"].append(_to_float(move and move.start_position))
+        columns["move_target_position"].append(_to_float(move and move.target_position))
+        columns["move_velocity"].append(_to_float(move and move.velocity))
+        columns["move_acceleration"].append(_to_float(move and move.acceleration))
+        columns["move_deceleration"].append(_to_float(move and move.deceleration))
+
+        for next_element, label in element.get_nextlinks():
+            columns["edge_source"].append(index)
+            columns["edge_target"].append(indices[next_element])
+            columns["edge_label"].append(self.add_string(label))
+
+        for role, child in self._get_children(element):
+            columns["child_parent"].append(index)
+            columns["child_role"].append(role)
+            columns["child_element"].append(indices[child])
+
+    @staticmethod
+    def _get_children(element):
+        if isinstance(element, flowchart.Loop):
+            children = [(ChildRole.LOOP_CONTENT, element._loop_content)]
+        elif isinstance(element, flowchart.Parallel):
+            children = [(ChildRole.PARALLEL_ELEMENT, child)
+                        for child in element._parallel_elements]
+        elif isinstance(element, flowchart.Decision):
+            children = [(ChildRole.YES_ROOT, element._yes_root_element),
+                        (ChildRole.NO_ROOT, element._no_root_element),
+                        (ChildRole.YES_NEXT, element._yes_next_element),
+                        (ChildRole.NO_NEXT, element._no_next_element)]
+        else:
+            children = []
+        return [(role, child) for role, child in children if child is not None]
+
+    def encode(self, machine: Machine) -> dict:
+        units = []
+        for unit_name, unit in machine.units.items():
+            behaviors = []
+            for behavior_name, behavior in unit.behaviors.items():
+                behaviors.append({
+                    "name": behavior_name,
+                    "label": behavior._label,
+                    "takt_time": behavior._takt_time,
+                    "is_parse_subroutine": behavior.is_parse_subroutine,
+                    "graph": self.add_graph(behavior.subroutine_root_element),
+                })
+            units.append({"name": unit_name, "behaviors": behaviors})
+
+        dependencies = [[self._encode_reference(reference) for reference in dependency]
+                        for dependency in machine.dependencies]
+
+        return {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "strings": list(self._strings),
+            "actuators": self._actuator_rows,
+            "units": units,
+            "dependencies": dependencies,
+            "graphs": self._graphs,
+        }
+
+    def _encode_reference(self, reference: BehaviorReference) -> list:
+        # [unit, behavior, graph index, element index], -1 for the whole behavior
+        graph_index, element_index = -1, -1
+        if reference.element is not None:
+            if reference.element not in self._element_indices:
+                raise ValueError(
+                    f"Dependency element {reference.element.label!r} is not part of the machine.")
+            graph_index, element_index = self._element_indices[reference.element]
+        return [reference.unit, reference.behavior, graph_index, element_index]
+
+
+class _ModelDecoder:
+    def __init__(self, header: dict, strings, get_columns):
+        self._header = header
+        self._strings = strings
+        self._get_columns = get_columns
+
+        self._actuators = [self._decode_actuator(row) for row in header["actuators"]]
+        self._graph_elements = {}
+
+    @staticmethod
+    def _decode_actuator(row: dict):
+        actuator_type = ACTUATOR_TYPES[row["type"]]
+        args = [row["stroke"], row["max_velocity"],
+                row["max_acceleration"], row["max_deceleration"]]
+        if actuator_type is ScrewActuator:
+            args.append(row["pitch"])
+            # files written before the screw speed limits have only the pitch
+            return ScrewActuator(*args, **{key: row[key] for key in
+                                           ("screw_diameter", "support_length", "mounting",
+                                            "dn_limit") if row.get(key) is not None})
+        return actuator_type(*args)
+
+    def decode(self) -> Machine:
+        machine = Machine()
+        for unit_row in self._header["units"]:
+            unit = MachineUnit(unit_row["name"])
+            for behavior_row in unit_row["behaviors"]:
+                behavior = BehaviorSummary(
+                    behavior_row["label"],
+                    is_parse_subroutine=behavior_row["is_parse_subroutine"],
+                    takt_time=behavior_row["takt_time"],
+                )
+                self._set_loader(behavior, behavior_row["graph"])
+                unit.add_behavior(behavior_row["name"], behavior)
+            machine.add_unit(unit)
+
+        # 依存関係が要素を参照する場合のみ、そのグラフを読み込む
+        for before, after in self._header.get("dependencies", []):
+            machine.add_dependency(self._decode_reference(before),
+                                   self._decode_reference(after))
+        return machine
+
+    def _decode_reference(self, row: list) -> BehaviorReference:
+        unit_name, behavior_name, graph_index, element_index = row
+        element = None
+        if element_index >= 0:
+            element = self.get_graph_elements(graph_index)[element_index]
+        return BehaviorReference(unit_name, behavior_name, element)
+
+    def _set_loader(self, subroutine, graph_index: int):
+        if graph_index >= 0:
+            subroutine.set_subroutine_loader(
+                lambda: self.get_graph_root(graph_index))
+
+    def get_graph_root(self, graph_index: int):
+        return self.get_graph_elements(graph_index)[0]
+
+    def get_graph_elements(self, graph_index: int) -> list:
+        if graph_index not in self._graph_elements:
+            self._graph_elements[graph_index] = self._decode_graph(graph_index)
+        return self._graph_elements[graph_index]
+
+    def _decode_graph(self, graph_index: int):
+        columns = self._get_columns(graph_index)
+        strings = self._strings
+
+        elements = [self._decode_element(columns, i) for i in range(len(columns["type"]))]
+
+        for source, target, label in zip(columns["edge_source"],
+                                         columns["edge_target"],
+                                         columns["edge_label"]):
+            elements[source].add_next(elements[target], strings[label])
+
+        for parent, role, child in zip(columns["child_parent"],
+                                       columns["child_role"],
+                                       columns["child_element"]):
+            parent, child = elements[parent], elements[child]
+            if role == ChildRole.LOOP_CONTENT:
+                parent.set_loop_content(child)
+            elif role == ChildRole.PARALLEL_ELEMENT:
+                parent.add_parallel_element(child)
+            elif role == ChildRole.YES_ROOT:
+                parent.add_yes(child)
+            elif role == ChildRole.NO_ROOT:
+                parent.add_no(child)
+            elif role == ChildRole.YES_NEXT:
+                parent.add_yes_next(child)
+            elif role == ChildRole.NO_NEXT:
+                parent.add_no_next(child)
+            else:
+                raise ValueError(f"Unknown child role {role}.")
+
+        return elements
+
+    def _decode_element(self, columns, i: int):
+        element_type = ELEMENT_TYPES[columns["type"][i]]
+        label = self._strings[columns["label"][i]]
+        takt_time = _to_optional(columns["takt_time"][i])
+
+        if element_type is BehaviorDetailAction:
+            actuator_index = int(columns["actuator"][i])
+            actuator = move = None
+            if actuator_index >= 0:
+                # the takt time is calculated from the move
+                takt_time = None
+                actuator = self._actuators[actuator_index]
+                move = ActuatorMove(
+                    float(columns["move_start_position"][i]),
+                    float(columns["move_target_position"][i]),
+                    _to_optional(columns["move_velocity"][i]),
+                    _to_optional(columns["move_acceleration"][i]),
+                    _to_optional(columns["move_deceleration"][i]),
+                )
+            return BehaviorDetailAction(label, takt_time, actuator, move)
+
+        if issubclass(element_type, flowchart.Subroutine):
+            is_parse_subroutine = bool(columns["is_parse_subroutine"][i])
+            if element_type is BehaviorSummary:
+                element = BehaviorSummary(label, is_parse_subroutine=is_parse_subroutine,
+                                          takt_time=takt_time)
+            else:
+                element = element_type(label, is_parse_subroutine=is_parse_subroutine)
+            self._set_loader(element, int(columns["subgraph"][i]))
+            return element
+
+        if issubclass(element_type, flowchart.Loop):
+            return element_type(label, int(columns["loop_count"][i]))
+        if element_type is BehaviorDecision:
+            return BehaviorDecision(label, bool(columns["default_yes"][i]))
+        return element_type(label)
+
+
+class MachineSerializer:
+    @classmethod
+    def dump(cls, machine: Machine, path, format: str | None = None) -> pathlib.Path:
+        path = pathlib.Path(path)
+        format = format or cls._get_format(path)
+        model = _ModelEncoder().encode(machine)
+
+        if format == "json":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(cls._to_json_model(model), f, indent=1, ensure_ascii=False)
+        elif format == "binary":
+            with open(path, "wb") as f:
+                f.write(cls._encode_binary(model))
+        else:
+            raise ValueError(f"Unknown format {format}.")
+        return path
+
+    @classmethod
+    def load(cls, path, format: str | None = None) -> Machine:
+        path = pathlib.Path(path)
+        format = format or cls._get_format(path)
+
+        if format == "json":
+            with open(path, encoding="utf-8") as f:
+                model = json.load(f)
+            cls._validate_header(model)
+            graphs = model["graphs"]
+            return _ModelDecoder(model, model["strings"], graphs.__getitem__).decode()
+        elif format == "binary":
+            return cls._decode_binary(path.read_bytes())
+        else:
+            raise ValueError(f"Unknown format {format}.")
+
+    @staticmethod
+    def _to_json_model(model: dict) -> dict:
+        # NaN is not valid JSON, unset values are written as null instead
+        graphs = [{name: [None if isinstance(value, float) and math.isnan(value) else value
+                          for value in values]
+                   for name, values in columns.items()}
+                  for columns in model["graphs"]]
+        actuators = [{name: None if isinstance(value, float) and math.isnan(value) else value
+                      for name, value in row.items()}
+                     for row in model["actuators"]]
+        return {**model, "graphs": graphs, "actuators": actuators}
+
+    @staticmethod
+    def _get_format(path: pathlib.Path) -> str:
+        return "json" if path.suffix == JSON_SUFFIX else "binary"
+
+    @staticmethod
+    def _validate_header(header: dict):
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError("File is not a machine model.")
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported machine model version {header.get('version')}.")
+
+    # Binary layout:
+    #   magic (4 bytes) | header length (u8) | JSON header | 8-byte aligned column blob
+    # The header keeps the metadata and the location of every column in the blob.
+    @staticmethod
+    def _encode_binary(model: dict) -> bytes:
+        blob = bytearray()
+
+        def add_column(values, dtype) -> list:
+            data = np.asarray(values, dtype=dtype).tobytes()
+            offset = len(blob)
+            blob.extend(data)
+            blob.extend(bytes(-len(blob) % 8))
+            return [dtype, offset, len(values)]
+
+        encoded_strings = [text.encode("utf-8") for text in model["strings"]]
+        string_offsets = np.zeros(len(encoded_strings) + 1, dtype="u8")
+        np.cumsum([len(text) for text in encoded_strings], out=string_offsets[1:])
+        strings = {
+            "offsets": add_column(string_offsets, "u8"),
+            "data": add_column(np.frombuffer(b"".join(encoded_strings), dtype="u1"), "u1"),
+        }
+
+        graphs = []
+        for columns in model["graphs"]:
+            graphs.append({name: add_column(columns[name], dtype)
+                           for name, dtype in GRAPH_COLUMNS.items()})
+
+        header = {**model, "strings": strings, "graphs": graphs}
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (-(len(header_bytes) + 12) % 8)
+
+        return BINARY_MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes + bytes(blob)
+
+    @classmethod
+    def _decode_binary(cls, data: bytes) -> Machine:
+        if data[:4] != BINARY_MAGIC:
+            raise ValueError("File is not a binary machine model.")
+        (header_length,) = struct.unpack_from("<Q", data, 4)
+        header = json.loads(data[12:12 + header_length])
+        cls._validate_header(header)
+        blob = memoryview(data)[12 + header_length:]
+
+        def get_column(column):
+            dtype, offset, count = column
+            return np.frombuffer(blob, dtype=dtype, count=count, offset=offset)
+
+        string_offsets = get_column(header["strings"]["offsets"])
+        string_data = get_column(header["strings"]["data"]).tobytes()
+        strings = [string_data[string_offsets[i]:string_offsets[i + 1]].decode("utf-8")
+                   for i in range(len(string_offsets) - 1)]
+
+        def get_columns(graph_index: int) -> dict:
+            graph = header["graphs"][graph_index]
+            return {name: get_column(column).tolist() for name, column in graph.items()}
+
+        return _ModelDecoder(header, strings, get_columns).decode()
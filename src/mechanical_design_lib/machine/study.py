@@ -0,0 +1,339 @@
+"""Sizing and takt studies described by a spec file (JSON or TOML).
+
+    {
+      "name": "pick_and_place",
+      "actuators": {
+        "x": {"type": "linear", "stroke": 600, "max_velocity": 120,
+              "max_acceleration": 2943, "max_deceleration": 2943},
+        "z": {"type": "linear", "stroke": 100, "time": 0.5},
+        "feed": {"type": "rotary", "stroke": 360, "max_velocity": 720,
+                 "max_acceleration": 3600, "max_deceleration": 3600,
+                 "stepper": {"phase": 2, "microstep_resolution": 8,
+                             "transmissions": [{"gears": [[1, 20, 5], [1, 60, 5]]}],
+                             "output": {"angle": true}}}
+      },
+      "units": {
+        "pick": {"behaviors": {"cycle": [
+          {"action": "move x", "actuator": "x", "to": 600},
+          {"action": "grip", "time": 0.3},
+          {"parallel": "lift", "branches": [[...], [...]]},
+          {"loop": "feed", "count": 3, "steps": [...]},
+          {"decision": "ok?", "default": "yes", "yes": [...], "no": [...]}
+        ]}}
+      },
+      "dependencies": [{"before": "pick/cycle/grip", "after": "place/cycle"}],
+      "variants": {"baseline": {}, "fast_x": {"actuators": {"x": {"max_velocity": 200}}}}
+    }
+
+An actuator with ``time`` instead of velocity and acceleration is sized with
+LinearActuatorFactory. ``stepper`` adds the pulse count over the stroke and the
+pulse rate at max velocity to the sizing results. A ``screw`` actuator needs
+``pitch`` and takes the optional ``screw_diameter``, ``support_length``,
+``mounting`` and ``dn_limit`` of ScrewActuator; its peak screw speed over the
+stroke is in the sizing results. A variant overrides parts of
+the spec; nested objects are merged, lists are replaced.
+"""
+import concurrent.futures
+import copy
+import dataclasses
+import json
+import os
+import pathlib
+import tomllib
+
+import numpy as np
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.actuator.actuator import (
+    ActuatorMove, LinearActuator, RotaryActuator, ScrewActuator, LinearActuatorFactory)
+from mechanical_design_lib.actuator.stepping_motor import SteppingMotor, SteppingMotorActuatorUnit
+from mechanical_design_lib.machine.analysis import MachineSnapshot
+from mechanical_design_lib.machine.batch import BatchEvaluator, ResultTable
+from mechanical_design_lib.machine.machine import (
+    Machine, MachineUnit, BehaviorSummary, BehaviorDetailAction,
+    BehaviorParallel, BehaviorLoop, BehaviorDecision, BehaviorReference)
+from mechanical_design_lib.power_transmission_component import (
+    rotary_power_transmission_component as rptc)
+from mechanical_design_lib.utils.exporter import Exporter
+from mechanical_design_lib.utils.unit import UnitType
+
+
+SIZING_COLUMNS = [
+    "variant", "actuator", "type", "stroke", "max_velocity", "max_acceleration",
+    "max_deceleration", "stroke_time", "reduction_ratio", "stroke_pulse", "max_pps",
+    "screw_rpm",
+]
+# optional keys of a screw actuator, see ScrewActuator
+SCREW_KEYS = ("screw_diameter", "support_length", "mounting", "dn_limit")
+ACTUATOR_TYPES = {
+    "linear": LinearActuator,
+    "rotary": RotaryActuator,
+    "screw": ScrewActuator,
+}
+
+
+def _merge(base: dict, override: dict) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class _MachineBuilder:
+    def __init__(self, spec: dict):
+        self._spec = spec
+        self._actuators = {}
+        self._steppers = {}
+        # (unit, behavior, action label) -> element, for dependencies on a step
+        self._elements = {}
+        self._positions = {}  # actuator -> position at the current step of the behavior
+
+    def build(self) -> Machine:
+        for name, actuator_spec in self._spec.get("actuators", {}).items():
+            self._actuators[name] = self._create_actuator(name, actuator_spec)
+
+        machine = Machine()
+        for unit_name, unit_spec in self._spec.get("units", {}).items():
+            unit = MachineUnit(unit_name)
+            for behavior_name, steps in unit_spec.get("behaviors", {}).items():
+                self._positions = {}
+                root = flowchart.Root("Start")
+                first, last = self._create_steps(steps, (unit_name, behavior_name))
+                first.add_from(root)
+                flowchart.Root("End").add_from(last)
+                unit.add_behavior(behavior_name, BehaviorSummary(
+                    behavior_name, root_element=root, is_parse_subroutine=True))
+            machine.add_unit(unit)
+
+        for dependency in self._spec.get("dependencies", []):
+            machine.add_dependency(self._get_reference(dependency["before"]),
+                                   self._get_reference(dependency["after"]))
+        return machine
+
+    def _create_actuator(self, name: str, spec: dict):
+        actuator_type = spec.get("type", "linear")
+        if actuator_type not in ACTUATOR_TYPES:
+            raise ValueError(f"actuators.{name}: unknown type {actuator_type!r}, "
+                             f"expected one of {list(ACTUATOR_TYPES)}.")
+
+        if "stepper" in spec:
+            self._steppers[name] = self._create_stepper(name, spec["stepper"])
+
+        if "time" in spec:
+            if actuator_type != "linear":
+                raise ValueError(f"actuators.{name}: sizing by time is only available "
+                                 "for linear actuators.")
+            sized = LinearActuatorFactory.create_linear_actuator(
+                spec["stroke"], spec["time"], spec.get("max_velocity"),
+                spec.get("max_acceleration"), spec.get("max_deceleration"))
+            # the factory returns sympy numbers
+            return LinearActuator(spec["stroke"], float(sized.max_velocity),
+                                  float(sized.max_acceleration), float(sized.max_deceleration))
+
+        arguments = [spec[key] for key in
+                     ("stroke", "max_velocity", "max_acceleration", "max_deceleration")]
+        if actuator_type == "screw":
+            arguments.append(spec["pitch"])
+            return ScrewActuator(*arguments, **{key: spec[key] for key in SCREW_KEYS
+                                                if key in spec})
+        return ACTUATOR_TYPES[actuator_type](*arguments)
+
+    @staticmethod
+    def _create_stepper(name: str, spec: dict) -> SteppingMotorActuatorUnit:
+        transmissions = []
+        for transmission in spec.get("transmissions", []):
+            if "gears" in transmission:
+                transmissions.append(rptc.SingleStageGears(
+                    [rptc.SpurGear(*gear) for gear in transmission["gears"]]))
+            elif "stages" in transmission:
+                transmissions.append(rptc.MultiStageGears(
+                    [rptc.SingleStageGears([rptc.SpurGear(*gear) for gear in stage])
+                     for stage in transmission["stages"]]))
+            else:
+                raise ValueError(f"actuators.{name}.stepper: transmission needs "
+                                 "'gears' or 'stages'.")
+
+        output = spec.get("output", {})
+        if output.get("angle"):
+            output_component = rptc.Pulley(0, distance_unit=UnitType.ANGLE)
+        elif "pulley" in output:
+            output_component = rptc.Pulley(output["pulley"])
+        elif "gear" in output:
+            output_component = rptc.SpurGear(*output["gear"])
+        else:
+            raise ValueError(f"actuators.{name}.stepper: output needs 'angle', 'pulley' "
+                             "or 'gear'.")
+
+        motor = SteppingMotor(spec.get("phase", 2), spec.get("microstep_resolution", 1))
+        return SteppingMotorActuatorUnit(transmissions, output_component, motor)
+
+    def _create_steps(self, steps: list[dict], key: tuple[str, str]):
+        if not steps:
+            raise ValueError(f"units.{key[0]}.behaviors.{key[1]}: steps must not be empty.")
+
+        first = last = None
+        for step in steps:
+            element = self._create_step(step, key)
+            if last is not None:
+                element.add_from(last)
+            first = first or element
+            last = element
+        return first, last
+
+    def _create_step(self, step: dict, key: tuple[str, str]):
+        if "parallel" in step:
+            element = BehaviorParallel(step["parallel"])
+            for branch in step["branches"]:
+                element.add_parallel_element(self._create_steps(branch, key)[0])
+        elif "loop" in step:
+            element = BehaviorLoop(step["loop"], loop_count=step["count"])
+            element.set_loop_content(self._create_steps(step["steps"], key)[0])
+        elif "decision" in step:
+            element = BehaviorDecision(step["decision"],
+                                       default_yes=step.get("default", "yes") == "yes")
+            element.add_yes(self._create_steps(step["yes"], key)[0])
+            element.add_no(self._create_steps(step["no"], key)[0])
+        elif "action" in step:
+            element = self._create_action(step, key)
+        else:
+            raise ValueError(f"units.{key[0]}.behaviors.{key[1]}: step needs 'action', "
+                             f"'parallel', 'loop' or 'decision': {step}")
+
+        label = step.get("action") or step.get("parallel") or step.get("loop") \
+            or step.get("decision")
+        self._elements[(*key, label)] = element
+        return element
+
+    def _create_action(self, step: dict, key: tuple[str, str]) -> BehaviorDetailAction:
+        if "actuator" not in step:
+            return BehaviorDetailAction(step["action"], takt_time=step.get("time"))
+
+        name = step["actuator"]
+        if name not in self._actuators:
+            raise ValueError(f"units.{key[0]}.behaviors.{key[1]}: unknown actuator {name!r}.")
+        # 開始位置を省略した場合は、この振る舞いでの直前の移動先から動く
+        start = step.get("from", self._positions.get(name, 0))
+        self._positions[name] = step["to"]
+        move = ActuatorMove(start, step["to"], step.get("velocity"),
+                            step.get("acceleration"), step.get("deceleration"))
+        return BehaviorDetailAction(step["action"], actuator=self._actuators[name], move=move)
+
+    def _get_reference(self, text: str) -> BehaviorReference:
+        # "unit/behavior" or "unit/behavior/step"
+        parts = text.split("/", 2)
+        if len(parts) < 2:
+            raise ValueError(f"dependencies: {text!r} must be 'unit/behavior[/step]'.")
+        if len(parts) == 2:
+            return BehaviorReference(*parts)
+        if tuple(parts) not in self._elements:
+            raise ValueError(f"dependencies: step {text!r} does not exist.")
+        return BehaviorReference(parts[0], parts[1], self._elements[tuple(parts)])
+
+    def get_sizing_rows(self, variant: str) -> list[tuple]:
+        rows = []
+        for name, actuator in self._actuators.items():
+            stepper = self._steppers.get(name)
+            profile = actuator.calculate_profile(actuator.stroke)
+            rows.append((
+                variant, name,
+                type(actuator).__name__,
+                float(actuator.stroke),
+                float(actuator.max_velocity),
+                float(actuator.max_acceleration),
+                float(actuator.max_deceleration),
+                profile.total_time,
+                np.nan if stepper is None else stepper.reduction_ratio,
+                np.nan if stepper is None else float(stepper.get_pulse(actuator.stroke)),
+                np.nan if stepper is None else float(stepper.get_pps(actuator.max_velocity)),
+                float(actuator.get_rpm(profile.velocity))
+                if isinstance(actuator, ScrewActuator) else np.nan,
+            ))
+        return rows
+
+
+def _build_variant(spec: dict) -> tuple:
+    # ワーカープロセスで実行される。sympy によるサイジングを含むため並列化する
+    builder = _MachineBuilder(spec)
+    machine = builder.build()
+    return builder.get_sizing_rows(spec.get("name", "")), MachineSnapshot.from_machine(machine)
+
+
+@dataclasses.dataclass
+class StudyResult:
+    sizing: ResultTable  # one row per variant and actuator
+    takt: ResultTable  # one row per variant, see BatchEvaluator
+
+    def save(self,
+             directory,
+             format: str = "csv",  # "csv" or "columnar"
+             compression: str | None = None,
+             ) -> dict[str, pathlib.Path]:
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # e.g. takt.csv.gz; the columnar format is a directory and keeps the plain name
+        suffix = ".csv" + Exporter.COMPRESSION_SUFFIXES[compression] if format == "csv" else ""
+        return {name: Exporter.export_table(table, directory / f"{name}{suffix}", compression)
+                for name, table in (("sizing", self.sizing), ("takt", self.takt))}
+
+
+class Study:
+    # variants built in the calling process when there are fewer than this
+    MIN_PARALLEL_VARIANTS = BatchEvaluator.MIN_PARALLEL_VARIANTS
+
+    def __init__(self, spec: dict):
+        self._spec = spec
+
+    @classmethod
+    def load(cls, path) -> "Study":
+        path = pathlib.Path(path)
+        if path.suffix == ".toml":
+            with open(path, "rb") as f:
+                return cls(tomllib.load(f))
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def name(self) -> str:
+        return self._spec.get("name", "study")
+
+    @property
+    def variants(self) -> list[str]:
+        return list(self._spec.get("variants") or {"baseline": {}})
+
+    def get_variant_spec(self, variant: str) -> dict:
+        overrides = (self._spec.get("variants") or {"baseline": {}})
+        if variant not in overrides:
+            raise ValueError(f"Variant {variant} does not exist.")
+        spec = _merge({key: value for key, value in self._spec.items() if key != "variants"},
+                      overrides[variant] or {})
+        spec["name"] = variant
+        return spec
+
+    def build(self, variant: str) -> Machine:
+        return _MachineBuilder(self.get_variant_spec(variant)).build()
+
+    def run(self,
+            variants: list[str] | None = None,
+            max_workers: int | None = None,
+            ) -> StudyResult:
+        variants = variants or self.variants
+        specs = [self.get_variant_spec(variant) for variant in variants]
+
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers == 1 or len(specs) < self.MIN_PARALLEL_VARIANTS:
+            results = [_build_variant(spec) for spec in specs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_build_variant, specs))
+
+        rows = [row for sizing_rows, _ in results for row in sizing_rows]
+        sizing = ResultTable({
+            name: np.array([row[i] for row in rows],
+                           dtype=object if name in ("variant", "actuator", "type") else float)
+            for i, name in enumerate(SIZING_COLUMNS)})
+        takt = BatchEvaluator.evaluate_snapshots(
+            variants, [snapshot for _, snapshot in results], max_workers)
+        return StudyResult(sizing, takt)
@@ -44,6 +44,10 @@ class OutputComponentBase:
     def pitch_diameter(self) -> float:
         return self._pitch_diameter
 
+    @property
+    def distance_unit(self) -> UnitType:
+        return self._distance_unit
+
 
 class Pulley(OutputComponentBase):
     def __init__(self,
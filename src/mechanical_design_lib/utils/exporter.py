@@ -0,0 +1,293 @@
+import abc
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import pathlib
+
+import numpy as np
+
+
+_OPENERS = {
+    None: open,
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+_SUFFIXES = {None: "", "gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+def _open(path, mode: str, compression: str | None):
+    return _OPENERS[compression](path, mode)
+
+
+class ColumnarWriter(abc.ABC):
+    """Writes a table chunk by chunk, so that memory does not depend on its length.
+
+    ``write`` takes a dict of equally long arrays, one per column, in the order
+    given at construction. Use as a context manager, or call ``close``.
+    """
+
+    def __init__(self,
+                 path,
+                 columns: list[str],
+                 compression: str | None = None,  # None, "gzip", "bz2" or "xz"
+                 ):
+        if compression not in _OPENERS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of "
+                             f"{list(_OPENERS)}.")
+        self._path = pathlib.Path(path)
+        self._columns = list(columns)
+        self._compression = compression
+        self._rows = 0
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def write(self, chunk: dict[str, np.ndarray]):
+        lengths = {len(chunk[name]) for name in self._columns}
+        if len(lengths) > 1:
+            raise ValueError("Columns of a chunk must have the same length.")
+        rows = lengths.pop() if lengths else 0
+        if rows:
+            self._write(chunk, rows)
+            self._rows += rows
+
+    @abc.abstractmethod
+    def _write(self, chunk: dict[str, np.ndarray], rows: int):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class CsvWriter(ColumnarWriter):
+    def __init__(self, path, columns: list[str], compression: str | None = None):
+        super().__init__(path, columns, compression)
+        self._file = io.TextIOWrapper(_open(self._path, "wb", compression),
+                                      encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self._columns)
+
+    def _write(self, chunk: dict[str, np.ndarray], rows: int):
+        self._writer.writerows(zip(*(np.asarray(chunk[name]).tolist() for name in self._columns)))
+
+    def close(self):
+        self._file.close()
+
+
+class BinaryColumnarWriter(ColumnarWriter):
+    """Directory with one raw file per column and a ``columns.json`` header.
+
+    Numeric columns are stored as little-endian arrays of their dtype, string
+    and object columns as UTF-8 text with an int64 end offset per row. Every
+    column is appended to its own file, so columns are never interleaved.
+    Uncompressed stores are read back as memory maps by ``read_columns``.
+    """
+
+    HEADER_FILE = "columns.json"
+    FORMAT = "mdl-columnar"
+    VERSION = 1
+
+    def __init__(self, path, columns: list[str], compression: str | None = None):
+        super().__init__(path, columns, compression)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._dtypes = {}
+        self._files = {}
+        self._text_ends = {}  # column -> bytes written to the text file
+
+    def _get_file_name(self, index: int, kind: str = "bin") -> str:
+        # 列名には '/' や ':' が含まれるため、ファイル名には番号を使う
+        return f"column_{index:03d}.{kind}{_SUFFIXES[self._compression]}"
+
+    def _get_file(self, index: int, kind: str = "bin"):
+        key = (index, kind)
+        if key not in self._files:
+            self._files[key] = _open(self._path / self._get_file_name(index, kind), "wb",
+                                     self._compression)
+        return self._files[key]
+
+    def _write(self, chunk: dict[str, np.ndarray], rows: int):
+        for index, name in enumerate(self._columns):
+            values = np.asarray(chunk[name])
+            if values.dtype.kind in "OUS":
+                self._write_text(index, name, values)
+                continue
+
+            values = values.astype(values.dtype.newbyteorder("<"), copy=False)
+            dtype = self._dtypes.setdefault(name, values.dtype.str)
+            if dtype != values.dtype.str:
+                raise ValueError(f"Column {name!r} changed dtype from {dtype} to "
+                                 f"{values.dtype.str}.")
+            self._get_file(index).write(np.ascontiguousarray(values).data)
+
+    def _write_text(self, index: int, name: str, values: np.ndarray):
+        if self._dtypes.setdefault(name, "text") != "text":
+            raise ValueError(f"Column {name!r} changed from numbers to text.")
+        encoded = [str(value).encode() for value in values.tolist()]
+        ends = np.cumsum([len(value) for value in encoded], dtype="<i8")
+        ends += self._text_ends.get(name, 0)
+        if len(ends):
+            self._text_ends[name] = int(ends[-1])
+
+        self._get_file(index).write(b"".join(encoded))
+        self._get_file(index, "end").write(ends.data)
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+        header = {
+            "format": self.FORMAT,
+            "version": self.VERSION,
+            "rows": self._rows,
+            "compression": self._compression,
+            "columns": [{"name": name,
+                         "dtype": self._dtypes.get(name, "<f8"),
+                         "file": self._get_file_name(index)}
+                        for index, name in enumerate(self._columns)],
+        }
+        # ヘッダは最後に書くため、書き込み途中のディレクトリは読み込めない
+        with open(self._path / self.HEADER_FILE, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=1)
+
+
+def read_columns(path, columns: list[str] | None = None) -> dict[str, np.ndarray]:
+    """Read a store written by BinaryColumnarWriter."""
+    path = pathlib.Path(path)
+    with open(path / BinaryColumnarWriter.HEADER_FILE, encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != BinaryColumnarWriter.FORMAT:
+        raise ValueError(f"{path} is not a columnar store.")
+
+    compression = header["compression"]
+    rows = header["rows"]
+
+    def read(file_name: str, dtype) -> np.ndarray:
+        file_path = path / file_name
+        # np.memmap cannot map an empty file, e.g. a column of empty strings
+        if rows == 0 or not file_path.exists() or file_path.stat().st_size == 0:
+            return np.zeros(0, dtype=dtype)
+        if compression is None:
+            return np.memmap(file_path, dtype=dtype, mode="r")
+        with _open(file_path, "rb", compression) as f:
+            return np.frombuffer(f.read(), dtype=dtype)
+
+    result = {}
+    for column in header["columns"]:
+        name = column["name"]
+        if columns is not None and name not in columns:
+            continue
+        if column["dtype"] != "text":
+            result[name] = read(column["file"], np.dtype(column["dtype"]))
+            continue
+
+        text = bytes(read(column["file"], np.uint8))
+        ends = read(column["file"].replace(".bin", ".end", 1), np.dtype("<i8")).tolist()
+        starts = [0] + ends[:-1]
+        values = np.empty(len(ends), dtype=object)
+        values[:] = [text[start:end].decode() for start, end in zip(starts, ends)]
+        result[name] = values
+    return result
+
+
+class Exporter:
+    """Streams result tables and chunked trajectories to CSV or the columnar format.
+
+    The format follows the path: ``.csv`` (optionally with a compression
+    suffix such as ``.csv.gz``) writes CSV, anything else a
+    BinaryColumnarWriter directory.
+    """
+
+    CHUNK_ROWS = 65536
+    COMPRESSION_SUFFIXES = _SUFFIXES
+
+    @staticmethod
+    def open_writer(path, columns: list[str], compression: str | None = None) -> ColumnarWriter:
+        path = pathlib.Path(path)
+        if ".csv" in path.suffixes:
+            if compression is None and path.suffix != ".csv":
+                # e.g. result.csv.gz
+                compression = next((name for name, suffix in _SUFFIXES.items()
+                                    if suffix and suffix == path.suffix), None)
+            return CsvWriter(path, columns, compression)
+        return BinaryColumnarWriter(path, columns, compression)
+
+    @classmethod
+    def export_table(cls,
+                     table,  # ResultTable, or any object with columns and __getitem__
+                     path,
+                     compression: str | None = None,
+                     chunk_rows: int | None = None,
+                     ) -> pathlib.Path:
+        chunk_rows = chunk_rows or cls.CHUNK_ROWS
+        columns = table.columns
+        rows = len(table[columns[0]]) if columns else 0
+
+        with cls.open_writer(path, columns, compression) as writer:
+            for start in range(0, rows, chunk_rows):
+                writer.write({name: table[name][start:start + chunk_rows] for name in columns})
+        return writer.path
+
+    @classmethod
+    def export_trajectories(cls,
+                            trajectories: dict,  # axis -> iterable of (channels, n) chunks
+                            path,
+                            channels: tuple[str, ...] = ("time", "velocity"),
+                            compression: str | None = None,
+                            ) -> pathlib.Path:
+        """Write several axes side by side.
+
+        Each axis yields chunks such as ``BaseActuator.iter_move_detail``: the
+        first channel is the time, shared by all axes, the others become columns
+        ``"<axis>:<channel>"``. All axes must use the same sampling interval and
+        chunk size. Axes that have finished are padded with NaN.
+        """
+        axes = list(trajectories)
+        columns = [channels[0]] + [f"{axis}:{channel}" for axis in axes for channel in channels[1:]]
+        iterators = {axis: iter(trajectories[axis]) for axis in axes}
+
+        with cls.open_writer(path, columns, compression) as writer:
+            while iterators:
+                chunks = {}
+                for axis in list(iterators):
+                    chunk = next(iterators[axis], None)
+                    if chunk is None:
+                        del iterators[axis]
+                    else:
+                        chunks[axis] = chunk
+                if not chunks:
+                    break
+
+                longest = max(chunks.values(), key=lambda chunk: chunk.shape[1])
+                rows = longest.shape[1]
+                columns_of_chunk = {channels[0]: longest[0]}
+                for axis in axes:
+                    chunk = chunks.get(axis)
+                    for row, channel in enumerate(channels[1:], start=1):
+                        if chunk is not None and chunk.shape[1] == rows:
+                            # 配列の行はそのまま渡し、コピーしない
+                            values = chunk[row]
+                        else:
+                            values = np.full(rows, np.nan)
+                            if chunk is not None:
+                                values[:chunk.shape[1]] = chunk[row]
+                        columns_of_chunk[f"{axis}:{channel}"] = values
+                writer.write(columns_of_chunk)
+        return writer.path
@@ -1,18 +1,78 @@
-from graphviz import Digraph
-import uuid
-
+import array
+import collections
+import concurrent.futures
 import copy
+import dataclasses
+import enum
+import hashlib
+import io
+import itertools
+import os
+import sys
+
+from mechanical_design_lib.utils.instrumentation import Instrumentation
+
+
+class NodeKind(enum.IntEnum):
+    ACTION = enum.auto()
+    DECISION = enum.auto()
+    SUBROUTINE = enum.auto()
+    INPUT = enum.auto()
+    ROOT = enum.auto()
+    LOOP_START = enum.auto()
+    LOOP_END = enum.auto()
+    CONNECTOR = enum.auto()
+    PARALLEL_START = enum.auto()
+    PARALLEL_END = enum.auto()
+
+
+_ELEMENT_IDS = itertools.count()
+
+
+def _intern(label):
+    return sys.intern(label) if type(label) is str else label
 
 
 class FlowchartElement:
+    # Links are kept as parallel element/label lists instead of per-edge tuples
+    __slots__ = ('_label', '_id', '_next_elements', '_next_labels', '_elements_backlinks')
+
+    # kind of the node this element is lowered to, None for structural elements
+    kind = None
+
     def __init__(self, label):
-        self._label = label
-        self._id = str(uuid.uuid4())
+        self._label = _intern(label)
+        self._id = next(_ELEMENT_IDS)
         self._next_elements = []
+        self._next_labels = []
         self._elements_backlinks = []
 
+    def __copy__(self):
+        # a copy is a new element: a fresh id keeps it apart from the original in the
+        # fingerprint, so lowered graphs cached for the original are not returned for it
+        element = type(self).__new__(type(self))
+        for name in self._get_attribute_names():
+            setattr(element, name, getattr(self, name))
+        element._id = next(_ELEMENT_IDS)
+        return element
+
+    def __deepcopy__(self, memo):
+        element = type(self).__new__(type(self))
+        memo[id(self)] = element
+        for name in self._get_attribute_names():
+            setattr(element, name, copy.deepcopy(getattr(self, name), memo))
+        element._id = next(_ELEMENT_IDS)
+        return element
+
+    def _get_attribute_names(self):
+        # slots of every class in the hierarchy, and the instance dict of unslotted subclasses
+        names = [name for klass in type(self).__mro__
+                 for name in getattr(klass, '__slots__', ()) if hasattr(self, name)]
+        return names + list(getattr(self, '__dict__', {}))
+
     def add_next(self, element, label=''):
-        self._next_elements.append((element, label))
+        self._next_elements.append(element)
+        self._next_labels.append(_intern(label))
         element.add_backlink(self)
         return self
 
@@ -20,9 +80,6 @@ class FlowchartElement:
         element.add_next(self, label)
         return self
 
-    def add_to_graph(self, graph):
-        raise NotImplementedError
-
     def add_backlink(self, element):
         self._elements_backlinks.append(element)
 
@@ -35,21 +92,25 @@ class FlowchartElement:
         return self._id
 
     def get_nextlinks(self):
+        return list(zip(self._next_elements, self._next_labels))
+
+    def get_next_elements(self):
         return self._next_elements
-        # return copy.deepcopy(self._next_elements)
 
     def get_backlinks(self):
         return self._elements_backlinks
         # return copy.deepcopy(self._elements_backlinks)
 
     def drop_nextlink(self, element):
-        self._next_elements = [(next_element, label) for next_element,
-                               label in self._next_elements if next_element != element]
+        next_links = [(next_element, label) for next_element, label
+                      in zip(self._next_elements, self._next_labels) if next_element != element]
+        self._next_elements = [next_element for next_element, _ in next_links]
+        self._next_labels = [label for _, label in next_links]
 
     def replace_nextlink(self, element, new_element):
-        for i, (next_element, label) in enumerate(self._next_elements):
+        for i, next_element in enumerate(self._next_elements):
             if next_element == element:
-                self._next_elements[i] = (new_element, label)
+                self._next_elements[i] = new_element
                 new_element.add_backlink(self)
                 element.drop_backlink(self)
                 return
@@ -71,17 +132,50 @@ class FlowchartElement:
 
     def copy_to(self, element):
         element._next_elements = self._next_elements
+        element._next_labels = self._next_labels
         element._elements_backlinks = self._elements_backlinks
 
         return element
 
+    def get_structural_children(self):
+        return []
+
+    def get_fingerprint_fields(self):
+        return ()
+
+    def get_exit_elements(self, lowering):
+        # called on an element without next elements
+        return [self]
+
+    def lower_nodes(self, lowering, enclosing_loop):
+        if self.kind is None:
+            raise ValueError(
+                f'{type(self).__name__} element cannot be lowered.')
+
+        node = lowering.add_node(self.kind, self.label, self, enclosing_loop)
+        lowering.bind(self, node, node)
+
+        for child in self.get_structural_children():
+            lowering.visit(child, enclosing_loop)
+
+    def lower_edges(self, lowering):
+        exit_node = lowering.get_exit(self)
+        for next_element, label in zip(self._next_elements, self._next_labels):
+            lowering.add_edge(exit_node, lowering.get_entry(next_element), label)
+
 
 class Action(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='box', style='rounded')
+    __slots__ = ()
+
+    kind = NodeKind.ACTION
 
 
 class Decision(FlowchartElement):
+    __slots__ = ('_yes_root_element', '_no_root_element',
+                 '_yes_next_element', '_no_next_element')
+
+    kind = NodeKind.DECISION
+
     def __init__(self, label):
         super().__init__(label)
 
@@ -125,6 +219,7 @@ class Decision(FlowchartElement):
                 self._no_next_element = next_links[0][0]
 
         self._next_elements = []
+        self._next_labels = []
 
         self.add_next(self._yes_root_element, 'Yes')
         get_last_element(self._yes_root_element).add_next(
@@ -133,22 +228,74 @@ class Decision(FlowchartElement):
         self.add_next(self._no_root_element, 'No')
         get_last_element(self._no_root_element).add_next(self._no_next_element)
 
+    def get_structural_children(self):
+        return [element for element in (self._yes_root_element,
+                                        self._no_root_element,
+                                        self._yes_next_element,
+                                        self._no_next_element)
+                if element is not None]
+
+    def get_exit_elements(self, lowering):
+        # 後続のない分岐は、分岐の終端でフローが終わる
+        exit_elements = []
+        for root_element, next_element in ((self._yes_root_element, self._yes_next_element),
+                                           (self._no_root_element, self._no_next_element)):
+            if root_element is not None and next_element is None:
+                exit_elements.extend(lowering.get_exit_elements(root_element))
+        return exit_elements or [self]
+
+    def lower_edges(self, lowering):
+        next_links = self.get_nextlinks()
+        if (self._yes_next_element is None or self._no_next_element is None) \
+                and len(next_links) > 1:
+            lowering.report(self, IssueKind.AMBIGUOUS_DECISION,
+                            'Decision element has multiple next elements.')
+        default_next = next_links[0][0] if next_links else None
+
+        node = lowering.get_exit(self)
+        for root_element, next_element, label in (
+                (self._yes_root_element, self._yes_next_element, 'Yes'),
+                (self._no_root_element, self._no_next_element, 'No')):
+            next_element = next_element or default_next
+            if root_element is None:
+                lowering.report(self, IssueKind.DANGLING_DECISION,
+                                f'Decision element has no "{label}" branch.')
+                # 後続の要素が到達不能として重複して報告されないように直接つなぐ
+                if next_element is not None:
+                    lowering.add_edge(node, lowering.get_entry(next_element), label)
+                continue
 
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='diamond')
+            lowering.add_edge(node, lowering.get_entry(root_element), label)
+            last_node = lowering.get_last_exit(root_element)
+            if next_element is not None:
+                lowering.add_edge(node if last_node is None else last_node,
+                                  lowering.get_entry(next_element))
 
 
 class Subroutine(FlowchartElement):
+    __slots__ = ('_subroutine_root_element', '_is_parse_subroutine', '_subroutine_loader')
+
+    kind = NodeKind.SUBROUTINE
+
     def __init__(self, label, subroutine_root_element=None, is_parse_subroutine=False):
         super().__init__(label)
         self._subroutine_root_element = subroutine_root_element
         self._is_parse_subroutine = is_parse_subroutine
 
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, f" | {self.label} | ", shape='record')
+        # callable building the root element on first access
+        self._subroutine_loader = None
+
+    def set_subroutine_loader(self, loader):
+        self._subroutine_root_element = None
+        self._subroutine_loader = loader
+        return self
 
     @property
     def subroutine_root_element(self):
+        if self._subroutine_loader is not None:
+            loader = self._subroutine_loader
+            self._subroutine_loader = None
+            self._subroutine_root_element = loader()
         return self._subroutine_root_element
 
     @property
@@ -157,8 +304,8 @@ class Subroutine(FlowchartElement):
 
     def compile(self):
         if self.is_parse_subroutine:
-            first_element = self._subroutine_root_element
-            new_first_element = self._subroutine_root_element.copy_to(
+            first_element = self.subroutine_root_element
+            new_first_element = first_element.copy_to(
                 Connector('Subroutine Start Connector'))
             for next_element, label in first_element.get_nextlinks():
                 next_element.replace_backlink(first_element, new_first_element)
@@ -179,8 +326,59 @@ class Subroutine(FlowchartElement):
 
             self._subroutine_root_element = new_first_element
 
+    def get_structural_children(self):
+        if self.is_parse_subroutine and self.subroutine_root_element is not None:
+            return [self.subroutine_root_element]
+        return []
+
+    def get_fingerprint_fields(self):
+        return (self.is_parse_subroutine,)
+
+    def _is_inlined(self):
+        return self.is_parse_subroutine and self.subroutine_root_element is not None
+
+    def lower_nodes(self, lowering, enclosing_loop):
+        if not self._is_inlined():
+            return super().lower_nodes(lowering, enclosing_loop)
+
+        start = lowering.add_node(
+            NodeKind.CONNECTOR, 'Subroutine Start Connector', self, enclosing_loop)
+        end = lowering.add_node(
+            NodeKind.CONNECTOR, 'Subroutine End Connector', self, enclosing_loop)
+        lowering.bind(self, start, end)
+
+        # Root terminators of the subroutine are replaced by the connectors
+        root_element = self.subroutine_root_element
+        last_element = lowering.get_last_element(root_element)
+        if root_element.kind == NodeKind.ROOT:
+            lowering.bind(root_element, start, start)
+        if last_element is not None and last_element is not root_element \
+                and last_element.kind == NodeKind.ROOT:
+            lowering.bind(last_element, end, end)
+
+        lowering.visit(root_element, enclosing_loop)
+
+    def lower_edges(self, lowering):
+        super().lower_edges(lowering)
+        if not self._is_inlined():
+            return
+
+        start = lowering.get_entry(self)
+        end = lowering.get_exit(self)
+        root_element = self.subroutine_root_element
+        last_node = lowering.get_last_exit(root_element)
+
+        if lowering.get_entry(root_element) != start:
+            lowering.add_edge(start, lowering.get_entry(root_element))
+        if last_node is None:
+            lowering.add_edge(start, end)
+        elif last_node != end:
+            lowering.add_edge(last_node, end)
+
 
 class Loop(FlowchartElement):
+    __slots__ = ('_loop_start', '_loop_end', '_loop_content', '_loop_count')
+
     def __init__(self, label: str, loop_count: int):
         super().__init__(label)
         self._loop_start = LoopStart(f'{label} Start\n (n= {loop_count})')
@@ -206,13 +404,48 @@ class Loop(FlowchartElement):
             backlink.replace_nextlink(self, self._loop_start)
         self._elements_backlinks = tmp_backlinks
 
-        tmp_nextlinks = self.get_nextlinks()
+        tmp_next_elements = self._next_elements
+        tmp_next_labels = self._next_labels
         for next_element, label in self.get_nextlinks():
             next_element.replace_backlink(self, self._loop_end)
-        self._next_elements = tmp_nextlinks
+        self._next_elements = tmp_next_elements
+        self._next_labels = tmp_next_labels
+
+    def get_structural_children(self):
+        return [self._loop_content] if self._loop_content is not None else []
+
+    def get_fingerprint_fields(self):
+        return (self._loop_count,)
+
+    def lower_nodes(self, lowering, enclosing_loop):
+        start = lowering.add_node(
+            NodeKind.LOOP_START, self._loop_start.label, self, enclosing_loop)
+        end = lowering.add_node(
+            NodeKind.LOOP_END, self._loop_end.label, self, enclosing_loop)
+        lowering.set_region(start, end, self._loop_count)
+        lowering.bind(self, start, end)
+
+        for child in self.get_structural_children():
+            lowering.visit(child, start)
+
+    def lower_edges(self, lowering):
+        super().lower_edges(lowering)
+
+        content = self._loop_content
+        if content is None:
+            lowering.report(self, IssueKind.EMPTY_LOOP, 'Loop content is not set.')
+            lowering.add_edge(lowering.get_entry(self), lowering.get_exit(self))
+            return
+
+        lowering.add_edge(lowering.get_entry(self), lowering.get_entry(content))
+        last_node = lowering.get_last_exit(content)
+        lowering.add_edge(lowering.get_entry(self) if last_node is None else last_node,
+                          lowering.get_exit(self))
 
 
 class Parallel(FlowchartElement):
+    __slots__ = ('_parallel_elements', '_parallel_start_connector', '_parallel_end_connector')
+
     def __init__(self, label):
         super().__init__(label)
         self._parallel_elements = []
@@ -235,59 +468,116 @@ class Parallel(FlowchartElement):
             backlink.replace_nextlink(self, self._parallel_start_connector)
         self._elements_backlinks = tmp_backlinks
 
-        tmp_nextlinks = self.get_nextlinks()
+        tmp_next_elements = self._next_elements
+        tmp_next_labels = self._next_labels
         for next_element, label in self.get_nextlinks():
             next_element.replace_backlink(self, self._parallel_end_connector)
-        self._next_elements = tmp_nextlinks
+        self._next_elements = tmp_next_elements
+        self._next_labels = tmp_next_labels
+
+    def get_structural_children(self):
+        return list(self._parallel_elements)
+
+    def lower_nodes(self, lowering, enclosing_loop):
+        start = lowering.add_node(
+            NodeKind.PARALLEL_START, self._parallel_start_connector.label, self, enclosing_loop)
+        end = lowering.add_node(
+            NodeKind.PARALLEL_END, self._parallel_end_connector.label, self, enclosing_loop)
+        lowering.set_region(start, end)
+        lowering.bind(self, start, end)
+
+        for child in self.get_structural_children():
+            lowering.visit(child, enclosing_loop)
+
+    def lower_edges(self, lowering):
+        super().lower_edges(lowering)
+
+        start = lowering.get_entry(self)
+        end = lowering.get_exit(self)
+        if not self._parallel_elements:
+            lowering.add_edge(start, end)
+
+        for element in self._parallel_elements:
+            lowering.add_edge(start, lowering.get_entry(element))
+            last_node = lowering.get_last_exit(element)
+            lowering.add_edge(start if last_node is None else last_node, end)
 
 
 class Input(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='parallelogram')
+    __slots__ = ()
+
+    kind = NodeKind.INPUT
 
 
 class Root(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='ellipse')
+    __slots__ = ()
+
+    kind = NodeKind.ROOT
 
 
 class LoopStart(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='trapezium')
+    __slots__ = ()
+
+    kind = NodeKind.LOOP_START
 
 
 class LoopEnd(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='invtrapezium')
+    __slots__ = ()
+
+    kind = NodeKind.LOOP_END
 
 
 class Connector(FlowchartElement):
-    def add_to_graph(self, graph):
-        graph.graph.node(self.id, self.label, shape='point')
+    __slots__ = ()
+
+    kind = NodeKind.CONNECTOR
 
 
 # 幅優先探索で最後の要素を取得
 def get_last_element(element):
-    queue = [element]
+    queue = collections.deque([element])
     visited = set()
 
     while queue:
-        current_element = queue.pop(0)
+        current_element = queue.popleft()
         if current_element in visited:
             continue
         visited.add(current_element)
 
-        next_elements = current_element.get_nextlinks()
+        next_elements = current_element.get_next_elements()
         if not next_elements:
             return current_element
 
-        for next_element, _ in next_elements:
+        for next_element in next_elements:
             if next_element not in visited:
                 queue.append(next_element)
 
     return None
 
 
+# 幅優先探索で後続のない要素をすべて取得 (先頭は get_last_element と同じ)
+def get_last_elements(element):
+    queue = collections.deque([element])
+    visited = set()
+    last_elements = []
+
+    while queue:
+        current_element = queue.popleft()
+        if current_element in visited:
+            continue
+        visited.add(current_element)
+
+        next_elements = current_element.get_next_elements()
+        if not next_elements:
+            last_elements.append(current_element)
+
+        for next_element in next_elements:
+            if next_element not in visited:
+                queue.append(next_element)
+
+    return last_elements
+
+
 class ElementIterator:
     def __init__(self,
                  root_element: FlowchartElement,
@@ -295,31 +585,419 @@ class ElementIterator:
         self._root_element = root_element
 
     def __iter__(self):
-        queue = [self._root_element]
+        queue = collections.deque([self._root_element])
         visited = set()
 
+        try:
+            while queue:
+                current_element = queue.popleft()
+                if current_element in visited:
+                    continue
+                visited.add(current_element)
+
+                yield current_element
+
+                next_elements = current_element.get_next_elements()
+                for next_element in next_elements:
+                    if next_element not in visited:
+                        queue.append(next_element)
+
+                backlinks = current_element.get_backlinks()
+                for backlink in backlinks:
+                    if backlink not in visited:
+                        queue.append(backlink)
+        finally:
+            # nodes visited per traversal, also when the caller stops early
+            Instrumentation.count("flowchart.iterate", len(visited))
+
+
+class IndexedGraph:
+    """Lowered flowchart in compact indexed form.
+
+    Nodes are integers. Edges are stored in CSR form (``edge_offsets`` /
+    ``edge_targets``), loop and parallel regions are described by partner
+    node pairs, and every node keeps a reference to its source element.
+    """
+
+    def __init__(self,
+                 kinds: array.array,
+                 labels: list[str],
+                 sources: list[FlowchartElement],
+                 edge_offsets: array.array,
+                 edge_targets: array.array,
+                 edge_labels: list[str],
+                 partners: array.array,
+                 enclosing_loops: array.array,
+                 loop_counts: dict[int, int],
+                 root: int = 0,
+                 issues: list["ValidationIssue"] | None = None,  # found while lowering
+                 ):
+        self._kinds = kinds
+        self._labels = labels
+        self._sources = sources
+        self._edge_offsets = edge_offsets
+        self._edge_targets = edge_targets
+        self._edge_labels = edge_labels
+        self._partners = partners
+        self._enclosing_loops = enclosing_loops
+        self._loop_counts = loop_counts
+        self._root = root
+        self._issues = issues or []
+
+        self._predecessors = None
+
+    @property
+    def root(self) -> int:
+        return self._root
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._kinds)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self._edge_targets)
+
+    @property
+    def edge_offsets(self) -> array.array:
+        return self._edge_offsets
+
+    @property
+    def edge_targets(self) -> array.array:
+        return self._edge_targets
+
+    @property
+    def edge_labels(self) -> list[str]:
+        return self._edge_labels
+
+    @property
+    def issues(self) -> list["ValidationIssue"]:
+        return self._issues
+
+    def get_kind(self, node: int) -> NodeKind:
+        return NodeKind(self._kinds[node])
+
+    def get_label(self, node: int) -> str:
+        return self._labels[node]
+
+    def get_source(self, node: int) -> FlowchartElement:
+        return self._sources[node]
+
+    def get_partner(self, node: int) -> int:
+        return self._partners[node]
+
+    def get_enclosing_loop(self, node: int) -> int:
+        return self._enclosing_loops[node]
+
+    def get_loop_count(self, node: int) -> int:
+        return self._loop_counts.get(node, 1)
+
+    def get_successors(self, node: int):
+        begin = self._edge_offsets[node]
+        end = self._edge_offsets[node + 1]
+        return zip(self._edge_targets[begin:end], self._edge_labels[begin:end])
+
+    def get_predecessors(self, node: int) -> array.array:
+        if self._predecessors is None:
+            self._predecessors = self._build_predecessors()
+        offsets, sources = self._predecessors
+        return sources[offsets[node]:offsets[node + 1]]
+
+    def _build_predecessors(self):
+        offsets = array.array('q', bytes(8 * (self.num_nodes + 1)))
+        for target in self._edge_targets:
+            offsets[target + 1] += 1
+        for node in range(self.num_nodes):
+            offsets[node + 1] += offsets[node]
+
+        cursor = array.array('q', offsets)
+        sources = array.array('q', bytes(8 * self.num_edges))
+        for node in range(self.num_nodes):
+            for i in range(self._edge_offsets[node], self._edge_offsets[node + 1]):
+                target = self._edge_targets[i]
+                sources[cursor[target]] = node
+                cursor[target] += 1
+
+        return offsets, sources
+
+    def get_topological_order(self) -> array.array:
+        in_degree = array.array('q', bytes(8 * self.num_nodes))
+        for target in self._edge_targets:
+            in_degree[target] += 1
+
+        queue = collections.deque(
+            node for node in range(self.num_nodes) if in_degree[node] == 0)
+        order = array.array('q')
         while queue:
-            current_element = queue.pop(0)
-            if current_element in visited:
+            node = queue.popleft()
+            order.append(node)
+            for i in range(self._edge_offsets[node], self._edge_offsets[node + 1]):
+                target = self._edge_targets[i]
+                in_degree[target] -= 1
+                if in_degree[target] == 0:
+                    queue.append(target)
+
+        if len(order) != self.num_nodes:
+            raise ValueError('Flowchart contains a cycle.')
+        return order
+
+
+class _ElementLowering:
+    def __init__(self):
+        self._kinds = array.array('B')
+        self._labels = []
+        self._sources = []
+        self._partners = array.array('q')
+        self._enclosing_loops = array.array('q')
+        self._loop_counts = {}
+
+        self._edges = []
+        self._edge_set = set()
+
+        self._entries = {}
+        self._exits = {}
+        self._last_elements = {}
+        self._exit_elements = {}
+        self._reported_exits = set()
+
+        self._queue = collections.deque()
+        self._expanded = set()
+        self._order = []
+
+        self._issues = []
+
+    def add_node(self, kind, label, source, enclosing_loop) -> int:
+        self._kinds.append(kind)
+        self._labels.append(label)
+        self._sources.append(source)
+        self._partners.append(-1)
+        self._enclosing_loops.append(enclosing_loop)
+        return len(self._kinds) - 1
+
+    def set_region(self, start, end, loop_count=None):
+        self._partners[start] = end
+        self._partners[end] = start
+        if loop_count is not None:
+            self._loop_counts[start] = loop_count
+
+    def bind(self, element, entry, exit):
+        if element not in self._entries:
+            self._entries[element] = entry
+            self._exits[element] = exit
+
+    def get_entry(self, element) -> int:
+        return self._entries[element]
+
+    def get_exit(self, element) -> int:
+        return self._exits[element]
+
+    def get_last_elements(self, element):
+        if element not in self._last_elements:
+            self._last_elements[element] = get_last_elements(element)
+        return self._last_elements[element]
+
+    def get_last_element(self, element):
+        last_elements = self.get_last_elements(element)
+        return last_elements[0] if last_elements else None
+
+    def get_last_exit(self, element) -> int | None:
+        # None if the element has no last element (cycle), reported by the validator.
+        # Callers then bridge the region so that nodes after it stay reachable.
+        last_elements = self.get_last_elements(element)
+        if not last_elements:
+            return None
+
+        # サブルーチンやループなどの本体は 1 か所で終わる。他の終端は後続につながらない
+        exit_elements = self.get_exit_elements(element)
+        if len(exit_elements) > 1 and element not in self._reported_exits:
+            self._reported_exits.add(element)
+            for exit_element in exit_elements[1:]:
+                self._issues.append(ValidationIssue(
+                    IssueKind.MULTIPLE_EXITS,
+                    f'Flow ends here and at {exit_elements[0].label!r}.',
+                    self.get_entry(exit_element), exit_element.label))
+        return self.get_exit(last_elements[0])
+
+    def get_exit_elements(self, element):
+        # elements where the flow starting at element ends, through the branches
+        # of decisions that end it
+        if element not in self._exit_elements:
+            self._exit_elements[element] = []  # guards against cycles
+            self._exit_elements[element] = [
+                exit_element for last_element in self.get_last_elements(element)
+                for exit_element in last_element.get_exit_elements(self)]
+        return self._exit_elements[element]
+
+    def report(self, element, kind, message):
+        self._issues.append(
+            ValidationIssue(kind, message, self.get_entry(element), element.label))
+
+    def add_edge(self, source, target, label=''):
+        edge = (source, target)
+        if edge not in self._edge_set:
+            self._edge_set.add(edge)
+            self._edges.append((source, target, label))
+
+    def visit(self, element, enclosing_loop):
+        if element not in self._expanded:
+            self._queue.append((element, enclosing_loop))
+
+    def lower(self, root_element) -> IndexedGraph:
+        self.visit(root_element, -1)
+        while self._queue:
+            element, enclosing_loop = self._queue.popleft()
+            if element in self._expanded:
                 continue
-            visited.add(current_element)
+            self._expanded.add(element)
+            self._order.append(element)
+
+            if element not in self._entries:
+                element.lower_nodes(self, enclosing_loop)
+
+            for next_element in element.get_next_elements():
+                self.visit(next_element, enclosing_loop)
+            for backlink in element.get_backlinks():
+                self.visit(backlink, enclosing_loop)
+
+        for element in self._order:
+            element.lower_edges(self)
+
+        return self._build(self.get_entry(root_element))
+
+    def _build(self, root) -> IndexedGraph:
+        num_nodes = len(self._kinds)
 
-            print(f"Current element: {current_element.label}")
-            yield current_element
+        # counting sort of the edges by source node
+        offsets = array.array('q', bytes(8 * (num_nodes + 1)))
+        for source, _, _ in self._edges:
+            offsets[source + 1] += 1
+        for node in range(num_nodes):
+            offsets[node + 1] += offsets[node]
 
-            next_elements = current_element.get_nextlinks()
-            for next_element, _ in next_elements:
-                if next_element not in visited:
-                    queue.append(next_element)
+        cursor = array.array('q', offsets)
+        targets = array.array('q', bytes(8 * len(self._edges)))
+        labels = [''] * len(self._edges)
+        for source, target, label in self._edges:
+            targets[cursor[source]] = target
+            labels[cursor[source]] = label
+            cursor[source] += 1
 
-            backlinks = current_element.get_backlinks()
-            for backlink in backlinks:
-                if backlink not in visited:
-                    queue.append(backlink)
+        return IndexedGraph(self._kinds, self._labels, self._sources,
+                            offsets, targets, labels,
+                            self._partners, self._enclosing_loops, self._loop_counts,
+                            root, self._issues)
+
+
+class IssueKind(enum.Enum):
+    CYCLE = "cycle"
+    UNREACHABLE = "unreachable"
+    DANGLING_DECISION = "dangling_decision"
+    AMBIGUOUS_DECISION = "ambiguous_decision"
+    EMPTY_LOOP = "empty_loop"
+    MULTIPLE_EXITS = "multiple_exits"
+
+
+@dataclasses.dataclass(frozen=True)
+class ValidationIssue:
+    kind: IssueKind
+    message: str
+    node: int
+    label: str
+
+    def __str__(self):
+        return f"[{self.kind.value}] {self.label!r}: {self.message}"
+
+
+class FlowchartValidationError(ValueError):
+    def __init__(self, issues: list[ValidationIssue]):
+        self.issues = issues
+        super().__init__(
+            f"Flowchart has {len(issues)} problem(s):\n"
+            + "\n".join(f"  {issue}" for issue in issues))
+
+
+class FlowchartValidator:
+    @staticmethod
+    @Instrumentation.timed("flowchart.validate")
+    def validate(graph: IndexedGraph) -> list[ValidationIssue]:
+        # 全ての問題を 1 回の走査でまとめて検出する (ノード数 + エッジ数に比例)
+        issues = list(graph.issues)
+        num_nodes = graph.num_nodes
+        offsets = graph.edge_offsets
+        targets = graph.edge_targets
+
+        # 到達可能性: ルートと入力ノードを起点とする
+        reached = bytearray(num_nodes)
+        stack = [node for node in range(num_nodes)
+                 if node == graph.root or graph.get_kind(node) == NodeKind.INPUT]
+        for node in stack:
+            reached[node] = 1
+        while stack:
+            node = stack.pop()
+            for i in range(offsets[node], offsets[node + 1]):
+                target = targets[i]
+                if not reached[target]:
+                    reached[target] = 1
+                    stack.append(target)
+
+        # 閉路: 入次数・出次数 0 のノードを両側から取り除き、残ったノードを閉路上とみなす
+        in_degree = array.array('q', bytes(8 * num_nodes))
+        out_degree = array.array('q', bytes(8 * num_nodes))
+        for node in range(num_nodes):
+            out_degree[node] = offsets[node + 1] - offsets[node]
+        for target in targets:
+            in_degree[target] += 1
+
+        removed = bytearray(num_nodes)
+        queue = collections.deque(
+            node for node in range(num_nodes) if in_degree[node] == 0)
+        while queue:
+            node = queue.popleft()
+            removed[node] = 1
+            for i in range(offsets[node], offsets[node + 1]):
+                target = targets[i]
+                in_degree[target] -= 1
+                if in_degree[target] == 0:
+                    queue.append(target)
+
+        queue = collections.deque(
+            node for node in range(num_nodes) if out_degree[node] == 0 and not removed[node])
+        while queue:
+            node = queue.popleft()
+            removed[node] = 1
+            for source in graph.get_predecessors(node):
+                out_degree[source] -= 1
+                if out_degree[source] == 0 and not removed[source]:
+                    queue.append(source)
+
+        # 終端が複数あるフロー (分岐ごとの終端) は許す。本体の途中で終わる
+        # サブルーチンや分岐は lowering で検出済み
+        for node in range(num_nodes):
+            label = graph.get_label(node)
+            if not reached[node]:
+                issues.append(ValidationIssue(
+                    IssueKind.UNREACHABLE, 'Element is not reachable from the root.',
+                    node, label))
+            if not removed[node]:
+                issues.append(ValidationIssue(
+                    IssueKind.CYCLE, 'Element is part of a cycle.', node, label))
+
+        return issues
+
+    @classmethod
+    def check(cls, graph: IndexedGraph) -> IndexedGraph:
+        issues = cls.validate(graph)
+        if issues:
+            raise FlowchartValidationError(issues)
+        return graph
 
 
 class ElementsCompiler:
+    __LOWERED_GRAPHS = collections.OrderedDict()
+    __MAX_CACHED_GRAPHS = 64
+
     @staticmethod
+    @Instrumentation.timed("flowchart.compile")
     def compile(root_element) -> FlowchartElement:
         # root_element から走査して、新しい FlowchartElement を作成する
         new_root_element = copy.deepcopy(root_element)
@@ -328,56 +1006,165 @@ class ElementsCompiler:
 
         return new_root_element
 
+    @classmethod
+    def lower(cls, root_element, validate=True) -> IndexedGraph:
+        # 元の要素は変更せずに、インデックス化されたグラフを生成する
+        fingerprint = cls.fingerprint(root_element)
+        graph = cls.__LOWERED_GRAPHS.get(fingerprint)
+        if graph is not None:
+            cls.__LOWERED_GRAPHS.move_to_end(fingerprint)
+            Instrumentation.count("flowchart.lower_cache_hit")
+            return graph
+
+        with Instrumentation.timer("flowchart.lower") as timer:
+            graph = _ElementLowering().lower(root_element)
+            timer.add(graph.num_nodes)
+        if not validate:
+            return graph
+        # 不正なグラフはキャッシュせず、描画などの重い処理の前にまとめて報告する
+        FlowchartValidator.check(graph)
+
+        cls.__LOWERED_GRAPHS[fingerprint] = graph
+        if len(cls.__LOWERED_GRAPHS) > cls.__MAX_CACHED_GRAPHS:
+            cls.__LOWERED_GRAPHS.popitem(last=False)
+        return graph
 
-class Flowchart:
-    def __init__(self, root_element):
-        self.root_element = root_element
+    @staticmethod
+    @Instrumentation.timed("flowchart.fingerprint")
+    def fingerprint(root_element) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+
+        queue = collections.deque([root_element])
+        visited = set()
+        while queue:
+            element = queue.popleft()
+            if element in visited:
+                continue
+            visited.add(element)
 
-        self.graph = Digraph(format='png')
-        self.visited_nodes = set()
-        self.visited_edges = set()
+            next_elements = element.get_next_elements()
+            children = element.get_structural_children()
+            digest.update(repr((
+                element.id,
+                type(element).__qualname__,
+                element.label,
+                [next_element.id for next_element in next_elements],
+                element._next_labels,
+                [child.id for child in children],
+                element.get_fingerprint_fields(),
+            )).encode())
 
-    def _compile(self):
-        # for element in self._get_elements():
-        print("Post processing")
-        # for element in ElementIterator(self.root_element):
-        #     element.compile()
-        self.root_element = ElementsCompiler.compile(self.root_element)
-        print("Post processing done")
+            queue.extend(next_elements)
+            queue.extend(element.get_backlinks())
+            queue.extend(children)
 
-    def draw(self, filename='flowchart', view=True):
-        if not self.root_element:
-            raise ValueError('Root element is not set.')
-        self._compile()
+        return digest.hexdigest()
 
-        self._add_elements_to_graph(self.root_element)
-        self.graph.render(filename,
-                          view=view,
-                          )
+    @classmethod
+    def clear_cache(cls):
+        cls.__LOWERED_GRAPHS.clear()
 
-    def _add_elements_to_graph(self, element):
-        if element.id in self.visited_nodes:
-            return
 
-        print(f"Adding element: {element.label}")
-        element.add_to_graph(self)
-        self.visited_nodes.add(element.id)
+class Flowchart:
+    __NODE_ATTRIBUTES = {
+        NodeKind.ACTION: 'shape=box, style=rounded',
+        NodeKind.DECISION: 'shape=diamond',
+        NodeKind.SUBROUTINE: 'shape=record',
+        NodeKind.INPUT: 'shape=parallelogram',
+        NodeKind.ROOT: 'shape=ellipse',
+        NodeKind.LOOP_START: 'shape=trapezium',
+        NodeKind.LOOP_END: 'shape=invtrapezium',
+        NodeKind.CONNECTOR: 'shape=point',
+        NodeKind.PARALLEL_START: 'shape=point',
+        NodeKind.PARALLEL_END: 'shape=point',
+    }
+
+    def __init__(self, root_element):
+        self.root_element = root_element
 
-        for next_element, label in element.get_nextlinks():
-            self._add_edges_to_graph(element, next_element, label)
+    def _compile(self) -> IndexedGraph:
+        return ElementsCompiler.lower(self.root_element)
 
-        for backlink in element.get_backlinks():
-            self._add_elements_to_graph(backlink)
+    def get_source(self) -> str:
+        if not self.root_element:
+            raise ValueError('Root element is not set.')
+        indexed_graph = self._compile()
+
+        with Instrumentation.timer("flowchart.dot") as timer:
+            buffer = io.StringIO()
+            buffer.write('digraph {\n')
+            self._write_elements(buffer, indexed_graph)
+            buffer.write('}\n')
+            source = buffer.getvalue()
+            timer.add(len(source))
+        return source
+
+    def _write_elements(self, buffer, indexed_graph: IndexedGraph):
+        quote = self._quote
+        offsets = indexed_graph.edge_offsets
+        targets = indexed_graph.edge_targets
+        edge_labels = indexed_graph.edge_labels
+
+        for node in range(indexed_graph.num_nodes):
+            kind = indexed_graph.get_kind(node)
+            label = indexed_graph.get_label(node)
+            if kind == NodeKind.SUBROUTINE:
+                label = f" | {label} | "
+            buffer.write(
+                f'\t{node} [label={quote(label)}, {self.__NODE_ATTRIBUTES[kind]}]\n')
+
+            for i in range(offsets[node], offsets[node + 1]):
+                buffer.write(
+                    f'\t{node} -> {targets[i]} [label={quote(edge_labels[i])}]\n')
 
-    def _add_edges_to_graph(self, element, next_element, label):
-        edge = (element.id, next_element.id)
+    @staticmethod
+    def _quote(text: str) -> str:
+        # バックスラッシュを先にエスケープする
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
-        if edge not in self.visited_edges:
-            next_element.add_to_graph(self)
-            self.graph.edge(element.id, next_element.id, label)
-            self.visited_edges.add(edge)
+    def draw(self, filename='flowchart', view=True, format='png') -> str:
+        return self._render(self.get_source(), filename, view, format)
 
-            self._add_elements_to_graph(next_element)
+    @staticmethod
+    @Instrumentation.timed("flowchart.render")
+    def _render(source: str, filename: str, view: bool, format: str) -> str:
+        import graphviz
+
+        # DOT の内容が前回の出力と同じであればレンダリングを省略する
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        output_path = f"{filename}.{format}"
+        digest_path = f"{output_path}.sha256"
+
+        is_cached = False
+        if os.path.exists(output_path) and os.path.exists(digest_path):
+            with open(digest_path, encoding='utf-8') as f:
+                is_cached = f.read().strip() == digest
+
+        if not is_cached:
+            output_path = graphviz.Source(source, format=format).render(filename)
+            with open(digest_path, 'w', encoding='utf-8') as f:
+                f.write(digest)
+
+        if view:
+            graphviz.view(output_path)
+        return output_path
+
+    @classmethod
+    def draw_many(cls,
+                  flowcharts: dict[str, "Flowchart"],  # filename -> flowchart
+                  format='png',
+                  max_workers: int | None = None,
+                  ) -> dict[str, str]:
+        # DOT の生成は呼び出し元のスレッドで行い、Graphviz の実行のみを並列化する
+        sources = {filename: flowchart.get_source()
+                   for filename, flowchart in flowcharts.items()}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                filename: executor.submit(cls._render, source, filename, False, format)
+                for filename, source in sources.items()
+            }
+            return {filename: future.result() for filename, future in futures.items()}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,139 @@
+import atexit
+import dataclasses
+import functools
+import os
+import sys
+import threading
+import time
+
+
+@dataclasses.dataclass(frozen=True)
+class Stat:
+    calls: int
+    seconds: float  # cumulative, 0 for plain counters
+    amount: int  # e.g. nodes visited, bytes written
+
+
+class _Timer:
+    __slots__ = ('_name', '_amount', '_start')
+
+    def __init__(self, name: str):
+        self._name = name
+        self._amount = 0
+        self._start = 0.0
+
+    def add(self, amount: int):
+        self._amount += amount
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        Instrumentation.record(self._name, time.perf_counter() - self._start, self._amount)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def add(self, amount: int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Instrumentation:
+    """Opt-in call counts and cumulative times per subsystem.
+
+    Disabled by default; enable with ``MDL_INSTRUMENT=1`` (the table is then
+    written to stderr at exit) or ``Instrumentation.enable()``. When disabled,
+    each instrumented call site costs one attribute check.
+
+        with Instrumentation.timer("flowchart.lower") as timer:
+            ...
+            timer.add(num_nodes)
+    """
+
+    __ENV_ENABLED = "MDL_INSTRUMENT"
+    __NULL_TIMER = _NullTimer()
+
+    enabled = os.environ.get(__ENV_ENABLED, "0") not in ("0", "false", "False", "")
+
+    __STATS = {}  # name -> [calls, seconds, amount]
+    __LOCK = threading.Lock()
+
+    @classmethod
+    def enable(cls):
+        cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        cls.enabled = False
+
+    @classmethod
+    def record(cls, name: str, seconds: float = 0.0, amount: int = 0):
+        with cls.__LOCK:
+            stat = cls.__STATS.get(name)
+            if stat is None:
+                stat = cls.__STATS[name] = [0, 0.0, 0]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] += amount
+
+    @classmethod
+    def count(cls, name: str, amount: int = 0):
+        if cls.enabled:
+            cls.record(name, amount=amount)
+
+    @classmethod
+    def timer(cls, name: str):
+        if not cls.enabled:
+            return cls.__NULL_TIMER
+        return _Timer(name)
+
+    @classmethod
+    def timed(cls, name: str):
+        # decorator, the enabled flag is checked on every call
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not cls.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def snapshot(cls) -> dict[str, Stat]:
+        with cls.__LOCK:
+            return {name: Stat(*stat) for name, stat in cls.__STATS.items()}
+
+    @classmethod
+    def reset(cls):
+        with cls.__LOCK:
+            cls.__STATS.clear()
+
+    @classmethod
+    def get_table(cls, stats: dict[str, Stat] | None = None) -> str:
+        stats = cls.snapshot() if stats is None else stats
+        lines = [f"{'name':32} {'calls':>10} {'total [s]':>12} {'mean [ms]':>12} {'amount':>12}"]
+        # 合計時間の長い順
+        for name, stat in sorted(stats.items(), key=lambda item: -item[1].seconds):
+            mean = 1000 * stat.seconds / stat.calls if stat.calls else 0.0
+            lines.append(f"{name:32} {stat.calls:10d} {stat.seconds:12.6f} {mean:12.3f} "
+                         f"{stat.amount:12d}")
+        return "\n".join(lines)
+
+    @classmethod
+    def dump(cls, file=None):
+        print(cls.get_table(), file=file or sys.stderr)
+
+
+if Instrumentation.enabled:
+    atexit.register(Instrumentation.dump)
@@ -1,41 +1,170 @@
+import atexit
+import copy
 import os
-from logging import getLogger, StreamHandler, Formatter, FileHandler, DEBUG
+import queue
+import threading
+from logging import (getLogger, getLevelName, Handler, StreamHandler, Formatter, FileHandler,
+                     DEBUG)
+from logging.handlers import QueueHandler, QueueListener
 
+from mechanical_design_lib.utils.instrumentation import Instrumentation
 from mechanical_design_lib.utils.util import DirectoryFactory
 
 
+class _DeferredQueueHandler(QueueHandler):
+    # The default QueueHandler formats the message in the calling thread.
+    # Only the message is merged here, formatting happens on the listener thread.
+    def __init__(self, queue, start_listener, handlers: list[Handler]):
+        super().__init__(queue)
+        self._start_listener = start_listener  # False if records cannot be queued
+        self._handlers = handlers
+
+    def prepare(self, record):
+        # QueueHandler.prepare と同様に引数を埋め込む。変更可能な引数はこの時点の値で記録され、
+        # __str__ の例外も呼び出し元のスレッドで起きる
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        # the listener thread is started by the first record, not at import
+        if self._start_listener():
+            super().emit(record)
+            return
+
+        # フォーク後の子プロセスや終了処理の後はリスナーがないため、直接書き出す
+        for handler in self._handlers:
+            handler.handle(record)
+
+
+# exc_info is formatted into exc_text before the record is queued
+_EXCEPTION_FORMATTER = Formatter()
+
+
+class _FileRoutingHandler(Handler):
+    # Writes each logger to its own file, opened on the first record of that logger
+    def __init__(self, formatter: Formatter):
+        super().__init__()
+        self.setFormatter(formatter)
+        self._file_handlers = {}
+
+    def emit(self, record):
+        file_handler = self._file_handlers.get(record.name)
+        if file_handler is None:
+            log_path = DirectoryFactory.get_directory(DirectoryFactory.DirectoryName.LOG)
+            file_handler = FileHandler(f"{log_path}/{record.name}.log", encoding='utf-8')
+            file_handler.setFormatter(self.formatter)
+            self._file_handlers[record.name] = file_handler
+        if not Instrumentation.enabled:
+            file_handler.handle(record)
+            return
+        with Instrumentation.timer("logging.write") as timer:
+            start = file_handler.stream.tell()
+            file_handler.handle(record)
+            timer.add(file_handler.stream.tell() - start)  # bytes
+
+    def flush(self):
+        for file_handler in self._file_handlers.values():
+            file_handler.flush()
+
+    def close(self):
+        # records after closing, e.g. logged after shutdown, open the files again
+        for file_handler in self._file_handlers.values():
+            file_handler.close()
+        self._file_handlers.clear()
+        super().close()
+
+
 class LoggerFactory:
     __LOGGERS = {}
+    __ENV_LEVEL = "MDL_LOG_LEVEL"
+    __ENV_ASYNC = "MDL_LOG_ASYNC"
+
+    __HANDLERS = None
+    __LISTENER = None
+    __IS_LISTENER_STARTED = False
+    __LISTENER_PID = None  # process that started the listener thread
+    __IS_SHUT_DOWN = False
+    __LOCK = threading.Lock()
+
+    @classmethod
+    def get_level(cls) -> int:
+        # e.g. MDL_LOG_LEVEL=WARNING で INFO 以下のログを生成しない
+        level = getLevelName(os.environ.get(cls.__ENV_LEVEL, "DEBUG").upper())
+        return level if isinstance(level, int) else DEBUG
+
+    @classmethod
+    def is_async(cls) -> bool:
+        return os.environ.get(cls.__ENV_ASYNC, "1") not in ("0", "false", "False")
+
+    @classmethod
+    def _get_handlers(cls) -> list[Handler]:
+        with cls.__LOCK:
+            if cls.__HANDLERS is None:
+                formatter = Formatter(
+                    fmt='%(asctime)s %(levelname)s %(name)s :%(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S'
+                )
+
+                # StreamHandler
+                stream_handler = StreamHandler()
+                stream_handler.setFormatter(formatter)
+
+                # FileHandler
+                file_handler = _FileRoutingHandler(formatter)
+
+                handlers = [stream_handler, file_handler]
+                if cls.is_async():
+                    # 書式化とファイル書き込みはバックグラウンドスレッドで行う
+                    log_queue = queue.SimpleQueue()
+                    cls.__LISTENER = QueueListener(log_queue, *handlers)
+                    handlers = [_DeferredQueueHandler(log_queue, cls._start_listener, handlers)]
+
+                cls.__HANDLERS = handlers
+            return cls.__HANDLERS
+
+    @classmethod
+    def _start_listener(cls) -> bool:
+        # True if records can be queued to a listener thread of this process
+        if cls.__IS_LISTENER_STARTED and cls.__LISTENER_PID == os.getpid():
+            return True
+        with cls.__LOCK:
+            if cls.__IS_SHUT_DOWN or cls.__LISTENER is None:
+                return False
+            if cls.__IS_LISTENER_STARTED:
+                # フォークで複製されたプロセスにはリスナーのスレッドがない
+                return cls.__LISTENER_PID == os.getpid()
+            cls.__LISTENER.start()
+            cls.__IS_LISTENER_STARTED = True
+            cls.__LISTENER_PID = os.getpid()
+            atexit.register(cls.shutdown)
+            return True
+
+    @classmethod
+    def shutdown(cls):
+        # キューに残っているログを書き出してからスレッドを止める
+        with cls.__LOCK:
+            cls.__IS_SHUT_DOWN = True
+            if cls.__IS_LISTENER_STARTED and cls.__LISTENER_PID == os.getpid():
+                cls.__LISTENER.stop()
+                for handler in cls.__LISTENER.handlers:
+                    handler.close()
+                cls.__IS_LISTENER_STARTED = False
 
     @classmethod
     def get_logger(cls, name: str):
         if cls.__LOGGERS.get(name) is None:
 
             logger = getLogger(name)
-            logger.setLevel(DEBUG)
-
-            formatter = Formatter(
-                fmt='%(asctime)s %(levelname)s %(name)s :%(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-
-            # StreamHandler
-            stream_handler = StreamHandler()
-            stream_handler.setFormatter(formatter)
-            stream_handler.setLevel(DEBUG)
-            logger.addHandler(stream_handler)
-
-            # FileHandler
-            log_path = DirectoryFactory.get_directory(
-                DirectoryFactory.DirectoryName.LOG)
-            log_file_path = f"{log_path}/{name}.log"
-
-            file_handler = FileHandler(log_file_path, encoding='utf-8')
-            file_handler.setFormatter(formatter)
-            file_handler.setLevel(DEBUG)
-            logger.addHandler(file_handler)
-
-            logger.info(f"Logger {name} created with log file {log_file_path}")
+            logger.setLevel(cls.get_level())
+            for handler in cls._get_handlers():
+                logger.addHandler(handler)
 
             # Add the logger to the dictionary
             cls.__LOGGERS[name] = logger
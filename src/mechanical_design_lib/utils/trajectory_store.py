@@ -0,0 +1,148 @@
+import os
+import pathlib
+import threading
+
+import numpy as np
+
+from mechanical_design_lib.utils.util import DirectoryFactory
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+
+class TrajectoryStore:
+    """Append-only store of float64 arrays in memory-mapped files.
+
+    A store is a directory holding two files:
+    - ``data.f8``: the samples of all records, concatenated
+    - ``index.bin``: one fixed-size ``INDEX_DTYPE`` entry per record
+
+    Appends take an exclusive file lock, so several worker processes can
+    write to the same store. The samples are written before the index
+    entry, so readers never see a partially written record. Records are
+    returned as read-only views of the memory map and are not copied.
+    """
+
+    INDEX_DTYPE = np.dtype([
+        ("axis", "U32"),
+        ("move", "i8"),
+        ("dt", "f8"),  # s between samples
+        ("offset", "i8"),  # first sample in data.f8
+        ("rows", "i8"),
+        ("columns", "i8"),
+    ])
+    DATA_FILE = "data.f8"
+    INDEX_FILE = "index.bin"
+    LOCK_FILE = "lock"
+
+    def __init__(self,
+                 name: str = "trajectories",
+                 directory=None,  # parent directory, the DATA output directory by default
+                 ):
+        self._name = name
+        self._directory = directory
+        self._path = None
+
+        self._lock = threading.Lock()
+        self._data = None  # memory map of data.f8, reopened when the file grows
+
+    @property
+    def path(self) -> pathlib.Path:
+        # ディレクトリは最初に使用するときに作成する
+        if self._path is None:
+            directory = self._directory or DirectoryFactory.get_directory(
+                DirectoryFactory.DirectoryName.DATA)
+            self._path = pathlib.Path(directory) / self._name
+            self._path.mkdir(parents=True, exist_ok=True)
+        return self._path
+
+    def append(self,
+               axis: str,
+               move: int,
+               dt: float,  # s
+               data: np.ndarray,  # (samples,) or (channels, samples)
+               ) -> int:
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data[np.newaxis]
+        if data.ndim != 2:
+            raise ValueError("Trajectory must be a 1D or 2D array.")
+        if len(axis) > self.INDEX_DTYPE["axis"].itemsize // 4:
+            raise ValueError(f"Axis name {axis!r} is too long.")
+
+        path = self.path
+        with self._lock, open(path / self.LOCK_FILE, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(path / self.DATA_FILE, "ab") as f:
+                    offset = f.tell() // data.itemsize
+                    f.write(data)
+
+                entry = np.array([(axis, move, dt, offset, *data.shape)], dtype=self.INDEX_DTYPE)
+                with open(path / self.INDEX_FILE, "ab") as f:
+                    record = f.tell() // self.INDEX_DTYPE.itemsize
+                    f.write(entry.tobytes())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return record
+
+    def __len__(self) -> int:
+        index_path = self.path / self.INDEX_FILE
+        if not index_path.exists():
+            return 0
+        return os.path.getsize(index_path) // self.INDEX_DTYPE.itemsize
+
+    @property
+    def index(self) -> np.ndarray:
+        count = len(self)
+        if count == 0:
+            return np.zeros(0, dtype=self.INDEX_DTYPE)
+        # only whole entries, another process may be appending
+        return np.fromfile(self.path / self.INDEX_FILE, dtype=self.INDEX_DTYPE, count=count)
+
+    def find(self, axis: str | None = None, move: int | None = None) -> np.ndarray:
+        index = self.index
+        mask = np.ones(len(index), dtype=bool)
+        if axis is not None:
+            mask &= index["axis"] == axis
+        if move is not None:
+            mask &= index["move"] == move
+        return np.flatnonzero(mask)
+
+    def get(self, record: int) -> np.ndarray:
+        return self._get_view(self._read_entry(record))
+
+    def get_slice(self,
+                  record: int,
+                  start_time: float | None = None,  # s
+                  end_time: float | None = None,  # s
+                  ) -> np.ndarray:
+        entry = self._read_entry(record)
+        dt = float(entry["dt"])
+        begin = None if start_time is None else max(int(np.ceil(start_time / dt)), 0)
+        end = None if end_time is None else max(int(np.floor(end_time / dt)) + 1, 0)
+        return self._get_view(entry)[:, begin:end]
+
+    def iter_records(self, axis: str | None = None, move: int | None = None):
+        index = self.index
+        for record in self.find(axis, move).tolist():
+            yield record, self._get_view(index[record])
+
+    def _read_entry(self, record: int):
+        if not 0 <= record < len(self):
+            raise IndexError(f"Record {record} does not exist.")
+        return np.fromfile(self.path / self.INDEX_FILE, dtype=self.INDEX_DTYPE, count=1,
+                           offset=int(record) * self.INDEX_DTYPE.itemsize)[0]
+
+    def _get_view(self, entry) -> np.ndarray:
+        offset = int(entry["offset"])
+        rows, columns = int(entry["rows"]), int(entry["columns"])
+        end = offset + rows * columns
+
+        if self._data is None or len(self._data) < end:
+            self._data = np.memmap(self.path / self.DATA_FILE, dtype=np.float64, mode="r")
+        return self._data[offset:end].reshape(rows, columns)
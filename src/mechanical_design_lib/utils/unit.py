@@ -1,8 +1,16 @@
+from __future__ import annotations
+
+import dataclasses
 import enum
-import sympy
+import math
 from typing import NewType
 
+import numpy as np
+
 from mechanical_design_lib.utils.constant import GRAVITY as G
+from mechanical_design_lib.utils.lazy_import import lazy_import
+
+sympy = lazy_import("sympy")
 
 
 Angle = NewType("Angle", float)
@@ -17,11 +25,142 @@ class UnitType(enum.IntEnum):
     PULSE = enum.auto()
 
 
+class Dimension(enum.Enum):
+    LENGTH = enum.auto()  # base: mm
+    ANGLE = enum.auto()  # base: degree
+    TIME = enum.auto()  # base: s
+    VELOCITY = enum.auto()  # base: mm/s
+    ANGULAR_VELOCITY = enum.auto()  # base: degree/s
+    ACCELERATION = enum.auto()  # base: mm/s^2
+    ANGULAR_ACCELERATION = enum.auto()  # base: degree/s^2
+    FREQUENCY = enum.auto()  # base: Hz
+
+
+@dataclasses.dataclass(frozen=True)
+class Unit:
+    name: str
+    dimension: Dimension
+    scale: float  # size of the unit in the base unit of its dimension
+
+    def get_factor(self, unit: Unit) -> float:
+        # 変換係数は単位の組ごとに 1 回だけ計算する
+        factor = _CONVERSION_FACTORS.get((self, unit))
+        if factor is None:
+            if self.dimension != unit.dimension:
+                raise ValueError(f"Cannot convert {self.name} to {unit.name}.")
+            factor = _CONVERSION_FACTORS[(self, unit)] = self.scale / unit.scale
+        return factor
+
+    def __str__(self) -> str:
+        return self.name
+
+
+_CONVERSION_FACTORS = {}
+
+
+class Units:
+    MM = Unit("mm", Dimension.LENGTH, 1.0)
+    M = Unit("m", Dimension.LENGTH, 1000.0)
+    DEGREE = Unit("degree", Dimension.ANGLE, 1.0)
+    RADIAN = Unit("rad", Dimension.ANGLE, 180 / math.pi)
+    REVOLUTION = Unit("rev", Dimension.ANGLE, 360.0)
+    S = Unit("s", Dimension.TIME, 1.0)
+    MS = Unit("ms", Dimension.TIME, 1e-3)
+    MM_S = Unit("mm/s", Dimension.VELOCITY, 1.0)
+    M_S = Unit("m/s", Dimension.VELOCITY, 1000.0)
+    DEGREE_S = Unit("degree/s", Dimension.ANGULAR_VELOCITY, 1.0)
+    RADIAN_S = Unit("rad/s", Dimension.ANGULAR_VELOCITY, 180 / math.pi)
+    RPM = Unit("rpm", Dimension.ANGULAR_VELOCITY, 6.0)
+    MM_S2 = Unit("mm/s^2", Dimension.ACCELERATION, 1.0)
+    M_S2 = Unit("m/s^2", Dimension.ACCELERATION, 1000.0)
+    G = Unit("G", Dimension.ACCELERATION, G * 1000)  # G on the right is the gravity constant
+    DEGREE_S2 = Unit("degree/s^2", Dimension.ANGULAR_ACCELERATION, 1.0)
+    RADIAN_S2 = Unit("rad/s^2", Dimension.ANGULAR_ACCELERATION, 180 / math.pi)
+    HZ = Unit("Hz", Dimension.FREQUENCY, 1.0)
+
+
+class Quantity:
+    """NumPy array (or scalar) with a unit.
+
+    Units are checked once per operation and converted with a single
+    multiply; the array itself is never copied when no conversion is needed.
+    """
+    __slots__ = ('_value', '_unit')
+
+    def __init__(self, value, unit: Unit):
+        self._value = np.asarray(value)
+        self._unit = unit
+
+    @property
+    def value(self) -> np.ndarray:
+        return self._value
+
+    @property
+    def unit(self) -> Unit:
+        return self._unit
+
+    def to(self, unit: Unit) -> Quantity:
+        factor = self._unit.get_factor(unit)
+        if factor == 1.0:
+            return self if unit == self._unit else Quantity(self._value, unit)
+        return Quantity(self._value * factor, unit)
+
+    def get_value(self, unit: Unit) -> np.ndarray:
+        return self.to(unit).value
+
+    def __len__(self) -> int:
+        return len(self._value)
+
+    def __getitem__(self, key) -> Quantity:
+        return Quantity(self._value[key], self._unit)
+
+    def __neg__(self) -> Quantity:
+        return Quantity(-self._value, self._unit)
+
+    def __add__(self, other: Quantity) -> Quantity:
+        return Quantity(self._value + other.get_value(self._unit), self._unit)
+
+    def __sub__(self, other: Quantity) -> Quantity:
+        return Quantity(self._value - other.get_value(self._unit), self._unit)
+
+    @staticmethod
+    def _check_factor(other):
+        # only plain numbers scale a quantity; the unit of a product is not derived
+        if isinstance(other, Quantity):
+            raise TypeError("Quantities can only be multiplied or divided by numbers or arrays, "
+                            f"not by a Quantity in {other.unit.name}.")
+
+    def __mul__(self, other) -> Quantity:
+        self._check_factor(other)
+        return Quantity(self._value * other, self._unit)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other) -> Quantity:
+        self._check_factor(other)
+        return Quantity(self._value / other, self._unit)
+
+    def __abs__(self) -> Quantity:
+        return Quantity(np.abs(self._value), self._unit)
+
+    def __repr__(self) -> str:
+        return f"Quantity({self._value!r}, {self._unit.name})"
+
+
 class UnitConverter:
     @staticmethod
     def g_to_mm_s2(acceleration_g: float) -> float:
         return acceleration_g * G * 1000
 
+    @staticmethod
+    def to_value(value, unit: Unit):
+        # Quantity は指定した単位の値に変換し、数値はその単位の値とみなしてそのまま返す
+        if isinstance(value, Quantity):
+            if unit is None:
+                raise ValueError(f"Quantity in {value.unit} given where no unit is defined.")
+            return value.get_value(unit)
+        return value
+
 
 class SIPrefix(enum.Enum):
     YOTTA = 24
@@ -47,17 +186,22 @@ class SIPrefix(enum.Enum):
     YOCTO = -24
 
 
+# 10 ** n for every difference of two SI prefixes
+_SI_PREFIX_FACTORS = {
+    a.value - b.value: 10.0 ** (a.value - b.value) for a in SIPrefix for b in SIPrefix}
+
+
 class SIPrefixedValue:
-    def __init__(self, value: float, prefix: SIPrefix):
+    def __init__(self, value: float | np.ndarray, prefix: SIPrefix):
         self._value = value
         self._prefix = prefix
 
     @property
-    def value(self) -> float:
+    def value(self) -> float | np.ndarray:
         return self._value
 
-    def convert_to(self, prefix: SIPrefix) -> float:
-        return self.value * 10 ** (self.prefix.value - prefix.value)
+    def convert_to(self, prefix: SIPrefix) -> float | np.ndarray:
+        return self.value * _SI_PREFIX_FACTORS[self.prefix.value - prefix.value]
 
     @property
     def prefix(self) -> SIPrefix:
@@ -67,27 +211,53 @@ class SIPrefixedValue:
         return f"{self.value} [{self.prefix.name}]"
 
 
+class SymbolTable:
+    """sympy symbols shared by every UnitSymbol, one per name."""
+    __SYMBOLS = {}
+
+    @classmethod
+    def get_symbol(cls, name: str) -> sympy.Symbol:
+        symbol = cls.__SYMBOLS.get(name)
+        if symbol is None:
+            symbol = cls.__SYMBOLS[name] = sympy.Symbol(name)
+        return symbol
+
+
 class UnitSymbol:
-    def __init__(self, name: str | sympy.Symbol, unit: str | sympy.Symbol, value: float | None = None):
-        self._symbol = sympy.Symbol(name) if isinstance(name, str) else name
-        self._unit = sympy.Symbol(unit) if isinstance(unit, str) else unit
-        self._value = value
+    __slots__ = ('_symbol', '_unit', '_value')
+
+    def __init__(self, name: str | sympy.Symbol, unit: str | sympy.Symbol,
+                 value: float | np.ndarray | None = None):
+        # sympy のシンボルは最初に参照されたときに共有テーブルから取得する
+        self._symbol = name
+        self._unit = unit
+        self._value = None if value is None else self._to_value(value)
+
+    @staticmethod
+    def _to_value(value):
+        # lists and tuples are stored as arrays for vectorized calculation
+        return np.asarray(value, dtype=float) if isinstance(value, (list, tuple)) else value
 
     @property
     def unit(self) -> sympy.Symbol:
+        if isinstance(self._unit, str):
+            self._unit = SymbolTable.get_symbol(self._unit)
         return self._unit
 
     @property
     def symbol(self) -> sympy.Symbol:
+        if isinstance(self._symbol, str):
+            self._symbol = SymbolTable.get_symbol(self._symbol)
         return self._symbol
 
     @property
-    def value(self) -> float:
+    def value(self) -> float | np.ndarray | None:
         return self._value
 
     @value.setter
-    def value(self, value: float):
-        if self._value is not None:
-            print(f"Warning: {self._symbol} is already set to {
-                  self._value}. Overwriting with {value}.")
-        self._value = value
+    def value(self, value: float | np.ndarray):
+        self._value = self._to_value(value)
+
+    def copy(self) -> UnitSymbol:
+        # the symbols are shared, only the value is per instance
+        return UnitSymbol(self._symbol, self._unit, self._value)
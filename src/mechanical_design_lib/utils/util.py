@@ -1,23 +1,57 @@
-import sympy
-from IPython.display import display, Latex
+from __future__ import annotations
+
+import functools
+import html
 import os
 import pathlib
 import enum
 import time
+import typing
+
+if typing.TYPE_CHECKING:
+    import sympy
 
 
 PROJECT_ROOT_PATH = pathlib.Path(__file__).parent.parent.parent.parent
 EXEC_DATE_STR = time.strftime("%Y%m%d_%H%M%S")
 
 
+@functools.lru_cache(maxsize=4096)
+def get_latex(expression: sympy.Expr) -> str:
+    # sympy.latex is slow; the symbols and formulas are shared, so their strings are cached
+    import sympy
+
+    return sympy.latex(expression)
+
+
+def get_latex_line(
+        label: str,
+        symbol: sympy.Symbol,
+        unit: sympy.Symbol,
+) -> str:
+    if unit == "":
+        return rf"{label}: $ \ {get_latex(symbol)}$"
+    return rf"{label}: $ \ {get_latex(symbol)} \ [{get_latex(unit)}]$"
+
+
+def get_latex_block(
+        title: str,
+        lines: list[str],  # see get_latex_line
+) -> str:
+    # HTML of one output; the notebook typesets the $...$ of every line at once
+    return "<div>" + "<br>\n".join(html.escape(line, quote=False)
+                                    for line in [title, *lines]) + "</div>"
+
+
 def get_latex_symbol_and_unit(
         label: str,
         symbol: sympy.Symbol,
         unit: sympy.Symbol,
 ):
-    if unit == "":
-        return Latex(rf"{label}: $ \ {sympy.latex(symbol)}$")
-    return Latex(rf"{label}: $ \ {sympy.latex(symbol)} \ [{sympy.latex(unit)}]$")
+    # IPython and sympy are only needed for display
+    from IPython.display import Latex
+
+    return Latex(get_latex_line(label, symbol, unit))
 
 
 def display_latex_symbol_and_unit(
@@ -25,6 +59,8 @@ def display_latex_symbol_and_unit(
         symbol: sympy.Symbol,
         unit: sympy.Symbol,
 ):
+    from IPython.display import display
+
     display(get_latex_symbol_and_unit(label, symbol, unit))
 
 
@@ -37,6 +73,7 @@ class DirectoryFactory:
     class DirectoryName(enum.Enum):
         LOG = "log"
         DATA = "data"
+        FIGURE = "figure"
 
     @classmethod
     def get_directory(cls, name: DirectoryName):
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# ロガーはモジュールの import 時に作成されるため、テストの収集前に設定する
+os.environ.setdefault("MDL_LOG_LEVEL", "WARNING")
+os.environ.setdefault("MDL_DIR_OUTPUT", tempfile.mkdtemp(prefix="mdl_test_"))
@@ -0,0 +1,25 @@
+import copy
+
+import pytest
+
+from mechanical_design_lib.machine.analysis import CriticalPathAnalyzer
+from mechanical_design_lib.utils.flowchart import ElementsCompiler
+
+from test_lowering_cache import build_behavior, set_default_no
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ElementsCompiler.clear_cache()
+
+
+def test_mutated_copy_is_analysed_on_its_own_elements():
+    behavior = build_behavior()
+    assert CriticalPathAnalyzer.analyze(behavior).cycle_time == pytest.approx(15.1)
+
+    copied = copy.deepcopy(behavior)
+    set_default_no(copied)
+    assert CriticalPathAnalyzer.analyze(copied).cycle_time == pytest.approx(16.1)
+    assert copied.get_takt_time() == pytest.approx(16.1)
+    # the original is unchanged and still served from the cache
+    assert CriticalPathAnalyzer.analyze(behavior).cycle_time == pytest.approx(15.1)
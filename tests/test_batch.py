@@ -0,0 +1,45 @@
+import copy
+
+import pytest
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.machine.batch import BatchEvaluator
+from mechanical_design_lib.machine.machine import (
+    Machine, MachineUnit, BehaviorSummary, BehaviorDetailAction, BehaviorReference)
+
+from test_lowering_cache import build_behavior, set_default_no
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    flowchart.ElementsCompiler.clear_cache()
+
+
+def build_machine() -> Machine:
+    # B/cycle starts after the last action of A/cycle
+    behavior = build_behavior()
+    last_action = [element for element in flowchart.ElementIterator(behavior.subroutine_root_element)
+                   if element.label.startswith("b")][0]
+    root = flowchart.Root("Start")
+    flowchart.Root("End").add_from(BehaviorDetailAction("c", takt_time=1.0).add_from(root))
+
+    machine = Machine()
+    machine.add_unit(MachineUnit("A").add_behavior("cycle", behavior))
+    machine.add_unit(MachineUnit("B").add_behavior(
+        "cycle", BehaviorSummary("cycle", root_element=root, is_parse_subroutine=True)))
+    machine.add_dependency(BehaviorReference("A", "cycle", last_action),
+                           BehaviorReference("B", "cycle"))
+    return machine
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_batch_over_deep_copied_variants(max_workers):
+    machine = build_machine()
+    variants = {f"v{i}": copy.deepcopy(machine)
+                for i in range(BatchEvaluator.MIN_PARALLEL_VARIANTS)}
+    set_default_no(variants["v1"].get_unit("A").get_behavior("cycle"))
+
+    table = BatchEvaluator.evaluate(variants, max_workers)
+    cycle_times = dict(zip(table["variant"].tolist(), table["cycle_time"].tolist()))
+    assert cycle_times["v0"] == pytest.approx(16.1)
+    assert cycle_times["v1"] == pytest.approx(17.1)
@@ -0,0 +1,26 @@
+import os
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.machine.machine import (
+    Machine, MachineUnit, BehaviorSummary, BehaviorDetailAction)
+
+
+def build_behavior(label: str) -> BehaviorSummary:
+    root = flowchart.Root("Start")
+    action = BehaviorDetailAction(label, takt_time=1.0).add_from(root)
+    flowchart.Root("End").add_from(action)
+    return BehaviorSummary(label, root_element=root, is_parse_subroutine=True)
+
+
+def test_unit_and_behavior_names_do_not_collide(tmp_path, monkeypatch):
+    # Graphviz は不要: 出力先のファイル名だけを確認する
+    monkeypatch.setattr(flowchart.Flowchart, "_render",
+                        staticmethod(lambda source, filename, view, format: filename))
+    machine = Machine()
+    machine.add_unit(MachineUnit("a_b").add_behavior("c", build_behavior("first")))
+    machine.add_unit(MachineUnit("a").add_behavior("b_c", build_behavior("second")))
+
+    filenames = machine.draw_behaviors(tmp_path)
+    assert sorted(filenames) == sorted([os.path.join(tmp_path, "a_b", "c"),
+                                        os.path.join(tmp_path, "a", "b_c")])
+    assert all(os.path.isdir(os.path.dirname(filename)) for filename in filenames)
@@ -0,0 +1,48 @@
+import pytest
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.machine.analysis import CriticalPathAnalyzer
+from mechanical_design_lib.machine.machine import (
+    BehaviorSummary, BehaviorDetailAction, BehaviorDecision)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    flowchart.ElementsCompiler.clear_cache()
+
+
+def build_branch_terminals() -> flowchart.Root:
+    # a (1 s) -> decision: yes y (5 s) -> End (OK) / no n (6 s) -> End (NG)
+    root = flowchart.Root("Start")
+    a = BehaviorDetailAction("a", takt_time=1.0).add_from(root)
+    decision = BehaviorDecision("ok?", default_yes=True).add_from(a)
+    yes = BehaviorDetailAction("y", takt_time=5.0)
+    flowchart.Root("End (OK)").add_from(yes)
+    no = BehaviorDetailAction("n", takt_time=6.0)
+    flowchart.Root("End (NG)").add_from(no)
+    decision.add_yes(yes)
+    decision.add_no(no)
+    return root
+
+
+def test_branches_may_end_in_their_own_terminals():
+    root = build_branch_terminals()
+    graph = flowchart.ElementsCompiler.lower(root)
+    assert flowchart.FlowchartValidator.validate(graph) == []
+    assert "End (NG)" in flowchart.Flowchart(root).get_source()
+
+    behavior = BehaviorSummary("cycle", root_element=root, is_parse_subroutine=True)
+    assert CriticalPathAnalyzer.analyze(behavior).cycle_time == pytest.approx(6.0)
+
+
+def test_subroutine_ending_in_two_places_is_reported():
+    subroutine = flowchart.Subroutine(
+        "sub", subroutine_root_element=build_branch_terminals(), is_parse_subroutine=True)
+    root = flowchart.Root("Start")
+    subroutine.add_from(root)
+    flowchart.Root("End").add_from(subroutine)
+
+    with pytest.raises(flowchart.FlowchartValidationError) as error:
+        flowchart.ElementsCompiler.lower(root)
+    assert [(issue.kind, issue.label) for issue in error.value.issues] \
+        == [(flowchart.IssueKind.MULTIPLE_EXITS, "End (NG)")]
@@ -0,0 +1,62 @@
+import copy
+
+import pytest
+
+import mechanical_design_lib.utils.flowchart as flowchart
+from mechanical_design_lib.machine.machine import (
+    BehaviorSummary, BehaviorDetailAction, BehaviorDecision)
+
+
+def build_behavior() -> BehaviorSummary:
+    # a (0.1 s) -> decision: yes y (5 s) / no n (6 s) -> b (10 s)
+    root = flowchart.Root("Start")
+    a = BehaviorDetailAction("a", takt_time=0.1).add_from(root)
+    decision = BehaviorDecision("ok?", default_yes=True).add_from(a)
+    decision.add_yes(BehaviorDetailAction("y", takt_time=5.0))
+    decision.add_no(BehaviorDetailAction("n", takt_time=6.0))
+    b = BehaviorDetailAction("b", takt_time=10.0).add_from(decision)
+    flowchart.Root("End").add_from(b)
+    return BehaviorSummary("cycle", root_element=root, is_parse_subroutine=True)
+
+
+def set_default_no(behavior: BehaviorSummary):
+    for element in flowchart.ElementIterator(behavior.subroutine_root_element):
+        if isinstance(element, BehaviorDecision):
+            element._default_yes = False
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    flowchart.ElementsCompiler.clear_cache()
+
+
+def test_copies_get_fresh_ids():
+    root = build_behavior().subroutine_root_element
+    copied = copy.deepcopy(root)
+    assert copied.id != root.id
+    assert copy.copy(root).id != root.id
+    assert flowchart.ElementsCompiler.fingerprint(copied) \
+        != flowchart.ElementsCompiler.fingerprint(root)
+
+
+def test_lowered_copy_refers_to_its_own_elements():
+    behavior = build_behavior()
+    copied = copy.deepcopy(behavior)
+    original_graph = flowchart.ElementsCompiler.lower(behavior.subroutine_root_element)
+    copied_graph = flowchart.ElementsCompiler.lower(copied.subroutine_root_element)
+
+    copied_elements = set(flowchart.ElementIterator(copied.subroutine_root_element))
+    original_elements = set(flowchart.ElementIterator(behavior.subroutine_root_element))
+    for node in range(copied_graph.num_nodes):
+        assert copied_graph.get_source(node) not in original_elements
+    assert any(copied_graph.get_source(node) in copied_elements
+               for node in range(copied_graph.num_nodes))
+    assert original_graph.get_source(original_graph.root) \
+        is behavior.subroutine_root_element
+
+
+def test_default_branch_is_part_of_the_fingerprint():
+    behavior = build_behavior()
+    before = flowchart.ElementsCompiler.fingerprint(behavior.subroutine_root_element)
+    set_default_no(behavior)
+    assert flowchart.ElementsCompiler.fingerprint(behavior.subroutine_root_element) != before